@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import threading
+from datetime import date, datetime, time
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+
+from core.constants import SLOT_CAPACITY, SLOT_CAPACITY_OVERRIDES, SLOT_REFRESH_INTERVAL
+from core.sessions import as_date
+
+logger = logging.getLogger(__name__)
+
+
+class SlotAvailability:
+    """
+    Salon-wide bookings per day and time slot.
+
+    Each day is an array of booking counts, one entry per slot, compared with
+    a capacity array (e.g. the number of masters working that slot). Reserve
+    and release are O(1) and atomic; the free slots of a day are computed in
+    one vectorized comparison. `version` changes whenever a count does;
+    `day_version` only when a count of that day does.
+    """
+
+    def __init__(self, time_slots: List[str],
+                 capacity: Union[int, Dict[str, int]] = SLOT_CAPACITY,
+                 overrides: Optional[Dict[str, int]] = None):
+        """
+        Args:
+            time_slots: Slot start times as "HH:MM" strings
+            capacity: Bookings allowed per slot, or a {"HH:MM": capacity} mapping
+            overrides: Per-slot capacities that replace the default
+        """
+        self.time_slots = list(time_slots)
+        self.slot_times = [time.fromisoformat(slot) for slot in self.time_slots]
+        self._index = {t: i for i, t in enumerate(self.slot_times)}
+        self._minutes = np.array([t.hour * 60 + t.minute for t in self.slot_times], dtype=np.int32)
+
+        if isinstance(capacity, dict):
+            per_slot = [capacity.get(slot, 0) for slot in self.time_slots]
+        else:
+            per_slot = [capacity] * len(self.time_slots)
+        overrides = SLOT_CAPACITY_OVERRIDES if overrides is None else overrides
+        for slot, value in overrides.items():
+            if slot in self.time_slots:
+                per_slot[self.time_slots.index(slot)] = value
+        self.capacity = np.array(per_slot, dtype=np.int32)
+
+        self._days: Dict[date, np.ndarray] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+        # Value of `version` when each day last changed, and when everything was recounted
+        self._changed: Dict[date, int] = {}
+        self._rebuilt = 0
+
+    def _touch(self, day: date):
+        self.version += 1
+        self._changed[day] = self.version
+
+    def day_version(self, day) -> int:
+        """Changes exactly when the free slots of `day` may have changed."""
+        return self._changed.get(as_date(day), self._rebuilt)
+
+    def _counts(self, day: date) -> np.ndarray:
+        counts = self._days.get(day)
+        if counts is None:
+            counts = self._days[day] = np.zeros(len(self.slot_times), dtype=np.int32)
+        return counts
+
+    def rebuild(self, appointments: Iterable, since: Optional[date] = None):
+        """Recount every slot from existing appointments, skipping days before `since`."""
+        with self._lock:
+            self._days = {}
+            skipped = 0
+            for appointment in appointments:
+                index = self._index.get(appointment.time)
+                if index is None or (since and appointment.date < since):
+                    skipped += 1
+                    continue
+                self._counts(appointment.date)[index] += 1
+            self.version += 1
+            self._changed = {}
+            self._rebuilt = self.version
+        logger.info(f"Slot availability rebuilt for {len(self._days)} days ({skipped} appointments skipped).")
+
+    def try_reserve(self, day, slot: time) -> bool:
+        """Take one place in the slot if it has room. Returns False if it is full."""
+        day = as_date(day)
+        index = self._index.get(slot)
+        if index is None:
+            return False
+        with self._lock:
+            counts = self._counts(day)
+            if counts[index] >= self.capacity[index]:
+                return False
+            counts[index] += 1
+            self._touch(day)
+            return True
+
+    def release(self, day, slot: time):
+        day = as_date(day)
+        index = self._index.get(slot)
+        if index is None:
+            return
+        with self._lock:
+            counts = self._days.get(day)
+            if counts is not None and counts[index] > 0:
+                counts[index] -= 1
+                self._touch(day)
+
+    async def atry_reserve(self, day, slot: time) -> bool:
+        """try_reserve for the event loop."""
+        return self.try_reserve(day, slot)
+
+    async def arelease(self, day, slot: time):
+        """release for the event loop."""
+        self.release(day, slot)
+
+    def stale(self, day) -> bool:
+        """Whether the counts of `day` should be read again before they are shown. Local ones never are."""
+        return False
+
+    async def arefresh(self, day):
+        """Read the counts of `day` again. Local ones are always current."""
+
+    def is_free(self, day, slot: time) -> bool:
+        index = self._index.get(slot)
+        if index is None:
+            return False
+        counts = self._days.get(as_date(day))
+        return counts is None or counts[index] < self.capacity[index]
+
+    def free_slots(self, day, after: Optional[time] = None) -> List[str]:
+        """The "HH:MM" slots of a day that still have room, optionally only those starting after `after`."""
+        counts = self._days.get(as_date(day))
+        mask = self.capacity > 0 if counts is None else counts < self.capacity
+        if after is not None:
+            mask &= self._minutes > after.hour * 60 + after.minute
+        return [self.time_slots[i] for i in np.flatnonzero(mask)]
+
+    def prune(self, before: date):
+        """Forget days that are over."""
+        with self._lock:
+            for day in [d for d in self._days if d < before]:
+                del self._days[day]
+                self._changed.pop(day, None)
+
+
+class SharedSlotAvailability(SlotAvailability):
+    """
+    SlotAvailability for several worker processes sharing one SQLite store.
+
+    The counts live in the store's slot_bookings table: reserving is a
+    compare-and-set there, so two workers can never confirm the same place.
+    The local arrays are only a cache of it, read again after every
+    reservation or release and when a day is shown more than
+    `refresh_interval` seconds after its last read. Lookups never touch
+    the store; on the event loop, use the `a`-prefixed methods, which run
+    the store calls in a thread.
+    """
+
+    def __init__(self, store, time_slots: List[str],
+                 capacity: Union[int, Dict[str, int]] = SLOT_CAPACITY,
+                 overrides: Optional[Dict[str, int]] = None,
+                 refresh_interval: float = SLOT_REFRESH_INTERVAL):
+        super().__init__(time_slots, capacity, overrides)
+        self.store = store
+        self.refresh_interval = refresh_interval
+        # monotonic() of each day's last read from the store
+        self._read_at: Dict[date, float] = {}
+
+    @staticmethod
+    def _keys(day: date, slot: time):
+        # Same strings as the appointments table
+        return datetime.combine(day, time.min).isoformat(), slot.isoformat(timespec="seconds")
+
+    def _refresh(self, day: date):
+        counts = np.zeros(len(self.slot_times), dtype=np.int32)
+        for slot, booked in self.store.slot_bookings(self._keys(day, time.min)[0]).items():
+            index = self._index.get(time.fromisoformat(slot))
+            if index is not None:
+                counts[index] = booked
+        with self._lock:
+            self._read_at[day] = monotonic()
+            cached = self._days.get(day)
+            if cached is None or not np.array_equal(cached, counts):
+                self._days[day] = counts
+                self._touch(day)
+
+    def rebuild(self, appointments: Iterable, since: Optional[date] = None):
+        """The coordinator counts the shared table from all workers' appointments; just drop the cache."""
+        with self._lock:
+            self._days = {}
+            self._read_at = {}
+            self.version += 1
+            self._changed = {}
+            self._rebuilt = self.version
+
+    def stale(self, day) -> bool:
+        # Other workers may have booked since the last read
+        read_at = self._read_at.get(as_date(day))
+        return read_at is None or monotonic() - read_at >= self.refresh_interval
+
+    async def arefresh(self, day):
+        await asyncio.to_thread(self._refresh, as_date(day))
+
+    def try_reserve(self, day, slot: time) -> bool:
+        day = as_date(day)
+        index = self._index.get(slot)
+        if index is None:
+            return False
+        reserved = self.store.reserve_slot(*self._keys(day, slot), int(self.capacity[index]))
+        self._refresh(day)
+        return reserved
+
+    def release(self, day, slot: time):
+        day = as_date(day)
+        if slot not in self._index:
+            return
+        self.store.release_slot(*self._keys(day, slot))
+        self._refresh(day)
+
+    async def atry_reserve(self, day, slot: time) -> bool:
+        # The store may wait for another worker's write; keep the loop free meanwhile
+        return await asyncio.to_thread(self.try_reserve, day, slot)
+
+    async def arelease(self, day, slot: time):
+        await asyncio.to_thread(self.release, day, slot)
+
+    def prune(self, before: date):
+        super().prune(before)
+        with self._lock:
+            for day in [d for d in self._read_at if d < before]:
+                del self._read_at[day]
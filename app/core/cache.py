@@ -0,0 +1,69 @@
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from core.constants import RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL
+
+_WHITESPACE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION = " ?!.,;:…"
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of LLM responses.
+
+    Keys are the normalized message text, the client's language and a hash of
+    the services catalog, so a catalog change never serves stale prices.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Dict]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Lowercase, collapse whitespace and drop trailing punctuation."""
+        return _WHITESPACE.sub(" ", text.lower()).strip(_TRAILING_PUNCTUATION)
+
+    def get(self, text: str, language: str, catalog_hash: str) -> Optional[Dict]:
+        key = (self.normalize(text), language, catalog_hash)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, response = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(response)
+
+    def set(self, text: str, language: str, catalog_hash: str, response: Dict):
+        key = (self.normalize(text), language, catalog_hash)
+        self._entries[key] = (time.monotonic() + self.ttl, dict(response))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import re
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SERVICES = [
+    {"id": "1", "category": "Manicure", "name": "Gel polish removal (with membership card)", "name_ru": "Снятие гель-лака (с клубной картой)", "price_from": "133 P"},
+    {"id": "2", "category": "Manicure", "name": "Gel polish removal (without membership card)", "name_ru": "Снятие гель-лака (без клубной карты)", "price_from": "400 P"},
+    {"id": "3", "category": "Manicure", "name": "Manicure (with membership card)", "name_ru": "Маникюр (с клубной картой)", "price_from": "733 P"},
+    {"id": "4", "category": "Manicure", "name": "Manicure (without membership card)", "name_ru": "Маникюр (без клубной карты)", "price_from": "1,100 P"},
+    {"id": "5", "category": "Manicure", "name": "Gel polish application (hands, with membership card)", "name_ru": "Покрытие гель-лаком (руки, с клубной картой)", "price_from": "800 P"},
+    {"id": "6", "category": "Manicure", "name": "Gel polish application (hands, without membership card)", "name_ru": "Покрытие гель-лаком (руки, без клубной карты)", "price_from": "1,200 P"},
+    {"id": "7", "category": "Manicure", "name": "Gel application", "name_ru": "Покрытие гелем", "price_from": "1,700 P"},
+    {"id": "8", "category": "Manicure", "name": "Nail polish application (hands)", "name_ru": "Покрытие лаком (руки)", "price_from": "500 P"},
+    {"id": "9", "category": "Manicure", "name": "Nail polish removal (hands)", "name_ru": "Снятие лака (руки)", "price_from": "50 P"},
+    {"id": "10", "category": "Manicure", "name": "Children's manicure + regular polish application", "name_ru": "Детский маникюр + покрытие обычным лаком", "price_from": "1,500 P"},
+    {"id": "11", "category": "Manicure", "name": "One-hour manicure", "name_ru": "Маникюр за час", "price_from": "2,600 P"},
+    {"id": "12", "category": "Manicure", "name": "Men's manicure", "name_ru": "Мужской маникюр", "price_from": "1,200 P"},
+    {"id": "13", "category": "Design", "name": "Design 500", "name_ru": "Дизайн 500", "price_from": "500 P"},
+    {"id": "14", "category": "Design", "name": "Design 1000", "name_ru": "Дизайн 1000", "price_from": "1,000 P"},
+    {"id": "15", "category": "Design", "name": "Design 300", "name_ru": "Дизайн 300", "price_from": "300 P"},
+    {"id": "16", "category": "Design", "name": "Artistic painting", "name_ru": "Художественная роспись", "price_from": "150 P"},
+]
+
+_NUMBER = re.compile(r"\d[\d,\s]*")
+
+
+def normalize_name(name: str) -> str:
+    return " ".join(name.lower().split())
+
+
+def parse_price(price: str) -> Optional[int]:
+    """Parse a display price such as "1,100 P" into 1100."""
+    match = _NUMBER.search(price or "")
+    if not match:
+        return None
+    return int(re.sub(r"[,\s]", "", match.group()))
+
+
+class ServiceCatalog:
+    """
+    Salon services with dictionary indexes by name, id and category.
+
+    Everything derived from the list (indexes, parsed prices, the rendered
+    services and price menus per language) is computed once on load, so
+    lookups and menu rendering do not depend on the size of the catalog.
+    `version` is bumped on every reload.
+    """
+
+    languages = ("en", "ru")
+
+    def __init__(self, services: List[Dict]):
+        self.version = 0
+        self.reload(services)
+
+    @classmethod
+    def from_file(cls, path: str) -> 'ServiceCatalog':
+        with open(path, 'r', encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def reload_from_file(self, path: str):
+        with open(path, 'r', encoding="utf-8") as f:
+            self.reload(json.load(f))
+
+    def reload(self, services: List[Dict]):
+        entries = []
+        for index, service in enumerate(services):
+            entry = dict(service)
+            entry.setdefault("id", str(index + 1))
+            entry["id"] = str(entry["id"])
+            entry["price"] = parse_price(entry.get("price_from", ""))
+            entries.append(entry)
+
+        by_name: Dict[str, Dict] = {}
+        by_id: Dict[str, Dict] = {}
+        by_category: Dict[str, List[Dict]] = {}
+        for entry in entries:
+            by_id[entry["id"]] = entry
+            by_category.setdefault(entry["category"], []).append(entry)
+            by_name.setdefault(normalize_name(entry["name"]), entry)
+            if entry.get("name_ru"):
+                by_name.setdefault(normalize_name(entry["name_ru"]), entry)
+
+        self.services = entries
+        self._names = [entry["name"] for entry in entries]
+        self._by_name = by_name
+        self._by_id = by_id
+        self._by_category = by_category
+        self.hash = hashlib.sha1(
+            json.dumps(services, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+        self._render()
+        self.version += 1
+        logger.info(f"Service catalog loaded: {len(entries)} services, version {self.version}.")
+
+    def _render(self):
+        self._services_text = {}
+        self._prices_text = {}
+        for language in self.languages:
+            names = [self.display_name(entry, language) for entry in self.services]
+            self._services_text[language] = "\n".join(f"- {name}" for name in names)
+            self._prices_text[language] = "\n".join(
+                f"{name}: {entry['price_from']}" for name, entry in zip(names, self.services)
+            )
+
+    def __len__(self) -> int:
+        return len(self.services)
+
+    @staticmethod
+    def display_name(service: Dict, language: str = "en") -> str:
+        if language == "ru" and service.get("name_ru"):
+            return service["name_ru"]
+        return service["name"].title()
+
+    def get(self, name: str) -> Optional[Dict]:
+        """Look up a service by its English or Russian name, case-insensitively."""
+        return self._by_name.get(normalize_name(name))
+
+    def get_by_id(self, service_id: str) -> Optional[Dict]:
+        return self._by_id.get(str(service_id))
+
+    def by_category(self, category: str) -> List[Dict]:
+        return self._by_category.get(category, [])
+
+    def categories(self) -> List[str]:
+        return list(self._by_category)
+
+    def names(self) -> List[str]:
+        return list(self._names)
+
+    def services_text(self, language: str = "en") -> str:
+        return self._services_text.get(language, self._services_text["en"])
+
+    def prices_text(self, language: str = "en") -> str:
+        return self._prices_text.get(language, self._prices_text["en"])
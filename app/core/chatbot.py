@@ -1,161 +1,370 @@
-from typing import Dict, List
-# from langchain.chains import ConversationChain
-from langchain import memory
-from langchain.chains.llm import LLMChain
-# from langchain.chat_models import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.memory import ConversationBufferMemory
-from langchain.prompts import PromptTemplate
-from langchain.prompts.chat import (
-    ChatPromptTemplate,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    MessagesPlaceholder
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from core.cache import ResponseCache
+from core.catalog import DEFAULT_SERVICES, ServiceCatalog
+from core.coalescing import MicroBatcher, SingleFlight
+from core.constants import (
+    LLM_BATCH_MAX, LLM_BATCH_WINDOW, LLM_COALESCE, LLM_MAX_CONCURRENCY,
+    LLM_MAX_CONCURRENCY_PER_USER, MEMORY_MODE, SERVICES_FILE
 )
+from core.matcher import ServiceMatcher
+from core.memory import SummarizingMemoryStore, UserMemoryStore, estimate_tokens
+from core.metrics import LLM_BATCH_SIZE, LLM_CALLS_SAVED, LLM_SECONDS, LLM_TOKENS
+from core.prompt import PromptBuilder
+from core.semantic_cache import SemanticCache, question_signature
+
+logger = logging.getLogger(__name__)
 
 class BeautyServiceBot:
-    def __init__(self, api_key: str):
-        self.llm = ChatGoogleGenerativeAI(
-            api_key=api_key,
-            model="gemini-1.5-pro"
+    """
+    Anna's LLM side: prompt, per-user memory, caches and the Gemini chain.
+
+    The LLM stack (langchain and the Gemini client) takes seconds to import,
+    so it is loaded on first use, or ahead of time with `warm_up`/`awarm_up`;
+    everything else, such as the catalog, is available right away.
+    """
+
+    def __init__(self, api_key: str,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 max_concurrency_per_user: int = LLM_MAX_CONCURRENCY_PER_USER,
+                 coalesce: bool = LLM_COALESCE,
+                 batch_window: float = LLM_BATCH_WINDOW,
+                 batch_max: int = LLM_BATCH_MAX,
+                 memory_mode: str = MEMORY_MODE):
+        self.api_key = api_key
+        self._llm = None
+        self._conversation = None
+        self._warm_lock = threading.Lock()
+        self.response_cache = ResponseCache()
+        # Reads self.matcher when called, so it follows catalog reloads
+        self.semantic_cache = SemanticCache(signature=lambda text: question_signature(text, self.matcher))
+
+        self.catalog = (
+            ServiceCatalog.from_file(SERVICES_FILE) if SERVICES_FILE
+            else ServiceCatalog(DEFAULT_SERVICES)
         )
-    
-
-        self.services = [
-            {"category": "Manicure", "name": "Gel polish removal (with membership card)", "price_from": "133 P"},
-            {"category": "Manicure", "name": "Gel polish removal (without membership card)", "price_from": "400 P"},
-            {"category": "Manicure", "name": "Manicure (with membership card)", "price_from": "733 P"},
-            {"category": "Manicure", "name": "Manicure (without membership card)", "price_from": "1,100 P"},
-            {"category": "Manicure", "name": "Gel polish application (hands, with membership card)", "price_from": "800 P"},
-            {"category": "Manicure", "name": "Gel polish application (hands, without membership card)", "price_from": "1,200 P"},
-            {"category": "Manicure", "name": "Gel application", "price_from": "1,700 P"},
-            {"category": "Manicure", "name": "Nail polish application (hands)", "price_from": "500 P"},
-            {"category": "Manicure", "name": "Nail polish removal (hands)", "price_from": "50 P"},
-            {"category": "Manicure", "name": "Children's manicure + regular polish application", "price_from": "1,500 P"},
-            {"category": "Manicure", "name": "One-hour manicure", "price_from": "2,600 P"},
-            {"category": "Manicure", "name": "Men's manicure", "price_from": "1,200 P"},
-            {"category": "Design", "name": "Design 500", "price_from": "500 P"},
-            {"category": "Design", "name": "Design 1000", "price_from": "1,000 P"},
-            {"category": "Design", "name": "Design 300", "price_from": "300 P"},
-            {"category": "Design", "name": "Artistic painting", "price_from": "150 P"},
-        ]
+        self._catalog_version = self.catalog.version
+        self.matcher = ServiceMatcher.from_catalog(self.catalog)
         
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True
-        )
+        if memory_mode == "summary":
+            # Older turns are folded into a summary by the LLM, in the background
+            self.memory = SummarizingMemoryStore(self._summarize)
+        elif memory_mode == "buffer":
+            self.memory = UserMemoryStore()
+        else:
+            raise ValueError(f"Unknown memory mode: {memory_mode}")
         
+        # Limits for the async path: one slow user must not take every slot
+        self.max_concurrency_per_user = max_concurrency_per_user
+        self._llm_semaphore = asyncio.Semaphore(max_concurrency)
+        self._user_semaphores: Dict[int, asyncio.Semaphore] = {}
+        self._user_waiters: Dict[int, int] = defaultdict(int)
+
+        # Spikes of the same first question share one call; distinct ones may be batched
+        self.coalesce = coalesce
+        self._single_flight = SingleFlight()
+        self._batcher = MicroBatcher(self._abatch_llm, batch_window, batch_max) if batch_window > 0 else None
+
         self._initialize_prompt_template()
         self._setup_conversation_chain()
 
     def _initialize_prompt_template(self):
-        system_template = """You are Anna, a charismatic and confident beauty salon owner. Your personality traits:
-
-        - Sociable, confident, and charismatic
-        - Use natural, slightly informal language with occasional humor
-        - Focus on helping clients enhance their beauty
-        - Passionate about beauty industry and artistry
-        - Skilled at engaging clients and selling services
-
-        Guidelines for interaction:
-        - Communicate in both Russian and English (match the client's language)
-        - Share relevant experiences and propose beauty solutions
-        - Ask leading sales questions to guide the conversation
-        - Redirect off-topic discussions back to beauty services
-        - Adapt communication style based on client's gender (identified through names)
-        - Maintain professional yet friendly tone
-        - Avoid excessive punctuation and emojis
-
-        Available services: {services}
-
-        Current conversation history: {chat_history}
-        Human: {input}
-        Assistant: Let's respond appropriately to help the client..."""
-
-        self.prompt = ChatPromptTemplate.from_messages([
-            SystemMessagePromptTemplate.from_template(system_template),
-            MessagesPlaceholder(variable_name="chat_history"),
-            HumanMessagePromptTemplate.from_template("{input}")
-        ])
+        self.prompt_builder = PromptBuilder(self.catalog)
 
     def _setup_conversation_chain(self):
-        self.conversation = self.prompt | self.llm
+        # Built again from the current prompt and LLM on next use
+        self._conversation = None
+
+    def warm_up(self):
+        """Import the LLM stack and build the chain. Runs once; safe to call from any thread."""
+        with self._warm_lock:
+            if self._conversation is not None:
+                return
+            started = time.perf_counter()
+            if self._llm is None:
+                from langchain_google_genai import ChatGoogleGenerativeAI
+
+                self._llm = ChatGoogleGenerativeAI(
+                    api_key=self.api_key,
+                    model="gemini-1.5-pro"
+                )
+            self._conversation = self.prompt | self._llm
+            logger.info(f"LLM chain ready in {time.perf_counter() - started:.2f}s.")
+
+    async def awarm_up(self):
+        """warm_up in a worker thread, so the event loop keeps serving updates meanwhile."""
+        if self._conversation is None:
+            await asyncio.to_thread(self.warm_up)
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            self.warm_up()
+        return self._llm
+
+    @llm.setter
+    def llm(self, llm):
+        self._llm = llm
+        self._setup_conversation_chain()
+
+    @property
+    def prompt(self):
+        return self.prompt_builder.prompt
+
+    @property
+    def conversation(self):
+        if self._conversation is None:
+            self.warm_up()
+        return self._conversation
+
+    @property
+    def services(self) -> List[Dict]:
+        return self.catalog.services
+
+    @services.setter
+    def services(self, services: List[Dict]):
+        self.catalog.reload(services)
+
+    @property
+    def services_hash(self) -> str:
+        return self.catalog.hash
+
+    def reload_services(self, path: Optional[str] = None):
+        """Reload the catalog, from `path` or the configured services file."""
+        path = path or SERVICES_FILE
+        if path:
+            self.catalog.reload_from_file(path)
+        else:
+            self.catalog.reload(DEFAULT_SERVICES)
+
+    def _sync_catalog(self):
+        """Rebuild what is derived from the catalog after it was reloaded."""
+        if self._catalog_version != self.catalog.version:
+            self.response_cache.clear()
+            self.semantic_cache.clear()
+            self.matcher = ServiceMatcher.from_catalog(self.catalog)
+            if self.prompt_builder.refresh():
+                self._setup_conversation_chain()
+            self._catalog_version = self.catalog.version
 
     def get_service_info(self, service_name: str) -> Dict:
         """Retrieve information about a specific service by its name."""
-        service_name_lower = service_name.lower()
-        for service in self.services:
-            if service["name"].lower() == service_name_lower:
-                return service
-        return None
+        return self.catalog.get(service_name)
 
     def list_services(self) -> List[str]:
         """Return a list of all available service names."""
-        return [service["name"] for service in self.services]
+        return self.catalog.names()
 
+    def _build_inputs(self, message: str, user_id: Optional[int]) -> Tuple[Dict, int]:
+        summary = self.memory.summary(user_id)
+        history, prompt_tokens = self.prompt_builder.fit_history(message, self.memory.load(user_id), summary)
+        inputs = {
+            "system": [self.prompt_builder.system_message(summary)],
+            "chat_history": history,
+            "input": message,
+        }
+        return inputs, prompt_tokens
 
-    # def process_message(self, message: str, language: str = "en") -> str:
-    #     """
-    #     Process incoming message and generate response.
-        
-    #     Args:
-    #         message (str): The incoming message from the client
-    #         language (str): Preferred language code ("en" for English, "ru" for Russian)
-            
-    #     Returns:
-    #         str: Response message
-    #     """
-    #     # Load the chat history from memory
-    #     history_context = self.memory.load_memory_variables({})
-
-    #     # Prepare the input to the pipeline
-    #     # We must provide "services", "input", and "chat_history" as required by the prompt.
-    #     try:
-    #         response_message = self.conversation.invoke({
-    #             "input": message,
-    #             "services": self.services,
-    #             "chat_history": history_context["chat_history"]
-    #         })
-
-    #         # response_message is a BaseMessage. Get the content:
-    #         response_text = response_message.content
-            
-    #         # Save the turn to memory
-    #         self.memory.save_context({"input": message}, {"output": response_text})
-
-    #         return response_text
-    #     except Exception as e:
-    #         return f"I apologize, but I encountered an error. Please try again. Error: {str(e)}"
-
-    def process_message(self, message: str, language: str = "en") -> Dict:
-        history_context = self.memory.load_memory_variables({})
-        response = {"text": "", "action": None}
+    async def _summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        """Fold conversation turns into the client's summary; used by SummarizingMemoryStore."""
+        messages = self.prompt_builder.summary_request(summary, turns, self.memory.summary_max_tokens)
+        prompt_tokens = sum(estimate_tokens(m.content) for m in messages)
+        await self.awarm_up()
+        # A global slot like any other call, so summaries never exceed the upstream limit
+        async with self._llm_semaphore:
+            started = time.perf_counter()
+            try:
+                response_message = await self.llm.ainvoke(messages)
+            except Exception:
+                self._record_llm_call(started, prompt_tokens, None, None)
+                raise
+        self._record_llm_call(started, prompt_tokens, response_message.content,
+                              response_message.usage_metadata)
+        return response_message.content
+
+    def _first_turn(self, user_id: Optional[int]) -> bool:
+        """No history and no summary yet, so the reply depends only on the catalog and the message."""
+        return not self.memory.load(user_id) and not self.memory.summary(user_id)
+
+    def _cached_response(self, message: str, language: str, user_id: Optional[int],
+                         first_turn: bool) -> Optional[Dict]:
+        self._sync_catalog()
+        if not first_turn:
+            # The reply may build on what this user said before, so it is nobody else's
+            return None
+        response = self.response_cache.get(message, language, self.services_hash)
+        if response is None:
+            # Fall back to a paraphrase of an already answered question
+            response = self.semantic_cache.get(message, language)
+        if response is not None:
+            response["prompt_tokens"] = 0
+            self.memory.save(user_id, message, response["text"])
+        return response
+
+    def _cache_response(self, message: str, language: str, response: Dict, first_turn: bool):
+        if not first_turn:
+            return
+        self.response_cache.set(message, language, self.services_hash, response)
+        self.semantic_cache.set(message, language, response)
+
+    def _build_response(self, message: str, response_text: str, user_id: Optional[int],
+                        prompt_tokens: int) -> Dict:
+        response = {"text": response_text, "action": None, "prompt_tokens": prompt_tokens}
+        logger.info(f"LLM request for user {user_id}: ~{prompt_tokens} prompt tokens.")
+        self.memory.save(user_id, message, response_text)
+
+        # Check if a service recommendation exists in the response
+        match = self.matcher.first(response_text)
+        if match:
+            response["action"] = {
+                "type": "book",
+                "service": match.service
+            }
+        return response
+
+    @staticmethod
+    def _record_llm_call(started: float, prompt_tokens: int, text: Optional[str],
+                         usage: Optional[Dict]):
+        """Latency and token counts of one LLM call; text is None if it failed."""
+        LLM_SECONDS.observe(time.perf_counter() - started, "ok" if text is not None else "error")
+        if text is None:
+            return
+        # Gemini reports usage; the estimates are a fallback for models that do not
+        LLM_TOKENS.inc("input", amount=usage["input_tokens"] if usage else prompt_tokens)
+        LLM_TOKENS.inc("output", amount=usage["output_tokens"] if usage else estimate_tokens(text))
+
+    def process_message(self, message: str, language: str = "en",
+                        user_id: Optional[int] = None) -> Dict:
+        first_turn = self._first_turn(user_id)
+        cached = self._cached_response(message, language, user_id, first_turn)
+        if cached is not None:
+            return cached
+        try:
+            inputs, prompt_tokens = self._build_inputs(message, user_id)
+            started = time.perf_counter()
+            try:
+                response_message = self.conversation.invoke(inputs)
+            except Exception:
+                self._record_llm_call(started, prompt_tokens, None, None)
+                raise
+            self._record_llm_call(started, prompt_tokens, response_message.content,
+                                  response_message.usage_metadata)
+            response = self._build_response(message, response_message.content, user_id, prompt_tokens)
+        except Exception as e:
+            return {"text": f"Error: {str(e)}", "action": None}
+        self._cache_response(message, language, response, first_turn)
+        return response
+
+    @asynccontextmanager
+    async def _llm_slot(self, user_id: Optional[int]):
+        """Hold one per-user slot and one global slot for the duration of an LLM call."""
+        semaphore = self._user_semaphores.get(user_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency_per_user)
+            self._user_semaphores[user_id] = semaphore
+        self._user_waiters[user_id] += 1
+        try:
+            # Take the user's slot first so a queued user never holds a global one
+            async with semaphore:
+                async with self._llm_semaphore:
+                    yield
+        finally:
+            self._user_waiters[user_id] -= 1
+            if not self._user_waiters[user_id]:
+                del self._user_waiters[user_id]
+                del self._user_semaphores[user_id]
+
+    async def _abatch_llm(self, inputs: List[Dict]) -> List:
+        LLM_BATCH_SIZE.observe(len(inputs))
+        return await self.conversation.abatch(inputs, return_exceptions=True)
+
+    async def _acall_llm(self, inputs: Dict, on_chunk: Optional[Callable[[str], Awaitable[None]]]
+                         ) -> Tuple[str, Optional[Dict]]:
+        """The reply text and the token usage reported with it, if any."""
+        if on_chunk is None:
+            if self._batcher is not None:
+                response_message = await self._batcher.submit(inputs)
+            else:
+                response_message = await self.conversation.ainvoke(inputs)
+            return response_message.content, response_message.usage_metadata
+        text = ""
+        received = None
+        async for chunk in self.conversation.astream(inputs):
+            # Adding chunks also adds up their usage
+            received = chunk if received is None else received + chunk
+            if chunk.content:
+                text += chunk.content
+                await on_chunk(text)
+        return text, received.usage_metadata if received is not None else None
+
+    async def _aanswer(self, message: str, user_id: Optional[int],
+                       on_chunk: Optional[Callable[[str], Awaitable[None]]]) -> Tuple[str, int]:
+        """One LLM call for the user's message: the reply text and the estimated prompt tokens."""
+        async with self._llm_slot(user_id):
+            inputs, prompt_tokens = self._build_inputs(message, user_id)
+            started = time.perf_counter()
+            try:
+                response_text, usage = await self._acall_llm(inputs, on_chunk)
+            except Exception:
+                self._record_llm_call(started, prompt_tokens, None, None)
+                raise
+            self._record_llm_call(started, prompt_tokens, response_text, usage)
+        return response_text, prompt_tokens
+
+    def coalescing_stats(self) -> Dict[str, int]:
+        """LLM calls made for coalesced prompts, calls saved by sharing them, and batching counts."""
+        return {
+            "calls": self._single_flight.calls,
+            "saved": self._single_flight.shared,
+            "batches": self._batcher.batches if self._batcher else 0,
+            "batched": self._batcher.batched if self._batcher else 0,
+        }
+
+    async def aprocess_message(self, message: str, language: str = "en",
+                               user_id: Optional[int] = None,
+                               on_chunk: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict:
+        """
+        Async counterpart of process_message that does not block the event loop.
+
+        Args:
+            message (str): The incoming message from the client
+            language (str): Preferred language code ("en" for English, "ru" for Russian)
+            user_id (int): Telegram user id, selects the history and the in-flight limit
+            on_chunk (callable): If given, the reply is streamed and this coroutine is
+                awaited with the text received so far after every chunk
 
+        Returns:
+            Dict: Response text and an optional booking action
+        """
+        first_turn = self._first_turn(user_id)
+        cached = self._cached_response(message, language, user_id, first_turn)
+        if cached is not None:
+            return cached
         try:
-            response_message = self.conversation.invoke({
-                "input": message,
-                "services": self.services,
-                "chat_history": history_context["chat_history"]
-            })
-            response_text = response_message.content
-            self.memory.save_context({"input": message}, {"output": response_text})
-
-            # # Detect booking intent
-            # Check if a service recommendation exists in the response
-            for service in self.services:
-                if service["name"].lower() in response_text.lower():
-                    response["action"] = {
-                        "type": "book",
-                        "service": service["name"]
-                    }
-                    break
-
-            response["text"] = response_text
+            await self.awarm_up()
+            call = functools.partial(self._aanswer, message, user_id, on_chunk)
+            if self.coalesce and first_turn:
+                key = (self.services_hash, ResponseCache.normalize(message))
+                (response_text, prompt_tokens), shared = await self._single_flight.run(key, call)
+                if shared:
+                    LLM_CALLS_SAVED.inc()
+                    prompt_tokens = 0
+            else:
+                response_text, prompt_tokens = await call()
+            response = self._build_response(message, response_text, user_id, prompt_tokens)
         except Exception as e:
-            response["text"] = f"Error: {str(e)}"
+            return {"text": f"Error: {str(e)}", "action": None}
+        self._cache_response(message, language, response, first_turn)
         return response
 
 
-    def reset_conversation(self):
-        """Reset the conversation history."""
-        self.memory.clear()
+    def reset_conversation(self, user_id: Optional[int] = None):
+        """Reset the conversation history of one user, or of all users."""
+        self.memory.clear(user_id)
@@ -0,0 +1,204 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+import subprocess
+import sys
+from datetime import date, datetime, time
+from typing import List, Optional
+
+import aiohttp
+import orjson
+from aiohttp import web
+from telegram import Bot, Update
+
+from core.constants import (
+    CLUSTER_WORKER_PORT, METRICS_PORT, SESSION_BACKEND, WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT,
+    WEBHOOK_SECRET, WEBHOOK_URL, WORKER_COUNT
+)
+from core.session_store import SqliteSessionStore
+from core.webhook import SECRET_HEADER
+
+logger = logging.getLogger(__name__)
+
+MAIN = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def shard_of(user_id: int, workers: int) -> int:
+    """The worker that owns a user; SessionManager.owns uses the same rule."""
+    return user_id % workers
+
+
+class WorkerPool:
+    """Bot worker processes, each running in webhook mode on its own local port."""
+
+    def __init__(self, count: int = WORKER_COUNT, base_port: int = CLUSTER_WORKER_PORT):
+        self.count = count
+        self.base_port = base_port
+        self.processes: List[Optional[subprocess.Popen]] = [None] * count
+
+    def url(self, index: int, path: str = WEBHOOK_PATH) -> str:
+        return f"http://127.0.0.1:{self.base_port + index}{path}"
+
+    def _spawn(self, index: int):
+        env = dict(
+            os.environ,
+            BOT_MODE="webhook",
+            WORKER_INDEX=str(index),
+            WORKER_COUNT=str(self.count),
+            WEBHOOK_LISTEN="127.0.0.1",
+            WEBHOOK_PORT=str(self.base_port + index),
+            # Only the coordinator talks to setWebhook
+            WEBHOOK_URL="",
+            METRICS_PORT=str(METRICS_PORT + index if METRICS_PORT else 0),
+        )
+        self.processes[index] = subprocess.Popen([sys.executable, MAIN], env=env)
+        logger.info(f"Started worker {index} (pid {self.processes[index].pid}).")
+
+    def start(self):
+        for index in range(self.count):
+            self._spawn(index)
+
+    async def watch(self, interval: float = 1.0):
+        """Restart workers that exit; their users' updates get 503s until they are back."""
+        while True:
+            await asyncio.sleep(interval)
+            for index, process in enumerate(self.processes):
+                if process is not None and process.poll() is not None:
+                    logger.error(f"Worker {index} exited with {process.returncode}, restarting.")
+                    self._spawn(index)
+
+    def stop(self, timeout: float = 10.0):
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+        for process in self.processes:
+            if process is None:
+                continue
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+class Coordinator:
+    """
+    Receives the Telegram webhook and forwards every update to the worker
+    that owns its user, so a user's updates are always handled by the same
+    process. A worker's answer is passed back to Telegram: a 503 from its
+    backpressure, or from a worker that is down, makes Telegram redeliver.
+    """
+
+    def __init__(self, pool: WorkerPool, secret_token: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET must be set to run in cluster mode")
+        self.pool = pool
+        self.secret_token = secret_token
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.forwarded = [0] * pool.count
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/health", self.health)
+
+    def route(self, data: dict) -> int:
+        user = Update.de_json(data, None).effective_user
+        # Updates without a user (e.g. channel posts) all go to the first worker
+        return shard_of(user.id, self.pool.count) if user else 0
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning(f"Rejected webhook request from {request.remote}: bad secret token.")
+            return web.Response(status=403)
+        body = await request.read()
+        try:
+            index = self.route(orjson.loads(body))
+        except Exception:
+            return web.Response(status=400, text="Malformed update")
+
+        try:
+            async with self._session.post(
+                self.pool.url(index, self.path), data=body,
+                headers={SECRET_HEADER: self.secret_token, "Content-Type": "application/json"}
+            ) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError as e:
+            logger.warning(f"Worker {index} unreachable: {e}")
+            status = 503
+        if status == 200:
+            self.forwarded[index] += 1
+        return web.Response(status=status)
+
+    async def _worker_health(self, index: int) -> dict:
+        try:
+            async with self._session.get(self.pool.url(index, "/health")) as response:
+                return await response.json()
+        except (aiohttp.ClientError, ValueError):
+            return {"status": "unreachable"}
+
+    async def health(self, request: web.Request) -> web.Response:
+        workers = await asyncio.gather(*(self._worker_health(i) for i in range(self.pool.count)))
+        healthy = all(w.get("status") == "ok" for w in workers)
+        return web.json_response({
+            "status": "ok" if healthy else "degraded",
+            "workers": [dict(w, forwarded=n) for w, n in zip(workers, self.forwarded)],
+        }, status=200 if healthy else 503)
+
+    async def start(self):
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Coordinator listening on {self.listen}:{self.port}{self.path}, "
+                    f"{self.pool.count} workers.")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+async def serve_cluster(workers: int = WORKER_COUNT, url: str = WEBHOOK_URL):
+    """Run the coordinator and its worker processes until SIGINT/SIGTERM."""
+    if SESSION_BACKEND != "sqlite":
+        raise ValueError("Cluster mode needs the shared store: set SESSION_BACKEND=sqlite")
+
+    # Count slot bookings once, before any worker can take a slot
+    today = datetime.combine(date.today(), time.min).isoformat()
+    counted = SqliteSessionStore().rebuild_slot_bookings(since=today)
+    logger.info(f"Slot bookings rebuilt for {counted} slots.")
+
+    pool = WorkerPool(workers)
+    coordinator = Coordinator(pool)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    pool.start()
+    watcher = asyncio.create_task(pool.watch())
+    await coordinator.start()
+    try:
+        if url:
+            async with Bot(os.getenv("TELEGRAM_TOKEN")) as bot:
+                await bot.set_webhook(
+                    url=url.rstrip("/") + coordinator.path,
+                    secret_token=coordinator.secret_token,
+                    allowed_updates=Update.ALL_TYPES
+                )
+        await stop.wait()
+    finally:
+        watcher.cancel()
+        await coordinator.stop()
+        await asyncio.to_thread(pool.stop)
@@ -0,0 +1,100 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    At most one call per key in flight: callers that arrive while a call for
+    their key is running share its result instead of starting their own.
+
+    The call runs in its own task, so a caller that is cancelled does not
+    cancel it for the others.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    def _done(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Retrieved here so a failure nobody awaited is not reported as lost
+            task.exception()
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """The result of `call()`, or of the call already running for `key`; and whether it was shared."""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+            return await asyncio.shield(task), True
+        self.calls += 1
+        task = asyncio.ensure_future(call())
+        self._in_flight[key] = task
+        task.add_done_callback(lambda t: self._done(key, t))
+        return await asyncio.shield(task), False
+
+
+class MicroBatcher:
+    """
+    Collects items for up to `window` seconds, or until `max_size` are
+    waiting, and hands them to `run_batch` together. `run_batch` returns one
+    result per item, in order; an exception in that list fails only its item.
+    """
+
+    def __init__(self, run_batch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 window: float, max_size: int):
+        self.run_batch = run_batch
+        self.window = window
+        self.max_size = max_size
+        self.batches = 0
+        self.batched = 0
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            task = asyncio.ensure_future(self._run(pending))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run(self, pending: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.batched += len(pending)
+        try:
+            results = await self.run_batch([item for item, _ in pending])
+        except Exception as e:
+            logger.error(f"Batch of {len(pending)} failed: {e}")
+            results = [e] * len(pending)
+        for (_, future), result in zip(pending, results):
+            # The submitter may have been cancelled meanwhile
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
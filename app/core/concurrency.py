@@ -0,0 +1,145 @@
+import asyncio
+import sys
+from collections import defaultdict
+from contextlib import asynccontextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Any, Awaitable, Dict, Hashable, Optional
+
+from telegram.ext import BaseUpdateProcessor
+
+from core.constants import UPDATE_CONCURRENCY
+
+
+class KeyedLocks:
+    """One asyncio.Lock per key, dropped again once nobody holds or waits for it."""
+
+    def __init__(self):
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._users: Dict[Hashable, int] = defaultdict(int)
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def locked(self, key: Hashable) -> bool:
+        lock = self._locks.get(key)
+        return lock is not None and lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] += 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+
+class _Slot:
+    """One update's place under the processor's ceiling; it can be given back and taken again."""
+
+    def __init__(self, semaphore: asyncio.Semaphore):
+        self.semaphore = semaphore
+        self.held = False
+
+    async def acquire(self):
+        await self.semaphore.acquire()
+        self.held = True
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.semaphore.release()
+
+
+# The slot of the update being handled in this task, if any
+_current_slot: ContextVar[Optional[_Slot]] = ContextVar("update_slot", default=None)
+
+
+@asynccontextmanager
+async def update_slot_released():
+    """
+    Give the current update's processing slot back for the duration of the
+    block and take it again afterwards. For long waits that need no slot,
+    such as an LLM call, so they do not hold up other users' menus and
+    callbacks. The user's own lock stays held. A no-op outside
+    PerUserUpdateProcessor.
+    """
+    slot = _current_slot.get()
+    if slot is None or not slot.held:
+        yield
+        return
+    slot.release()
+    try:
+        yield
+    finally:
+        await slot.acquire()
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Processes updates from different users concurrently, and each user's
+    updates one at a time in arrival order.
+
+    Serializing per user keeps a user's session and ConversationHandler
+    state from being changed by two of their updates at once, while one
+    user's slow LLM call no longer holds up everyone else. At most
+    `max_concurrent_updates` updates run at the same time, not counting
+    those inside `update_slot_released`.
+    """
+
+    # Read by the base class while it builds its semaphore, see __init__
+    ceiling = sys.maxsize
+
+    def __init__(self, max_concurrent_updates: int = UPDATE_CONCURRENCY):
+        # The base class takes its semaphore before do_process_update, i.e. before
+        # the user's lock, so updates queued behind their own user would hold
+        # slots. Admit everything there and apply the ceiling after the lock.
+        # It sizes that semaphore from max_concurrent_updates, so the ceiling is
+        # only set once it has been built.
+        super().__init__(sys.maxsize)
+        self.ceiling = max_concurrent_updates
+        self.locks = KeyedLocks()
+        self._running = asyncio.Semaphore(max_concurrent_updates)
+        self.waiting = 0
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self.ceiling
+
+    def _user_lock(self, update: object):
+        user = getattr(update, "effective_user", None)
+        return self.locks.hold(user.id) if user is not None else nullcontext()
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]):
+        self.waiting += 1
+        admitted = False
+        try:
+            async with self._user_lock(update):
+                # Take the user's lock first so a queued user never holds a global slot
+                slot = _Slot(self._running)
+                await slot.acquire()
+                self.waiting -= 1
+                admitted = True
+                token = _current_slot.set(slot)
+                try:
+                    await coroutine
+                finally:
+                    _current_slot.reset(token)
+                    slot.release()
+        finally:
+            if not admitted:
+                # Cancelled while queued (e.g. on shutdown)
+                self.waiting -= 1
+                coroutine.close()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
@@ -1,7 +1,120 @@
+import json
 import os
 from dotenv import load_dotenv
 
+load_dotenv()
+
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
 
 (CHOOSING, BOOKING_SERVICE, BOOKING_DATE, BOOKING_TIME, 
- BOOKING_CONFIRM, SELECTING_LANGUAGE) = range(6)
\ No newline at end of file
+ BOOKING_CONFIRM, SELECTING_LANGUAGE) = range(6)
+
+# Upper bound on Gemini calls in flight across all users, and per single user
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MAX_CONCURRENCY_PER_USER = int(os.getenv("LLM_MAX_CONCURRENCY_PER_USER", "1"))
+
+# Identical first messages (no history yet) in flight at the same time share one LLM call
+LLM_COALESCE = os.getenv("LLM_COALESCE", "true").lower() in ("1", "true", "yes")
+# Non-streamed LLM calls arriving within this many seconds go out as one batch (0 = off)
+LLM_BATCH_WINDOW = float(os.getenv("LLM_BATCH_WINDOW", "0"))
+LLM_BATCH_MAX = int(os.getenv("LLM_BATCH_MAX", "16"))
+
+# Per-user conversation memory limits
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", "10"))
+MEMORY_MAX_TOKENS = int(os.getenv("MEMORY_MAX_TOKENS", "2000"))
+MEMORY_MAX_USERS = int(os.getenv("MEMORY_MAX_USERS", "10000"))
+MEMORY_IDLE_TTL = float(os.getenv("MEMORY_IDLE_TTL", "86400"))
+# "buffer" keeps the latest turns only; "summary" also folds older turns into a
+# per-user summary in the background: the last MEMORY_SUMMARY_KEEP_TURNS stay
+# verbatim, the rest is summarized once it reaches MEMORY_SUMMARY_TRIGGER_TOKENS
+MEMORY_MODE = os.getenv("MEMORY_MODE", "buffer")
+MEMORY_SUMMARY_KEEP_TURNS = int(os.getenv("MEMORY_SUMMARY_KEEP_TURNS", "4"))
+MEMORY_SUMMARY_TRIGGER_TOKENS = int(os.getenv("MEMORY_SUMMARY_TRIGGER_TOKENS", "600"))
+MEMORY_SUMMARY_MAX_TOKENS = int(os.getenv("MEMORY_SUMMARY_MAX_TOKENS", "250"))
+
+# LLM response cache for repeated questions
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+# Semantic cache for paraphrased questions. Only questions with the same numbers, services
+# and kind (see question_signature) are compared, so the cosine threshold can be lenient
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "256"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "20000"))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.4"))
+
+# Optional JSON file with the services catalog (list of service dicts)
+SERVICES_FILE = os.getenv("SERVICES_FILE")
+
+# Hard per-request prompt budget (estimated tokens); oldest history is trimmed first
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "3000"))
+
+# Stream LLM replies into Telegram, editing the message at most once per interval (seconds)
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+
+# Session persistence: "json" (single file) or "sqlite"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "json")
+SESSION_FILE = os.getenv("SESSION_FILE", "user_sessions.json")
+SESSION_DB_URL = os.getenv("SESSION_DB_URL", "sqlite:///user_sessions.db")
+
+# Write-behind session persistence: flush dirty sessions every interval or once this many pile up
+SESSION_WRITE_BEHIND = os.getenv("SESSION_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+SESSION_FLUSH_INTERVAL = float(os.getenv("SESSION_FLUSH_INTERVAL", "2.0"))
+SESSION_FLUSH_THRESHOLD = int(os.getenv("SESSION_FLUSH_THRESHOLD", "100"))
+
+# Bounded session working set (sqlite backend): sessions idle this long (seconds) are dropped
+# from memory and reloaded on the next message; optionally at most this many stay resident
+# (0 = no cap). Checked every SESSION_EVICT_INTERVAL seconds
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "1800"))
+SESSION_MAX_RESIDENT = int(os.getenv("SESSION_MAX_RESIDENT", "0"))
+SESSION_EVICT_INTERVAL = float(os.getenv("SESSION_EVICT_INTERVAL", "60"))
+
+# Salon-wide bookings allowed per time slot (e.g. number of masters), with optional
+# per-slot overrides as JSON, e.g. '{"14:00": 2}'
+SLOT_CAPACITY = int(os.getenv("SLOT_CAPACITY", "1"))
+SLOT_CAPACITY_OVERRIDES = json.loads(os.getenv("SLOT_CAPACITY_OVERRIDES", "{}"))
+
+# Appointment reminders: how long before the appointment, how often due ones are
+# checked (seconds), how many are sent at once, and what to do with reminders that
+# came due while the bot was down ("send" or "skip")
+REMINDER_LEAD_HOURS = float(os.getenv("REMINDER_LEAD_HOURS", "24"))
+REMINDER_TICK = float(os.getenv("REMINDER_TICK", "30"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "25"))
+REMINDER_CATCHUP = os.getenv("REMINDER_CATCHUP", "send")
+
+# Outbound message pacing, from Telegram's flood limits: about 30 messages per second
+# overall and about one per second per chat (short bursts tolerated)
+OUTBOUND_GLOBAL_RATE = float(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))
+OUTBOUND_CHAT_RATE = float(os.getenv("OUTBOUND_CHAT_RATE", "1"))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))
+OUTBOUND_MAX_IN_FLIGHT = int(os.getenv("OUTBOUND_MAX_IN_FLIGHT", "16"))
+
+# How updates are received: "polling" or "webhook". In webhook mode updates are
+# POSTed to WEBHOOK_PATH on the local server; WEBHOOK_URL is the public base URL
+# registered with Telegram (leave empty if it is registered elsewhere)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+# Updates waiting to be processed before new ones are answered with 503
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Updates processed at the same time (each user's updates still run one at a time)
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "32"))
+
+# Multi-process mode (BOT_MODE=cluster): a coordinator receives the webhook and
+# forwards each update to worker user_id % WORKER_COUNT, which listens on
+# CLUSTER_WORKER_PORT + its index. Workers share the SQLite session store.
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+CLUSTER_WORKER_PORT = int(os.getenv("CLUSTER_WORKER_PORT", "8081"))
+# How long (seconds) a worker shows its cached view of a day's slot counts before
+# reading the shared ones again; a booking is always checked against the store
+SLOT_REFRESH_INTERVAL = float(os.getenv("SLOT_REFRESH_INTERVAL", "5"))
+
+# Prometheus text endpoint (GET /metrics); METRICS_PORT=0 turns it off. In cluster
+# mode worker i serves it on METRICS_PORT + i
+METRICS_LISTEN = os.getenv("METRICS_LISTEN", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9464"))
@@ -0,0 +1,98 @@
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, Optional, Tuple
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from core.sessions import as_date
+
+logger = logging.getLogger(__name__)
+
+DATE_DAYS = 7
+TIME_COLUMNS = 3
+
+
+class KeyboardCache:
+    """
+    The booking flow's inline keyboards, built once and reused.
+
+    Each keyboard is stored with the inputs it was built from and rebuilt
+    only when one of them changes:
+    - services: the language and the catalog version
+    - dates: the current day, so the list rolls over at midnight (which also
+      drops the slot counts of past days from the availability)
+    - times: the day's availability version and, for today, the current
+      hour (slots that have started drop out)
+    """
+
+    def __init__(self, catalog, availability):
+        self.catalog = catalog
+        self.availability = availability
+        self._services: Dict[str, Tuple[int, InlineKeyboardMarkup]] = {}
+        self._dates: Optional[Tuple[date, InlineKeyboardMarkup]] = None
+        self._times: Dict[date, Tuple[tuple, InlineKeyboardMarkup]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def services(self, language: str) -> InlineKeyboardMarkup:
+        cached = self._services.get(language)
+        if cached is not None and cached[0] == self.catalog.version:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(
+                f"{self.catalog.display_name(service, language)} ({service['price_from']})",
+                callback_data=f"service_{service['id']}"
+            )]
+            for service in self.catalog.services
+        ])
+        self._services[language] = (self.catalog.version, markup)
+        return markup
+
+    def dates(self, today: Optional[date] = None) -> InlineKeyboardMarkup:
+        """The next seven days, starting today."""
+        today = today or date.today()
+        if self._dates is not None and self._dates[0] == today:
+            self.hits += 1
+            return self._dates[1]
+        self.misses += 1
+        markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(day.strftime("%A, %b %d"), callback_data=f"date_{day:%Y-%m-%d}")]
+            for day in (today + timedelta(days=i) for i in range(DATE_DAYS))
+        ])
+        self._dates = (today, markup)
+        # Days that are over will not be asked for again, nor their slot counts
+        for day in [d for d in self._times if d < today]:
+            del self._times[day]
+        self.availability.prune(today)
+        return markup
+
+    def times(self, day, now: Optional[datetime] = None) -> InlineKeyboardMarkup:
+        """Slots of `day` with room left salon-wide; for today only those after the current hour."""
+        day = as_date(day)
+        now = now or datetime.now()
+        hour = now.hour if day == now.date() else None
+        key = (hour, self.availability.day_version(day))
+        cached = self._times.get(day)
+        if cached is not None and cached[0] == key:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        after = time(hour, 59) if hour is not None else None
+        slots = self.availability.free_slots(day, after=after)
+        markup = InlineKeyboardMarkup([
+            [InlineKeyboardButton(slot, callback_data=f"time_{slot}") for slot in slots[i:i + TIME_COLUMNS]]
+            for i in range(0, len(slots), TIME_COLUMNS)
+        ])
+        self._times[day] = (key, markup)
+        return markup
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._services) + len(self._times) + (self._dates is not None),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,114 @@
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Words and single punctuation marks; whitespace only separates tokens
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w")
+
+
+class Match(NamedTuple):
+    service: str
+    start: int
+    end: int
+    pattern: str
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def _token_pattern(token: str) -> str:
+    """A word token only matches a whole word of the text; punctuation matches as is."""
+    if not _WORD.match(token):
+        return re.escape(token)
+    head, tail = re.escape(token[0]), re.escape(token[1:])
+    # The word-start check comes after the first character, so that patterns still
+    # begin with a literal and the re engine can skip ahead to candidate positions
+    return rf"{head}(?<!\w{head}){tail}(?!\w)"
+
+
+def _trie_pattern(trie: dict, first: bool = True) -> str:
+    """Regex for a trie of token sequences; a None key marks where a pattern ends."""
+    branches = []
+    for token, child in trie.items():
+        if token is None:
+            continue
+        branch = ("" if first else r"\s*") + _token_pattern(token)
+        if len(child) > (None in child):
+            rest = _trie_pattern(child, first=False)
+            # Try the longer patterns first and fall back to the one ending here
+            branch += f"(?:{rest})?" if None in child else rest
+        branches.append(branch)
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+class ServiceMatcher:
+    """
+    One regular expression over service names, Russian names and aliases.
+
+    The expression is a trie of the patterns' tokens, so the re engine scans
+    a reply in one pass, branching on the next token instead of trying every
+    name in turn, and its cost barely depends on the number of services.
+    Matches are always whole words.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, str]]):
+        """
+        Args:
+            patterns: (pattern text, service name) pairs
+        """
+        trie: dict = {}
+        # Token sequence -> (pattern text, service name) of every pattern spelled that way
+        self._patterns: Dict[Tuple[str, ...], List[Tuple[str, str]]] = {}
+        vocabulary = set()
+
+        for text, service in patterns:
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            node = trie
+            for token in tokens:
+                node = node.setdefault(token, {})
+            node[None] = True
+            self._patterns.setdefault(tuple(tokens), []).append((text.lower().strip(), service))
+            vocabulary.update(token for token in tokens if _WORD.match(token))
+        # Every word that appears in some pattern
+        self.vocabulary = frozenset(vocabulary)
+        self._regex = re.compile(_trie_pattern(trie)) if trie else None
+
+    @classmethod
+    def from_catalog(cls, catalog, aliases: Optional[Dict[str, List[str]]] = None) -> 'ServiceMatcher':
+        """
+        Build from a ServiceCatalog: each service's name, `name_ru` and `aliases`,
+        plus any extra aliases given as {service name: [alias, ...]}.
+        """
+        aliases = aliases or {}
+        patterns = []
+        for service in catalog.services:
+            name = service["name"]
+            patterns.append((name, name))
+            if service.get("name_ru"):
+                patterns.append((service["name_ru"], name))
+            for alias in service.get("aliases", []) + aliases.get(name, []):
+                patterns.append((alias, name))
+        return cls(patterns)
+
+    def _matches(self, found) -> List[Match]:
+        return [
+            Match(service, found.start(), found.end(), pattern)
+            for pattern, service in self._patterns[tuple(tokenize(found.group()))]
+        ]
+
+    def find_all(self, text: str) -> List[Match]:
+        """
+        Matches from left to right, the longest one wherever several start at
+        the same place, with offsets into text.lower(). Matches do not overlap.
+        """
+        if self._regex is None:
+            return []
+        return [match for found in self._regex.finditer(text.lower()) for match in self._matches(found)]
+
+    def first(self, text: str) -> Optional[Match]:
+        """The earliest match in the text, preferring the longest one at that position."""
+        found = self._regex.search(text.lower()) if self._regex is not None else None
+        return self._matches(found)[0] if found else None
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from typing import TYPE_CHECKING, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from core.constants import (
+    MEMORY_IDLE_TTL, MEMORY_MAX_TOKENS, MEMORY_MAX_TURNS, MEMORY_MAX_USERS,
+    MEMORY_SUMMARY_KEEP_TURNS, MEMORY_SUMMARY_MAX_TOKENS, MEMORY_SUMMARY_TRIGGER_TOKENS
+)
+
+
+if TYPE_CHECKING:
+    from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+class _UserHistory:
+    __slots__ = ("turns", "tokens", "last_access", "summary", "summarizing")
+
+    def __init__(self):
+        self.turns: Deque[Tuple["HumanMessage", "AIMessage", int]] = deque()
+        self.tokens = 0
+        self.last_access = time.monotonic()
+        # Only used by SummarizingMemoryStore
+        self.summary = ""
+        self.summarizing = False
+
+
+class UserMemoryStore:
+    """
+    Conversation history kept separately for every user.
+
+    Each user's history is capped by number of turns and by estimated tokens,
+    oldest turns dropped first. Users are kept in LRU order: the least recently
+    active ones are evicted when there are more than `max_users` of them or when
+    they have been idle for longer than `idle_ttl` seconds.
+    """
+
+    def __init__(self, max_turns: int = MEMORY_MAX_TURNS, max_tokens: int = MEMORY_MAX_TOKENS,
+                 max_users: int = MEMORY_MAX_USERS, idle_ttl: float = MEMORY_IDLE_TTL):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_users = max_users
+        self.idle_ttl = idle_ttl
+        self._histories: "OrderedDict[Optional[int], _UserHistory]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._histories)
+
+    def load(self, user_id: Optional[int]) -> List["BaseMessage"]:
+        """Return the user's chat history as a flat list of messages."""
+        history = self._histories.get(user_id)
+        if history is None:
+            return []
+        history.last_access = time.monotonic()
+        self._histories.move_to_end(user_id)
+        messages: List["BaseMessage"] = []
+        for human, ai, _ in history.turns:
+            messages.append(human)
+            messages.append(ai)
+        return messages
+
+    def save(self, user_id: Optional[int], input_text: str, output_text: str):
+        """Append one turn to the user's history and enforce all limits."""
+        history = self._histories.get(user_id)
+        if history is None:
+            history = self._histories[user_id] = _UserHistory()
+        else:
+            self._histories.move_to_end(user_id)
+        history.last_access = time.monotonic()
+
+        tokens = estimate_tokens(input_text) + estimate_tokens(output_text)
+        # Imported here so the bot starts without langchain; cached after the first turn
+        from langchain_core.messages import AIMessage, HumanMessage
+
+        history.turns.append((HumanMessage(content=input_text), AIMessage(content=output_text), tokens))
+        history.tokens += tokens
+
+        # Always keep the latest turn, even if it alone exceeds the token cap
+        while len(history.turns) > 1 and (
+            len(history.turns) > self.max_turns or history.tokens > self.max_tokens
+        ):
+            history.tokens -= history.turns.popleft()[2]
+
+        self._evict(history.last_access)
+
+    def _evict(self, now: float):
+        while self._histories:
+            user_id, oldest = next(iter(self._histories.items()))
+            if len(self._histories) > self.max_users or now - oldest.last_access > self.idle_ttl:
+                del self._histories[user_id]
+            else:
+                break
+
+    def summary(self, user_id: Optional[int]) -> str:
+        """What is remembered of turns no longer kept verbatim; always empty for this store."""
+        return ""
+
+    def clear(self, user_id: Optional[int] = None):
+        """Forget one user's history, or everyone's when no user is given."""
+        if user_id is None:
+            self._histories.clear()
+        else:
+            self._histories.pop(user_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "users": len(self._histories),
+            "tokens": sum(h.tokens for h in self._histories.values()),
+        }
+
+
+class SummarizingMemoryStore(UserMemoryStore):
+    """
+    UserMemoryStore that folds older turns into a per-user summary instead of
+    dropping them.
+
+    The last `keep_turns` turns stay verbatim. Once the turns before them
+    add up to `trigger_tokens`, or the history reaches `max_turns`, they
+    are passed to `summarize(previous_summary, [(user text, reply), ...])`
+    in a background task, and replaced by its result when it finishes; the
+    request that crossed the threshold does not wait for it. The summary is
+    cut to `summary_max_tokens`. Without a running event loop (the sync
+    path) nothing is summarized and the caps of UserMemoryStore apply.
+    """
+
+    def __init__(self, summarize: Callable[[str, List[Tuple[str, str]]], Awaitable[str]],
+                 keep_turns: int = MEMORY_SUMMARY_KEEP_TURNS,
+                 trigger_tokens: int = MEMORY_SUMMARY_TRIGGER_TOKENS,
+                 summary_max_tokens: int = MEMORY_SUMMARY_MAX_TOKENS, **limits):
+        super().__init__(**limits)
+        self.summarize = summarize
+        self.keep_turns = max(1, keep_turns)
+        self.trigger_tokens = trigger_tokens
+        self.summary_max_tokens = summary_max_tokens
+        self.summaries = 0
+        self.failures = 0
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def pending(self) -> int:
+        """Summaries being written right now."""
+        return len(self._tasks)
+
+    def summary(self, user_id: Optional[int]) -> str:
+        history = self._histories.get(user_id)
+        return history.summary if history is not None else ""
+
+    def save(self, user_id: Optional[int], input_text: str, output_text: str):
+        super().save(user_id, input_text, output_text)
+        history = self._histories.get(user_id)
+        if history is None or history.summarizing or len(history.turns) <= self.keep_turns:
+            return
+        older = list(history.turns)[:-self.keep_turns]
+        if sum(turn[2] for turn in older) < self.trigger_tokens and len(history.turns) < self.max_turns:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        history.summarizing = True
+        task = loop.create_task(self._fold(user_id, history, older))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fold(self, user_id: Optional[int], history: _UserHistory, older: list):
+        try:
+            summary = await self.summarize(
+                history.summary, [(human.content, ai.content) for human, ai, _ in older]
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Summarizing the history of user {user_id} failed: {e}")
+            return
+        finally:
+            history.summarizing = False
+        if self._histories.get(user_id) is not history:
+            # Cleared or evicted meanwhile
+            return
+        history.summary = summary.strip()[:self.summary_max_tokens * 4]
+        # The summarized turns, unless the caps dropped some of them already
+        folded = {id(turn) for turn in older}
+        while history.turns and id(history.turns[0]) in folded:
+            history.tokens -= history.turns.popleft()[2]
+        self.summaries += 1
+
+    async def drain(self):
+        """Wait for the summaries in progress."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        stats = super().stats()
+        stats.update(
+            summary_tokens=sum(estimate_tokens(h.summary) for h in self._histories.values() if h.summary),
+            summaries=self.summaries,
+            summarizing=self.pending,
+            failures=self.failures,
+        )
+        return stats
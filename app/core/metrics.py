@@ -0,0 +1,220 @@
+import bisect
+import functools
+import logging
+import math
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; Telegram calls and handlers are tens of ms, LLM calls seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 5000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing count, per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        self.values[label_values] = self.values.get(label_values, 0.0) + amount
+
+    def samples(self):
+        for label_values, value in self.values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """
+    Observations counted into fixed buckets, per combination of label values.
+
+    `observe` is a bisect and two additions; buckets are only made
+    cumulative, as the exposition format wants, when rendered.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        series = self.values.get(label_values)
+        if series is None:
+            series = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self):
+        for label_values, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket", _format_labels(self.labels, label_values, le), cumulative
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Collected:
+    """
+    A gauge or counter read from elsewhere only when scraped, so keeping it
+    costs nothing in between. `collect` returns a number, or a dict from
+    label values (a tuple) to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 collect: Callable[[], object], labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        values = self.collect()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            yield self.name, _format_labels(self.labels, label_values), value
+
+
+class MetricsRegistry:
+    """Metrics by name, rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def collected(self, name: str, documentation: str, kind: str,
+                  collect: Callable[[], object], labels: Tuple[str, ...] = ()) -> Collected:
+        """Register a gauge or counter read by `collect`; replaces one of the same name."""
+        return self._register(Collected(name, documentation, kind, collect, labels))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            try:
+                samples = list(metric.samples())
+            except Exception as e:
+                # One broken collector must not take the whole endpoint down
+                logger.error(f"Failed to collect metric {metric.name}: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in samples)
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "anna_handler_seconds", "Time spent in a conversation handler.", ("handler",)
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "anna_handler_errors_total", "Conversation handlers that raised.", ("handler",)
+)
+LLM_SECONDS = REGISTRY.histogram(
+    "anna_llm_request_seconds", "Duration of Gemini calls, streaming included.", ("outcome",)
+)
+LLM_TOKENS = REGISTRY.counter(
+    "anna_llm_tokens_total",
+    "Tokens sent to and received from Gemini (estimated when the API reports no usage).",
+    ("direction",)
+)
+LLM_CALLS_SAVED = REGISTRY.counter(
+    "anna_llm_calls_saved_total", "LLM calls avoided by sharing an identical prompt already in flight."
+)
+LLM_BATCH_SIZE = REGISTRY.histogram(
+    "anna_llm_batch_size", "Prompts sent in one batched LLM call.", buckets=SIZE_BUCKETS
+)
+SESSION_FLUSH_SECONDS = REGISTRY.histogram(
+    "anna_session_flush_seconds", "Duration of a write-behind session flush."
+)
+SESSION_FLUSH_SIZE = REGISTRY.histogram(
+    "anna_session_flush_sessions", "Sessions written by one flush.", buckets=SIZE_BUCKETS
+)
+SESSION_FLUSH_ERRORS = REGISTRY.counter(
+    "anna_session_flush_errors_total", "Session flushes that failed and were retried later."
+)
+
+
+def timed(name: str, histogram: Histogram = HANDLER_SECONDS, errors: Optional[Counter] = HANDLER_ERRORS):
+    """Decorator for coroutine handlers: observe their duration under label `name`."""
+    def decorate(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                if errors is not None:
+                    errors.inc(name)
+                raise
+            finally:
+                histogram.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorate
+
+
+async def handle_metrics(request):
+    """aiohttp handler for GET /metrics."""
+    from aiohttp import web
+
+    return web.Response(body=REGISTRY.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def serve_metrics(listen: str, port: int):
+    """Serve GET /metrics on its own port; returns the runner to clean up on shutdown."""
+    # aiohttp is only imported when the endpoint is enabled
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, listen, port).start()
+    logger.info(f"Metrics served on {listen}:{port}/metrics.")
+    return runner
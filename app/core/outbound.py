@@ -0,0 +1,264 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from core.constants import (
+    OUTBOUND_CHAT_BURST, OUTBOUND_CHAT_RATE, OUTBOUND_GLOBAL_RATE, OUTBOUND_MAX_IN_FLIGHT
+)
+
+logger = logging.getLogger(__name__)
+
+# Priorities: lower is sent first
+INTERACTIVE = 0
+BULK = 1
+
+
+class TokenBucket:
+    """`rate` tokens per second, holding at most `burst` of them."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float = 1, now: Optional[float] = None):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Outgoing:
+    __slots__ = ("priority", "seq", "chat_id", "enqueued_at", "send", "future")
+
+    def __init__(self, priority: int, seq: int, chat_id: int,
+                 send: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.enqueued_at = time.monotonic()
+        self.send = send
+        self.future = future
+
+    def __lt__(self, other: '_Outgoing') -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class OutboundQueue:
+    """
+    Paces every bot-to-user send to stay within Telegram's flood limits.
+
+    Sends are queued per chat and dispatched by one loop that takes a token
+    from a global bucket and from the chat's own bucket before each send, so
+    a burst of reminders drains at the maximum allowed rate instead of
+    failing. Interactive replies are dispatched before bulk messages. On
+    RetryAfter all sends pause for the time Telegram asks for and the
+    message is put back at the front of its chat's queue.
+
+    Callers pass a function that makes the API call, since the call has to
+    be made again when it is retried.
+    """
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE,
+                 chat_rate: float = OUTBOUND_CHAT_RATE,
+                 chat_burst: float = OUTBOUND_CHAT_BURST,
+                 max_in_flight: int = OUTBOUND_MAX_IN_FLIGHT):
+        self.bot: Optional[Bot] = None
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._global = TokenBucket(global_rate)
+        self._buckets: Dict[int, TokenBucket] = {}
+        self._chats: Dict[int, List[_Outgoing]] = {}
+        # Chats that may be able to send, by the priority of their next message
+        self._ready: List[Tuple[int, int, int]] = []
+        # Chats waiting for their own bucket to refill
+        self._sleeping: List[Tuple[float, int]] = []
+        self._sleeping_chats: Set[int] = set()
+        self._paused_until = 0.0
+        self._counter = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_in_flight)
+        self._in_flight: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+
+        self.depth = {INTERACTIVE: 0, BULK: 0}
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+        self._latencies: Deque[float] = deque(maxlen=1000)
+
+    def start(self, bot: Bot):
+        self.bot = bot
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop dispatching; messages still queued are cancelled."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        for queue in self._chats.values():
+            for item in queue:
+                item.future.cancel()
+        self._chats.clear()
+        self.depth = {INTERACTIVE: 0, BULK: 0}
+
+    def submit(self, chat_id: int, send: Callable[[], Awaitable[Any]],
+               priority: int = INTERACTIVE) -> asyncio.Future:
+        """
+        Queue a send for a chat.
+
+        Args:
+            chat_id: The chat the message goes to; used for the per-chat limit
+            send: Makes the API call, e.g. `lambda: bot.send_message(chat_id, text)`
+            priority: INTERACTIVE or BULK
+
+        Returns:
+            asyncio.Future: Resolves to the API call's result, or its error
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._enqueue(_Outgoing(priority, next(self._counter), chat_id, send, future))
+        return future
+
+    async def send_message(self, chat_id: int, text: str, priority: int = INTERACTIVE, **kwargs):
+        return await self.submit(
+            chat_id, lambda: self.bot.send_message(chat_id, text, **kwargs), priority
+        )
+
+    def _enqueue(self, item: _Outgoing):
+        heapq.heappush(self._chats.setdefault(item.chat_id, []), item)
+        heapq.heappush(self._ready, (item.priority, item.seq, item.chat_id))
+        self.depth[item.priority] += 1
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: int, now: float) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst, now)
+        return bucket
+
+    def _wake_sleepers(self, now: float):
+        while self._sleeping and self._sleeping[0][0] <= now:
+            _, chat_id = heapq.heappop(self._sleeping)
+            self._sleeping_chats.discard(chat_id)
+            queue = self._chats.get(chat_id)
+            if queue:
+                heapq.heappush(self._ready, (queue[0].priority, queue[0].seq, chat_id))
+
+    def _prune_buckets(self, now: float):
+        # A full bucket behaves exactly like a new one, so idle chats can be forgotten
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._chats and b.full(now)]:
+            del self._buckets[chat_id]
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._wake_sleepers(now)
+            if not self._ready:
+                timeout = self._sleeping[0][0] - now if self._sleeping else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            delay = max(self._paused_until - now, self._global.wait_time(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            # Entries in _ready are hints; the chat's queue decides what is actually sent
+            _, _, chat_id = heapq.heappop(self._ready)
+            queue = self._chats.get(chat_id)
+            if not queue:
+                continue
+            bucket = self._bucket(chat_id, now)
+            wait = bucket.wait_time(now)
+            if wait > 0:
+                if chat_id not in self._sleeping_chats:
+                    self._sleeping_chats.add(chat_id)
+                    heapq.heappush(self._sleeping, (now + wait, chat_id))
+                continue
+
+            item = heapq.heappop(queue)
+            if queue:
+                heapq.heappush(self._ready, (queue[0].priority, queue[0].seq, chat_id))
+            else:
+                del self._chats[chat_id]
+            self.depth[item.priority] -= 1
+            self._global.take(now)
+            bucket.take(now)
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._send(item))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
+
+            if len(self._buckets) > 10000:
+                self._prune_buckets(now)
+
+    async def _send(self, item: _Outgoing):
+        try:
+            result = await item.send()
+        except RetryAfter as e:
+            self.retries += 1
+            self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            logger.warning(f"Telegram asked to retry after {e.retry_after}s, pausing outbound sends.")
+            self._enqueue(item)
+        except Exception as e:
+            self.failed += 1
+            if not item.future.done():
+                item.future.set_exception(e)
+        else:
+            self.sent += 1
+            self._latencies.append(time.monotonic() - item.enqueued_at)
+            if not item.future.done():
+                item.future.set_result(result)
+        finally:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "depth": sum(self.depth.values()),
+            "depth_interactive": self.depth[INTERACTIVE],
+            "depth_bulk": self.depth[BULK],
+            "in_flight": len(self._in_flight),
+            "sent": self.sent,
+            "retries": self.retries,
+            "failed": self.failed,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+        }
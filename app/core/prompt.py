@@ -0,0 +1,147 @@
+import logging
+from typing import TYPE_CHECKING, List, Tuple
+
+from core.constants import PROMPT_MAX_TOKENS
+from core.memory import estimate_tokens
+
+if TYPE_CHECKING:
+    from langchain.prompts.chat import ChatPromptTemplate
+    from langchain_core.messages import BaseMessage, SystemMessage
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_TEMPLATE = """You are Anna, a charismatic and confident beauty salon owner. Your personality traits:
+- Sociable, confident, and charismatic
+- Use natural, slightly informal language with occasional humor
+- Focus on helping clients enhance their beauty
+- Passionate about beauty industry and artistry
+- Skilled at engaging clients and selling services
+
+Guidelines for interaction:
+- Communicate in both Russian and English (match the client's language)
+- Share relevant experiences and propose beauty solutions
+- Ask leading sales questions to guide the conversation
+- Redirect off-topic discussions back to beauty services
+- Adapt communication style based on client's gender (identified through names)
+- Maintain professional yet friendly tone
+- Avoid excessive punctuation and emojis
+
+Available services (name — price from):
+{services}"""
+
+
+# Appended to the system message for clients with a summarized history
+SUMMARY_HEADER = "\n\nWhat you remember from earlier conversations with this client:\n"
+
+SUMMARY_INSTRUCTIONS = """You keep notes for a beauty salon assistant about one client.
+Update the notes with the conversation below. Keep what matters for future visits:
+the client's name, preferences, allergies or sensitivities, services they had, booked
+or were interested in, and anything they asked to be remembered. Drop small talk.
+Write at most {max_words} words, in the client's language, as short plain sentences."""
+
+
+def render_services(catalog) -> str:
+    """One line per category, services separated by semicolons."""
+    lines = []
+    for category in catalog.categories():
+        items = "; ".join(
+            f"{service['name']} — {service['price_from']}"
+            for service in catalog.by_category(category)
+        )
+        lines.append(f"{category}: {items}")
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """
+    Assembles the chat prompt: a static system message rendered once per
+    catalog version (plus the client's history summary, if any), the user's
+    history and the new message.
+
+    History is trimmed oldest turn first so every request stays within
+    `max_tokens` (estimated). The ChatPromptTemplate itself is only built,
+    and langchain only imported, when `prompt` is first used.
+    """
+
+    def __init__(self, catalog, max_tokens: int = PROMPT_MAX_TOKENS):
+        self.catalog = catalog
+        self.max_tokens = max_tokens
+        self._version = None
+        self._prompt = None
+        self._system_message = None
+        self.refresh()
+
+    def refresh(self) -> bool:
+        """Re-render the static prefix if the catalog changed. Returns True if it did."""
+        if self._version == self.catalog.version:
+            return False
+        self.system_text = SYSTEM_TEMPLATE.format(services=render_services(self.catalog))
+        self.system_tokens = estimate_tokens(self.system_text)
+        self._system_message = None
+        self._version = self.catalog.version
+        return True
+
+    @property
+    def prompt(self) -> "ChatPromptTemplate":
+        if self._prompt is None:
+            from langchain.prompts.chat import (
+                ChatPromptTemplate,
+                HumanMessagePromptTemplate,
+                MessagesPlaceholder
+            )
+
+            # The system message is passed in (see system_message), never parsed as a
+            # template, so braces in service names or summaries are harmless
+            self._prompt = ChatPromptTemplate.from_messages([
+                MessagesPlaceholder(variable_name="system"),
+                MessagesPlaceholder(variable_name="chat_history"),
+                HumanMessagePromptTemplate.from_template("{input}")
+            ])
+        return self._prompt
+
+    def system_message(self, summary: str = "") -> "SystemMessage":
+        """The system message, with the client's history summary if there is one."""
+        from langchain_core.messages import SystemMessage
+
+        if summary:
+            return SystemMessage(content=self.system_text + SUMMARY_HEADER + summary)
+        if self._system_message is None:
+            self._system_message = SystemMessage(content=self.system_text)
+        return self._system_message
+
+    def summary_request(self, summary: str, turns: List[Tuple[str, str]],
+                        max_tokens: int) -> List["BaseMessage"]:
+        """Messages asking the LLM to fold `turns` into the previous `summary`."""
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        lines = [f"Previous notes: {summary}"] if summary else []
+        for client, anna in turns:
+            lines.append(f"Client: {client}")
+            lines.append(f"Anna: {anna}")
+        return [
+            SystemMessage(content=SUMMARY_INSTRUCTIONS.format(max_words=max_tokens * 3 // 4)),
+            HumanMessage(content="\n".join(lines)),
+        ]
+
+    def fit_history(self, message: str, history: List["BaseMessage"],
+                    summary: str = "") -> Tuple[List["BaseMessage"], int]:
+        """
+        Drop the oldest history messages until the prompt fits the budget.
+
+        Returns:
+            Tuple[List[BaseMessage], int]: The kept history and the estimated prompt tokens
+        """
+        fixed = self.system_tokens + estimate_tokens(message)
+        if summary:
+            fixed += estimate_tokens(SUMMARY_HEADER + summary)
+        sizes = [estimate_tokens(m.content) for m in history]
+        total = fixed + sum(sizes)
+        start = 0
+        # Trim whole turns (human + assistant) so the history never starts mid-exchange
+        while start < len(history) and total > self.max_tokens:
+            step = 2 if start + 1 < len(history) else 1
+            total -= sum(sizes[start:start + step])
+            start += step
+        if start:
+            logger.debug(f"Trimmed {start} history messages to fit {self.max_tokens} tokens.")
+        return history[start:], total
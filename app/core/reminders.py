@@ -0,0 +1,95 @@
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from core.constants import REMINDER_CATCHUP, REMINDER_LEAD_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Heap entry fields: [due, sequence, user_id, appointment, active]
+_DUE, _SEQ, _USER, _APPOINTMENT, _ACTIVE = range(5)
+
+
+class ReminderScheduler:
+    """
+    Pending appointment reminders in a min-heap ordered by due time.
+
+    Reminders are not stored separately: each appointment carries a
+    `reminded` flag, and the heap is rebuilt from the stored appointments at
+    startup. Cancelled reminders are flagged inactive and skipped when popped.
+
+    Catch-up policy for reminders that came due while the bot was down:
+    "send" delivers them if the appointment has not started yet, "skip"
+    drops them.
+    """
+
+    def __init__(self, lead: timedelta = timedelta(hours=REMINDER_LEAD_HOURS),
+                 catchup: str = REMINDER_CATCHUP):
+        if catchup not in ("send", "skip"):
+            raise ValueError(f"Unknown reminder catch-up policy: {catchup}")
+        self.lead = lead
+        self.catchup = catchup
+        self._heap: List[list] = []
+        self._entries: Dict[Tuple[int, int], list] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _entry(self, user_id: int, appointment) -> list:
+        entry = [appointment.starts_at - self.lead, next(self._counter), user_id, appointment, True]
+        self._entries[(user_id, id(appointment))] = entry
+        return entry
+
+    def rehydrate(self, appointments: Iterable[Tuple[int, object]], now: Optional[datetime] = None):
+        """Rebuild the heap from (user_id, appointment) pairs; heapify is O(n)."""
+        now = now or datetime.now()
+        self._heap = []
+        self._entries = {}
+        dropped = 0
+        for user_id, appointment in appointments:
+            if appointment.reminded or appointment.starts_at <= now:
+                continue
+            entry = self._entry(user_id, appointment)
+            if entry[_DUE] <= now and self.catchup == "skip":
+                # Came due during downtime; the policy says not to send it late
+                appointment.reminded = True
+                entry[_ACTIVE] = False
+                del self._entries[(user_id, id(appointment))]
+                dropped += 1
+                continue
+            self._heap.append(entry)
+        heapq.heapify(self._heap)
+        logger.info(f"Rehydrated {len(self._heap)} pending reminders ({dropped} overdue skipped).")
+
+    def add(self, user_id: int, appointment):
+        heapq.heappush(self._heap, self._entry(user_id, appointment))
+
+    def cancel(self, user_id: int, appointment) -> bool:
+        entry = self._entries.pop((user_id, id(appointment)), None)
+        if entry is None:
+            return False
+        entry[_ACTIVE] = False
+        return True
+
+    def next_due(self) -> Optional[datetime]:
+        while self._heap and not self._heap[0][_ACTIVE]:
+            heapq.heappop(self._heap)
+        return self._heap[0][_DUE] if self._heap else None
+
+    def pop_due(self, now: Optional[datetime] = None, limit: Optional[int] = None) -> List[Tuple[int, object]]:
+        """Remove and return up to `limit` reminders that are due, soonest first."""
+        now = now or datetime.now()
+        due = []
+        while self._heap and self._heap[0][_DUE] <= now and (limit is None or len(due) < limit):
+            entry = heapq.heappop(self._heap)
+            if not entry[_ACTIVE]:
+                continue
+            del self._entries[(entry[_USER], id(entry[_APPOINTMENT]))]
+            appointment = entry[_APPOINTMENT]
+            # The appointment itself may be over if the reminder was due during downtime
+            if appointment.starts_at > now and not appointment.reminded:
+                due.append((entry[_USER], appointment))
+        return due
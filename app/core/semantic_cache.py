@@ -0,0 +1,204 @@
+import re
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+
+from core.constants import (
+    SEMANTIC_CACHE_DIM, SEMANTIC_CACHE_SIZE, SEMANTIC_CACHE_THRESHOLD
+)
+from core.matcher import ServiceMatcher, tokenize
+
+_WORD = re.compile(r"\w+")
+_DIGITS = re.compile(r"\d+")
+
+# Words that say what a question is after; "how much is" and "how long is" look alike otherwise
+_INTENT_WORDS = {
+    "price": {"price", "prices", "cost", "costs", "much", "сколько", "стоит", "стоимость", "цена", "цены"},
+    "duration": {"long", "time", "duration", "долго", "времени", "длится"},
+    "booking": {"book", "booking", "appointment", "free", "available", "записаться", "запишите", "запись"},
+}
+
+# The coarse vectors used to shortlist candidates are this many times smaller
+_FOLD = 4
+# How far below the threshold a coarse score may fall and still be re-ranked
+_COARSE_MARGIN = 0.15
+
+
+class HashingVectorizer:
+    """
+    Local text embedding: word unigrams and character trigrams hashed into a
+    fixed number of buckets, L2-normalized. No model download, no network.
+
+    Uses the built-in (per-process salted) str hash, so vectors are only
+    comparable within one process, which is all an in-memory cache needs.
+    """
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM, ngram: int = 3):
+        self.dim = dim
+        self.ngram = ngram
+
+    def _features(self, text: str) -> List[str]:
+        features = []
+        for word in _WORD.findall(text.lower()):
+            features.append(word)
+            padded = f" {word} "
+            features.extend(padded[i:i + self.ngram] for i in range(len(padded) - self.ngram + 1))
+        return features
+
+    def transform(self, text: str) -> np.ndarray:
+        features = self._features(text)
+        if not features:
+            return np.zeros(self.dim, dtype=np.float32)
+        hashes = np.fromiter(map(hash, features), dtype=np.int64, count=len(features))
+        # A high bit picks the sign so collisions cancel out instead of piling up
+        signs = np.where((hashes >> 40) & 1, 1.0, -1.0)
+        vector = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim).astype(np.float32)
+        return _normalize(vector)
+
+
+def question_signature(text: str, matcher: Optional[ServiceMatcher] = None) -> Tuple:
+    """
+    What two questions must have in common for one's answer to serve the
+    other, however similar they look otherwise: the same numbers (times,
+    prices, design numbers), the same kind of question (price, duration,
+    booking) and, given a matcher, the same service matches and the same
+    words from service names ("with" or "without" a card).
+    """
+    tokens = set(tokenize(text))
+    numbers = tuple(_DIGITS.findall(text))
+    intents = frozenset(intent for intent, words in _INTENT_WORDS.items() if tokens & words)
+    if matcher is None:
+        return numbers, intents
+    return (
+        numbers,
+        intents,
+        frozenset(match.service for match in matcher.find_all(text)),
+        frozenset(tokens & matcher.vocabulary),
+    )
+
+
+def _normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _fold(vector: np.ndarray) -> np.ndarray:
+    """Sum the vector's chunks into a shorter one that approximates its cosine."""
+    return _normalize(vector.reshape(_FOLD, -1).sum(axis=0))
+
+
+class _LanguagePartition:
+    """Ring buffer of question vectors and their answers for one language."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.capacity = capacity
+        # Storage doubles up to `capacity` instead of being allocated upfront
+        initial = min(capacity, 64)
+        self.vectors = np.zeros((initial, dim), dtype=np.float32)
+        self.coarse = np.zeros((initial, dim // _FOLD), dtype=np.float32)
+        # Signature hashes, to filter rows with one comparison; the signatures confirm a match
+        self.keys = np.zeros(initial, dtype=np.int64)
+        self.answers: List[Optional[Dict]] = []
+        self.signatures: List[Hashable] = []
+        self.size = 0
+        self.next = 0
+
+    def _grow(self):
+        rows = min(self.capacity, self.size * 2)
+        for name in ("vectors", "coarse"):
+            old = getattr(self, name)
+            grown = np.zeros((rows, old.shape[1]), dtype=np.float32)
+            grown[:self.size] = old
+            setattr(self, name, grown)
+        self.keys = np.concatenate([self.keys[:self.size], np.zeros(rows - self.size, dtype=np.int64)])
+
+    def add(self, vector: np.ndarray, signature: Hashable, answer: Dict):
+        if self.size < self.capacity:
+            if self.size == len(self.vectors):
+                self._grow()
+            self.answers.append(None)
+            self.signatures.append(None)
+            self.size += 1
+        # Once full, the oldest entry is overwritten (FIFO eviction)
+        self.vectors[self.next] = vector
+        self.coarse[self.next] = _fold(vector)
+        self.keys[self.next] = hash(signature)
+        self.answers[self.next] = answer
+        self.signatures[self.next] = signature
+        self.next = (self.next + 1) % self.capacity
+
+    def nearest(self, vector: np.ndarray, signature: Hashable, threshold: float):
+        """Best answer with the same signature and exact cosine >= threshold, or (None, best score)."""
+        rows = np.flatnonzero(self.keys[:self.size] == hash(signature))
+        if not len(rows):
+            return None, 0.0
+        # Shortlist on the small coarse matrix, then re-rank exactly
+        coarse_scores = self.coarse[rows] @ _fold(vector)
+        candidates = rows[coarse_scores >= threshold - _COARSE_MARGIN]
+        if not len(candidates):
+            return None, float(coarse_scores.max())
+        scores = self.vectors[candidates] @ vector
+        best_score = float(scores.max())
+        for best in np.argsort(-scores):
+            score = float(scores[best])
+            if score < threshold:
+                break
+            if self.signatures[candidates[best]] == signature:
+                return self.answers[candidates[best]], score
+        return None, best_score
+
+
+class SemanticCache:
+    """
+    Reuses an answer when a new question is close enough (cosine similarity)
+    to one already answered in the same language, and has the same
+    `signature` (see `question_signature`): closeness alone cannot tell
+    14:00 from 15:00, or a service with a membership card from one without.
+    """
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_size: int = SEMANTIC_CACHE_SIZE,
+                 vectorizer: Optional[HashingVectorizer] = None,
+                 signature: Callable[[str], Hashable] = question_signature):
+        self.threshold = threshold
+        self.max_size = max_size
+        self.vectorizer = vectorizer or HashingVectorizer()
+        self.signature = signature
+        self.hits = 0
+        self.misses = 0
+        self._partitions: Dict[str, _LanguagePartition] = {}
+
+    def __len__(self) -> int:
+        return sum(p.size for p in self._partitions.values())
+
+    def get(self, text: str, language: str) -> Optional[Dict]:
+        partition = self._partitions.get(language)
+        if partition is not None:
+            answer, _ = partition.nearest(
+                self.vectorizer.transform(text), self.signature(text), self.threshold
+            )
+            if answer is not None:
+                self.hits += 1
+                return dict(answer)
+        self.misses += 1
+        return None
+
+    def set(self, text: str, language: str, response: Dict):
+        partition = self._partitions.get(language)
+        if partition is None:
+            partition = self._partitions[language] = _LanguagePartition(
+                self.max_size, self.vectorizer.dim
+            )
+        partition.add(self.vectorizer.transform(text), self.signature(text), dict(response))
+
+    def clear(self):
+        self._partitions.clear()
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,271 @@
+import logging
+import os
+import tempfile
+from typing import Dict, Iterable, Optional
+
+import orjson
+from sqlalchemy import (
+    BigInteger, Boolean, Column, ForeignKey, Index, Integer, MetaData, String, Table,
+    create_engine, delete, event, func, inspect, select, text, update
+)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from core.constants import SESSION_BACKEND, SESSION_DB_URL, SESSION_FILE
+
+logger = logging.getLogger(__name__)
+
+
+class JsonSessionStore:
+    """All sessions in one JSON file, rewritten as a whole on every save."""
+
+    # Saving a single session still means rewriting the whole file. Stores that are
+    # not incremental only need load_all and save_all: SessionManager calls save and
+    # load (one user at a time) only when `incremental` is true.
+    incremental = False
+
+    def __init__(self, file_path: str = SESSION_FILE):
+        self.file_path = file_path
+
+    def load_all(self) -> Dict[int, dict]:
+        try:
+            with open(self.file_path, 'rb') as f:
+                return {int(user_id): data for user_id, data in orjson.loads(f.read()).items()}
+        except FileNotFoundError:
+            return {}
+
+    def save_all(self, sessions: Iterable[dict]):
+        payload = orjson.dumps(
+            {str(data["user_id"]): data for data in sessions},
+            option=orjson.OPT_INDENT_2  # Pretty-print for easier debugging
+        )
+        # Write next to the target and rename, so a crash never leaves a half-written file
+        directory = os.path.dirname(os.path.abspath(self.file_path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sessions-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+metadata = MetaData()
+
+sessions_table = Table(
+    "sessions", metadata,
+    Column("user_id", BigInteger, primary_key=True, autoincrement=False),
+    Column("language", String(8), nullable=False),
+    Column("selected_service", String),
+    Column("selected_date", String),
+    Column("selected_time", String),
+    Column("last_interaction", String, nullable=False),
+    Index("ix_sessions_last_interaction", "last_interaction"),
+)
+
+appointments_table = Table(
+    "appointments", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("user_id", BigInteger, ForeignKey("sessions.user_id"), nullable=False),
+    Column("service", String, nullable=False),
+    Column("date", String, nullable=False),
+    Column("time", String, nullable=False),
+    Column("reminded", Boolean, nullable=False, server_default="0"),
+    Index("ix_appointments_user_id", "user_id"),
+    Index("ix_appointments_date_time", "date", "time"),
+)
+
+# Salon-wide bookings per slot, shared by all worker processes. Keys use the same
+# strings as the appointments table.
+slot_bookings_table = Table(
+    "slot_bookings", metadata,
+    Column("date", String, primary_key=True),
+    Column("time", String, primary_key=True),
+    Column("booked", Integer, nullable=False, server_default="0"),
+)
+
+_SESSION_COLUMNS = ("language", "selected_service", "selected_date", "selected_time", "last_interaction")
+_APPOINTMENT_COLUMNS = ("service", "date", "time")
+
+
+class SqliteSessionStore:
+    """
+    Sessions and appointments in normalized SQLite tables.
+
+    Saving a session is one upsert plus a rewrite of that user's appointment
+    rows, so its cost does not depend on how many users exist. Dates and
+    times are stored as the same ISO strings UserSession.to_dict produces.
+
+    Several processes can share one database; slot bookings are claimed with
+    a compare-and-set update, so no two of them can overfill a slot.
+    """
+
+    incremental = True
+
+    def __init__(self, url: str = SESSION_DB_URL):
+        # Writers from other processes may hold the lock briefly; wait instead of failing
+        self.engine = create_engine(url, connect_args={"timeout": 30})
+        event.listen(self.engine, "connect", self._configure_connection)
+        metadata.create_all(self.engine)
+        self._migrate()
+
+    def _migrate(self):
+        """Add columns introduced after a database was first created."""
+        columns = {c["name"] for c in inspect(self.engine).get_columns("appointments")}
+        if "reminded" not in columns:
+            with self.engine.begin() as conn:
+                conn.execute(text("ALTER TABLE appointments ADD COLUMN reminded BOOLEAN NOT NULL DEFAULT 0"))
+
+    @staticmethod
+    def _configure_connection(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside the single writer; NORMAL sync is safe with WAL
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    def _write(self, conn, data: dict):
+        row = {column: data.get(column) for column in _SESSION_COLUMNS}
+        statement = sqlite_insert(sessions_table).values(user_id=data["user_id"], **row)
+        conn.execute(statement.on_conflict_do_update(index_elements=["user_id"], set_=row))
+        conn.execute(delete(appointments_table).where(appointments_table.c.user_id == data["user_id"]))
+        if data.get("appointments"):
+            conn.execute(appointments_table.insert(), [
+                {
+                    "user_id": data["user_id"],
+                    "reminded": bool(a.get("reminded", False)),
+                    **{c: a[c] for c in _APPOINTMENT_COLUMNS}
+                }
+                for a in data["appointments"]
+            ])
+
+    def save(self, data: dict):
+        with self.engine.begin() as conn:
+            self._write(conn, data)
+
+    def save_all(self, sessions: Iterable[dict]):
+        with self.engine.begin() as conn:
+            for data in sessions:
+                self._write(conn, data)
+
+    @staticmethod
+    def _to_dict(row, appointments) -> dict:
+        data = {"user_id": row.user_id}
+        data.update({column: getattr(row, column) for column in _SESSION_COLUMNS})
+        data["appointments"] = appointments
+        return data
+
+    def load(self, user_id: int) -> Optional[dict]:
+        with self.engine.connect() as conn:
+            row = conn.execute(
+                select(sessions_table).where(sessions_table.c.user_id == user_id)
+            ).first()
+            if row is None:
+                return None
+            appointments = conn.execute(
+                select(*[appointments_table.c[c] for c in _APPOINTMENT_COLUMNS + ("reminded",)])
+                .where(appointments_table.c.user_id == user_id)
+                .order_by(appointments_table.c.id)
+            ).mappings().all()
+        return self._to_dict(row, [dict(a) for a in appointments])
+
+    def load_all(self) -> Dict[int, dict]:
+        with self.engine.connect() as conn:
+            appointments: Dict[int, list] = {}
+            for a in conn.execute(select(appointments_table).order_by(appointments_table.c.id)):
+                appointments.setdefault(a.user_id, []).append(
+                    {c: getattr(a, c) for c in _APPOINTMENT_COLUMNS + ("reminded",)}
+                )
+            return {
+                row.user_id: self._to_dict(row, appointments.get(row.user_id, []))
+                for row in conn.execute(select(sessions_table))
+            }
+
+    def load_booked(self, since: str) -> Dict[int, dict]:
+        """Sessions with an appointment on or after `since`, i.e. the ones reminders and slots need."""
+        booked = select(appointments_table.c.user_id).where(appointments_table.c.date >= since)
+        with self.engine.connect() as conn:
+            appointments: Dict[int, list] = {}
+            for a in conn.execute(
+                select(appointments_table)
+                .where(appointments_table.c.user_id.in_(booked))
+                .order_by(appointments_table.c.id)
+            ):
+                appointments.setdefault(a.user_id, []).append(
+                    {c: getattr(a, c) for c in _APPOINTMENT_COLUMNS + ("reminded",)}
+                )
+            return {
+                row.user_id: self._to_dict(row, appointments.get(row.user_id, []))
+                for row in conn.execute(select(sessions_table).where(sessions_table.c.user_id.in_(booked)))
+            }
+
+    def reserve_slot(self, date: str, time: str, capacity: int) -> bool:
+        """Take one place in a slot unless `capacity` are already taken. Atomic across processes."""
+        with self.engine.begin() as conn:
+            conn.execute(
+                sqlite_insert(slot_bookings_table).values(date=date, time=time, booked=0)
+                .on_conflict_do_nothing()
+            )
+            result = conn.execute(
+                update(slot_bookings_table)
+                .where(
+                    slot_bookings_table.c.date == date,
+                    slot_bookings_table.c.time == time,
+                    slot_bookings_table.c.booked < capacity
+                )
+                .values(booked=slot_bookings_table.c.booked + 1)
+            )
+            return result.rowcount == 1
+
+    def release_slot(self, date: str, time: str):
+        with self.engine.begin() as conn:
+            conn.execute(
+                update(slot_bookings_table)
+                .where(
+                    slot_bookings_table.c.date == date,
+                    slot_bookings_table.c.time == time,
+                    slot_bookings_table.c.booked > 0
+                )
+                .values(booked=slot_bookings_table.c.booked - 1)
+            )
+
+    def slot_bookings(self, date: str) -> Dict[str, int]:
+        """{time: places taken} for one day."""
+        with self.engine.connect() as conn:
+            rows = conn.execute(
+                select(slot_bookings_table.c.time, slot_bookings_table.c.booked)
+                .where(slot_bookings_table.c.date == date)
+            )
+            return {row.time: row.booked for row in rows}
+
+    def rebuild_slot_bookings(self, since: str) -> int:
+        """Recount slot bookings from the appointments on or after `since`. Returns the slots counted."""
+        counted = (
+            select(appointments_table.c.date, appointments_table.c.time, func.count().label("booked"))
+            .where(appointments_table.c.date >= since)
+            .group_by(appointments_table.c.date, appointments_table.c.time)
+        )
+        with self.engine.begin() as conn:
+            conn.execute(delete(slot_bookings_table))
+            result = conn.execute(
+                slot_bookings_table.insert().from_select(["date", "time", "booked"], counted)
+            )
+            return result.rowcount
+
+    def import_json(self, file_path: str) -> int:
+        """One-shot import of a user_sessions.json file. Returns the number of sessions."""
+        sessions = JsonSessionStore(file_path).load_all()
+        self.save_all(sessions.values())
+        logger.info(f"Imported {len(sessions)} sessions from {file_path}.")
+        return len(sessions)
+
+
+def create_session_store(backend: str = SESSION_BACKEND):
+    if backend == "sqlite":
+        return SqliteSessionStore()
+    if backend == "json":
+        return JsonSessionStore()
+    raise ValueError(f"Unknown session backend: {backend}")
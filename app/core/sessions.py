@@ -0,0 +1,505 @@
+import asyncio
+import bisect
+import logging
+import sys
+import time as timer
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from core.constants import (
+    SESSION_EVICT_INTERVAL, SESSION_FLUSH_INTERVAL, SESSION_FLUSH_THRESHOLD, SESSION_IDLE_TTL,
+    SESSION_MAX_RESIDENT, SESSION_WRITE_BEHIND, WORKER_COUNT, WORKER_INDEX
+)
+from core.metrics import SESSION_FLUSH_ERRORS, SESSION_FLUSH_SECONDS, SESSION_FLUSH_SIZE
+from core.session_store import create_session_store
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=4096)
+def _parse_date(value: str) -> date:
+    return datetime.fromisoformat(value).date()
+
+
+@lru_cache(maxsize=1024)
+def _parse_time(value: str) -> time:
+    return time.fromisoformat(value)
+
+
+class Appointment:
+    """
+    A booked service. Date and time are parsed once, when loaded, and shared
+    between appointments on the same day or slot.
+    """
+
+    __slots__ = ("service", "key", "reminded")
+
+    def __init__(self, service: str, date: date, time: time, reminded: bool = False):
+        self.service = sys.intern(service)
+        self.key: Tuple[date, time] = (date, time)
+        self.reminded = reminded
+
+    @property
+    def date(self) -> date:
+        return self.key[0]
+
+    @property
+    def time(self) -> time:
+        return self.key[1]
+
+    @property
+    def starts_at(self) -> datetime:
+        return datetime.combine(self.date, self.time)
+
+    def to_dict(self) -> dict:
+        # Same strings as the original format: "2024-12-16T00:00:00" and "14:00:00"
+        data = {
+            "service": self.service,
+            "date": datetime.combine(self.date, time.min).isoformat(),
+            "time": self.time.isoformat(timespec="seconds")
+        }
+        # Only written once set, so files without reminders keep their old shape
+        if self.reminded:
+            data["reminded"] = True
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Appointment':
+        return cls(
+            data["service"], _parse_date(data["date"]), _parse_time(data["time"]),
+            bool(data.get("reminded", False))
+        )
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Appointment):
+            return NotImplemented
+        return (self.service, self.key) == (other.service, other.key)
+
+    def __repr__(self) -> str:
+        return f"Appointment({self.service!r}, {self.date.isoformat()}, {self.time.strftime('%H:%M')})"
+
+
+def as_date(value) -> date:
+    """The date of a date or datetime; booking flows keep the selected day as either."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+class UserSession:
+    """
+    Per-user state. Appointments are kept sorted by (date, time), with a
+    parallel list of their keys, so conflict checks and upcoming queries are
+    a binary search instead of a scan that re-parses every stored appointment.
+    """
+
+    __slots__ = (
+        "user_id", "language", "selected_service", "selected_date", "selected_time",
+        "last_interaction", "_appointments", "_keys"
+    )
+
+    def __init__(self, user_id: int, language: str = "en"):
+        self.user_id = user_id
+        self.language = language
+        self.selected_service = None
+        self.selected_date = None
+        self.selected_time = None
+        self.last_interaction = datetime.now()
+        self._appointments: List[Appointment] = []
+        self._keys: List[Tuple[date, time]] = []
+
+    @property
+    def appointments(self) -> List[Appointment]:
+        """Appointments sorted by date and time. Use add/remove_appointment to change them."""
+        return self._appointments
+
+    def to_dict(self) -> dict:
+        return {
+            "user_id": self.user_id,
+            "language": self.language,
+            "selected_service": self.selected_service,
+            "selected_date": self.selected_date.isoformat() if self.selected_date else None,
+            "selected_time": self.time_to_str(self.selected_time),
+            "last_interaction": self.last_interaction.isoformat(),
+            "appointments": [appointment.to_dict() for appointment in self._appointments]
+        }
+
+    def add_appointment(self, appointment: Appointment):
+        index = bisect.bisect_right(self._keys, appointment.key)
+        self._keys.insert(index, appointment.key)
+        self._appointments.insert(index, appointment)
+
+    def remove_appointment(self, service: str, date: date, time: time) -> bool:
+        """Remove every appointment for this service at this date and time."""
+        key = (as_date(date), time)
+        start = bisect.bisect_left(self._keys, key)
+        end = bisect.bisect_right(self._keys, key, lo=start)
+        kept = [a for a in self._appointments[start:end] if a.service != service]
+        if len(kept) == end - start:
+            return False
+        self._appointments[start:end] = kept
+        self._keys[start:end] = [a.key for a in kept]
+        return True
+
+    def contains(self, appointment: Appointment) -> bool:
+        """Whether this exact appointment object is still booked."""
+        start = bisect.bisect_left(self._keys, appointment.key)
+        end = bisect.bisect_right(self._keys, appointment.key, lo=start)
+        return any(a is appointment for a in self._appointments[start:end])
+
+    def has_appointment(self, date: date, time: time) -> bool:
+        """Check if the user has an appointment at the specified date and time."""
+        key = (as_date(date), time)
+        index = bisect.bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            logger.debug(f"Appointment conflict found: {self._appointments[index]} for user {self.user_id}.")
+            return True
+        return False
+
+    def upcoming(self, now: Optional[datetime] = None) -> List[Appointment]:
+        """Appointments that have not started yet, soonest first."""
+        now = now or datetime.now()
+        index = bisect.bisect_left(self._keys, (now.date(), now.time()))
+        return self._appointments[index:]
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'UserSession':
+        session = cls(data["user_id"], data["language"])
+        session.selected_service = data["selected_service"]
+        session.selected_date = datetime.fromisoformat(data["selected_date"]) if data["selected_date"] else None
+        
+        # Use str_to_time to parse the 'HH:MM:SS' string back into a time object
+        session.selected_time = cls.str_to_time(data["selected_time"])
+        session.last_interaction = datetime.fromisoformat(data["last_interaction"])
+        appointments = sorted((Appointment.from_dict(a) for a in data["appointments"]), key=lambda a: a.key)
+        session._appointments = appointments
+        session._keys = [a.key for a in appointments]
+        return session
+
+    @staticmethod
+    def time_to_str(t: Optional[time]) -> Optional[str]:
+        """Convert a time object to a 'HH:MM:SS' string."""
+        return t.strftime("%H:%M:%S") if t else None
+
+    @staticmethod
+    def str_to_time(s: Optional[str]) -> Optional[time]:
+        """Convert a 'HH:MM:SS' string to a time object."""
+        return _parse_time(s) if s else None
+
+
+class SessionManager:
+    """
+    Keeps user sessions in memory and persists them through a session store.
+
+    In write-behind mode (started with `start`), `save_session` only marks the
+    session dirty; a background task writes dirty sessions every
+    `flush_interval` seconds, or sooner once `flush_threshold` of them pile up,
+    with serialization and I/O in a worker thread. `stop` forces a final flush.
+
+    With a store that reads and writes one user at a time (sqlite) only a
+    working set is kept in memory: startup loads the sessions that still have
+    appointments ahead, `get_session` loads the others on first use
+    (`aget_session` reads them in a thread, off the event loop), and a
+    background task writes back and drops sessions idle for `idle_ttl`
+    seconds (and the least recently used beyond `max_resident`). Sessions
+    with upcoming appointments stay, since reminders and slot counts refer to
+    their appointment objects. The JSON store still loads everything.
+    """
+
+    def __init__(self, store=None, write_behind: bool = SESSION_WRITE_BEHIND,
+                 flush_interval: float = SESSION_FLUSH_INTERVAL,
+                 flush_threshold: int = SESSION_FLUSH_THRESHOLD,
+                 shard: Tuple[int, int] = (WORKER_INDEX, WORKER_COUNT),
+                 idle_ttl: float = SESSION_IDLE_TTL, max_resident: int = SESSION_MAX_RESIDENT,
+                 evict_interval: float = SESSION_EVICT_INTERVAL):
+        self.store = store or create_session_store()
+        # (index, count): with several workers this process only owns user_id % count == index
+        self.shard = shard
+        # Least recently used first
+        self.sessions: "OrderedDict[int, UserSession]" = OrderedDict()
+        self.lazy = self.store.incremental
+        self.idle_ttl = idle_ttl
+        self.max_resident = max_resident
+        self.evict_interval = evict_interval
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._evict_task: Optional[asyncio.Task] = None
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.flush_stats = {"flushes": 0, "last_duration": 0.0, "last_size": 0}
+        self._dirty: Dict[int, UserSession] = {}
+        # Last written state of every session, for stores that must rewrite them all
+        self._snapshots: Dict[int, dict] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_wakeup: Optional[asyncio.Event] = None
+        # Also held by eviction, which writes sessions too
+        self._flush_lock = asyncio.Lock()
+        self.load_sessions()
+
+    def start(self):
+        """Start the write-behind flusher and the idle session evictor on the running event loop."""
+        if self.lazy and self._evict_task is None:
+            self._evict_task = asyncio.get_running_loop().create_task(self._evict_loop())
+        if not self.write_behind or self._flush_task is not None:
+            return
+        self._flush_wakeup = asyncio.Event()
+        self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+        logger.info(f"Write-behind session persistence started (every {self.flush_interval}s).")
+
+    async def stop(self):
+        """Stop the flusher and evictor and write whatever is still dirty."""
+        if self._evict_task is not None:
+            self._evict_task.cancel()
+            try:
+                await self._evict_task
+            except asyncio.CancelledError:
+                pass
+            self._evict_task = None
+        if self._flush_task is None:
+            return
+        self._flush_task.cancel()
+        try:
+            await self._flush_task
+        except asyncio.CancelledError:
+            pass
+        self._flush_task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_wakeup.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Write all dirty sessions in one batch, off the event loop."""
+        if not self._dirty:
+            return
+        async with self._flush_lock:
+            dirty, self._dirty = self._dirty, {}
+            # Snapshot on the loop so the worker thread never sees a session mid-update
+            changed = [session.to_dict() for session in dirty.values()]
+            if self.store.incremental:
+                payload, write = changed, self.store.save_all
+            else:
+                for data in changed:
+                    self._snapshots[data["user_id"]] = data
+                payload, write = list(self._snapshots.values()), self.store.save_all
+
+            started = timer.perf_counter()
+            try:
+                await asyncio.to_thread(write, payload)
+            except Exception as e:
+                logger.error(f"Failed to flush {len(dirty)} sessions: {e}")
+                SESSION_FLUSH_ERRORS.inc()
+                for user_id, session in dirty.items():
+                    self._dirty.setdefault(user_id, session)
+                return
+            self.flush_stats["flushes"] += 1
+            self.flush_stats["last_duration"] = timer.perf_counter() - started
+            self.flush_stats["last_size"] = len(dirty)
+            SESSION_FLUSH_SECONDS.observe(self.flush_stats["last_duration"])
+            SESSION_FLUSH_SIZE.observe(len(dirty))
+            logger.debug(f"Flushed {len(dirty)} dirty sessions.")
+
+    async def _evict_loop(self):
+        while True:
+            await asyncio.sleep(self.evict_interval)
+            try:
+                await self.evict_idle()
+            except Exception as e:
+                logger.error(f"Failed to evict idle sessions: {e}")
+
+    def _idle(self, now: datetime) -> List[UserSession]:
+        """Sessions to evict, least recently used first. Ones that must stay move to the back."""
+        cutoff = now - timedelta(seconds=self.idle_ttl) if self.idle_ttl > 0 else None
+        excess = len(self.sessions) - self.max_resident if self.max_resident > 0 else 0
+        victims, kept = [], []
+        for user_id, session in self.sessions.items():
+            if len(victims) >= excess and (cutoff is None or session.last_interaction >= cutoff):
+                break  # Everyone behind was used more recently
+            if user_id in self._dirty or session.upcoming(now):
+                kept.append(user_id)
+            else:
+                victims.append(session)
+        for user_id in kept:
+            self.sessions.move_to_end(user_id)
+        return victims
+
+    async def evict_idle(self, now: Optional[datetime] = None) -> int:
+        """
+        Write idle sessions back to the store and drop them from memory; they
+        are loaded again on next use. Returns how many were dropped.
+        """
+        if not self.lazy:
+            return 0
+        # Not during a flush, which could land after this write with older state
+        async with self._flush_lock:
+            victims = self._idle(now or datetime.now())
+            if not victims:
+                return 0
+            touched = [session.last_interaction for session in victims]
+            payload = [session.to_dict() for session in victims]
+            try:
+                await asyncio.to_thread(self.store.save_all, payload)
+            except Exception as e:
+                logger.error(f"Failed to write {len(victims)} idle sessions, keeping them: {e}")
+                return 0
+            evicted = 0
+            for session, last_interaction in zip(victims, touched):
+                # Used, and maybe changed, while it was being written
+                if session.last_interaction != last_interaction or session.user_id in self._dirty:
+                    continue
+                if self.sessions.get(session.user_id) is session:
+                    del self.sessions[session.user_id]
+                    evicted += 1
+        self.evictions += evicted
+        logger.debug(f"Evicted {evicted} idle sessions, {len(self.sessions)} resident.")
+        return evicted
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "resident": len(self.sessions),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _resident(self, user_id: int) -> Optional[UserSession]:
+        """The user's session if it is in memory, counting the hit or miss."""
+        session = self.sessions.get(user_id)
+        if session is not None:
+            self.hits += 1
+            self.sessions.move_to_end(user_id)
+        else:
+            self.misses += 1
+        return session
+
+    def _loaded(self, user_id: int, data: Optional[dict]) -> Optional[UserSession]:
+        # Created or loaded by someone else while the store was being read
+        session = self.sessions.get(user_id)
+        if session is not None or data is None:
+            return session
+        session = self.sessions[user_id] = UserSession.from_dict(data)
+        return session
+
+    def _find(self, user_id: int) -> Optional[UserSession]:
+        """The user's session, from memory or else the store; None for a new user."""
+        session = self._resident(user_id)
+        if session is not None or not self.lazy:
+            return session
+        return self._loaded(user_id, self.store.load(user_id))
+
+    async def _afind(self, user_id: int) -> Optional[UserSession]:
+        """_find for the event loop: the store is read in a thread."""
+        session = self._resident(user_id)
+        if session is not None or not self.lazy:
+            return session
+        return self._loaded(user_id, await asyncio.to_thread(self.store.load, user_id))
+
+    def _touch(self, user_id: int, session: Optional[UserSession]) -> UserSession:
+        if session is None:
+            session = self.sessions[user_id] = UserSession(user_id)
+        session.last_interaction = datetime.now()
+        return session
+
+    def get_session(self, user_id: int) -> UserSession:
+        return self._touch(user_id, self._find(user_id))
+
+    async def aget_session(self, user_id: int) -> UserSession:
+        """get_session for the event loop; handlers use this one."""
+        return self._touch(user_id, await self._afind(user_id))
+
+    def save_session(self, session: UserSession):
+        """Persist one user's session; only the JSON backend has to rewrite everything."""
+        if self._flush_task is not None:
+            self._dirty[session.user_id] = session
+            if len(self._dirty) >= self.flush_threshold:
+                self._flush_wakeup.set()
+            return
+        if not self.store.incremental:
+            self.save_sessions()
+            return
+        try:
+            self.store.save(session.to_dict())
+            logger.debug(f"Session of user {session.user_id} saved.")
+        except Exception as e:
+            logger.error(f"Failed to save session of user {session.user_id}: {e}")
+
+    def save_sessions(self):
+        try:
+            data = [session.to_dict() for session in self.sessions.values()]
+            self.store.save_all(data)
+            if not self.store.incremental:
+                self._snapshots = {d["user_id"]: d for d in data}
+            logger.info(f"User sessions saved ({len(self.sessions)}).")
+        except Exception as e:
+            logger.error(f"Failed to save user sessions: {e}")
+
+    def owns(self, user_id: int) -> bool:
+        index, count = self.shard
+        return user_id % count == index
+
+    def load_sessions(self):
+        if self.lazy:
+            # Everyone else is loaded on first use
+            data = self.store.load_booked(since=datetime.combine(date.today(), time.min).isoformat())
+        else:
+            data = self.store.load_all()
+        if self.shard[1] > 1:
+            data = {user_id: d for user_id, d in data.items() if self.owns(user_id)}
+        self.sessions = OrderedDict(
+            (user_id, UserSession.from_dict(session_data))
+            for user_id, session_data in data.items()
+        )
+        if not self.store.incremental:
+            self._snapshots = data
+
+    def iter_booked(self) -> Iterator[Tuple[int, Appointment]]:
+        """
+        (user_id, appointment) for every appointment of every session in memory:
+        all of them with the JSON store, every one still ahead with sqlite.
+        """
+        # A copy: get_session reorders sessions while callers iterate
+        for user_id, session in list(self.sessions.items()):
+            for appointment in session.appointments:
+                yield user_id, appointment
+
+    def iter_appointments(self) -> Iterator[Appointment]:
+        """Every appointment of every session in memory, as in `iter_booked`."""
+        for _, appointment in self.iter_booked():
+            yield appointment
+
+    def delete_appointment(self, user_id: int, service: str, date: str, time: str) -> bool:
+        """
+        Delete an appointment for a specific user.
+        
+        Args:
+            user_id (int): The user's ID.
+            service (str): The name of the service.
+            date (str): The date of the appointment (ISO format).
+            time (str): The time of the appointment (HH:MM:SS format).
+        
+        Returns:
+            bool: True if the appointment was deleted, False if it wasn't found.
+        """
+        session = self._find(user_id)
+        if session is None:
+            logger.warning(f"User {user_id} not found in sessions.")
+            return False
+
+        target = Appointment.from_dict({"service": service, "date": date, "time": time})
+        if session.remove_appointment(target.service, target.date, target.time):
+            self.save_session(session)
+            logger.info(f"Deleted appointment for user {user_id}: {service} on {date} at {time}.")
+            return True
+        else:
+            logger.warning(f"No matching appointment found for user {user_id}: {service} on {date} at {time}.")
+            return False
@@ -0,0 +1,81 @@
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from core.constants import STREAM_EDIT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Telegram rejects messages longer than this
+MAX_MESSAGE_LENGTH = 4096
+
+
+class StreamingReply:
+    """
+    Shows a streamed LLM reply in one Telegram message.
+
+    The first chunk is sent as a reply right away; later text replaces it
+    with edit_message_text, at most once per `min_interval` seconds so the
+    chat stays within Telegram's edit rate limits. `finish` always leaves the
+    complete text in the message; it only waits for the interval when an edit
+    has already been made, so a reply that arrived in one piece is completed
+    right away.
+    """
+
+    def __init__(self, reply_to: Message, min_interval: float = STREAM_EDIT_INTERVAL):
+        self.reply_to = reply_to
+        self.min_interval = min_interval
+        self.message: Optional[Message] = None
+        self._shown = ""
+        self._next_edit = 0.0
+        self._edited = False
+
+    async def update(self, text: str):
+        """Show the text received so far, unless an edit was made too recently."""
+        text = text[:MAX_MESSAGE_LENGTH]
+        if not text.strip() or text == self._shown:
+            return
+        if self.message is not None and time.monotonic() < self._next_edit:
+            return
+        try:
+            await self._show(text)
+        except RetryAfter as e:
+            # Skip intermediate updates until Telegram lets us edit again
+            self._next_edit = time.monotonic() + e.retry_after
+            logger.warning(f"Streaming edit throttled by Telegram for {e.retry_after}s.")
+
+    async def finish(self, text: str):
+        """Make sure the message ends up with the complete text."""
+        text = text[:MAX_MESSAGE_LENGTH]
+        if self.message is None:
+            self.message = await self.reply_to.reply_text(text)
+            self._shown = text
+            return
+        if text == self._shown:
+            return
+        delay = self._next_edit - time.monotonic()
+        if self._edited and delay > 0:
+            await asyncio.sleep(delay)
+        try:
+            await self._show(text)
+        except RetryAfter as e:
+            await asyncio.sleep(e.retry_after)
+            await self._show(text)
+
+    async def _show(self, text: str):
+        if self.message is None:
+            self.message = await self.reply_to.reply_text(text)
+        else:
+            try:
+                await self.message.edit_text(text)
+                self._edited = True
+            except BadRequest as e:
+                # Raised when the text did not actually change
+                if "not modified" not in str(e).lower():
+                    raise
+        self._shown = text
+        self._next_edit = time.monotonic() + self.min_interval
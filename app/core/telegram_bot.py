@@ -1,6 +1,8 @@
+import asyncio
 import datetime
-from datetime import timedelta, datetime, time
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from datetime import datetime
+from telegram import Bot, Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import Forbidden
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,14 +15,21 @@ from telegram.ext import (
 )
 import logging
 import os
-import json
 # import pytz
 from dotenv import load_dotenv
 from typing import Dict, Optional
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Import our beauty service bot
+from core.availability import SharedSlotAvailability, SlotAvailability
 from core.chatbot import BeautyServiceBot
+from core.concurrency import PerUserUpdateProcessor, update_slot_released
+from core.keyboards import KeyboardCache
+from core.metrics import REGISTRY, serve_metrics, timed
+from core.outbound import BULK, INTERACTIVE, OutboundQueue
+from core.reminders import ReminderScheduler
+from core.sessions import Appointment, SessionManager
+from core.streaming import StreamingReply
 
 # Load environment variables
 load_dotenv()
@@ -35,139 +44,22 @@ logger = logging.getLogger(__name__)
 # States for conversation handler
 from core.constants import (
     CHOOSING, BOOKING_SERVICE, BOOKING_DATE, BOOKING_TIME, 
-    BOOKING_CONFIRM, SELECTING_LANGUAGE
+    BOOKING_CONFIRM, SELECTING_LANGUAGE, LLM_STREAMING,
+    REMINDER_BATCH_SIZE, REMINDER_TICK, BOT_MODE, WEBHOOK_QUEUE_SIZE, WORKER_COUNT,
+    METRICS_LISTEN, METRICS_PORT
 )
 
-class UserSession:
-    def __init__(self, user_id: int, language: str = "en"):
-        self.user_id = user_id
-        self.language = language
-        self.selected_service = None
-        self.selected_date = None
-        self.selected_time = None
-        self.last_interaction = datetime.now()
-        self.appointments = []
-
-    def to_dict(self) -> dict:
-        return {
-            "user_id": self.user_id,
-            "language": self.language,
-            "selected_service": self.selected_service,
-            "selected_date": self.selected_date.isoformat() if self.selected_date else None,
-            "selected_time": self.time_to_str(self.selected_time),
-            "last_interaction": self.last_interaction.isoformat(),
-            "appointments": self.appointments
-        }
-
-    def has_appointment(self, date: datetime.date, time: datetime.time) -> bool:
-        """Check if the user has an appointment at the specified date and time."""
-        for appointment in self.appointments:
-            appointment_date = datetime.fromisoformat(appointment["date"]).date()
-            appointment_time = datetime.strptime(appointment["time"], "%H:%M:%S").time()
-            if appointment_date == date and appointment_time == time:
-                logger.debug(f"Appointment conflict found: {appointment} for user {self.user_id}.")
-                return True
-        return False
-
-    def delete_appointment(self, user_id: int, service: str, date: str, time: str) -> bool:
-        """
-        Delete an appointment for a specific user.
-        
-        Args:
-            user_id (int): The user's ID.
-            service (str): The name of the service.
-            date (str): The date of the appointment (ISO format).
-            time (str): The time of the appointment (HH:MM:SS format).
-        
-        Returns:
-            bool: True if the appointment was deleted, False if it wasn't found.
-        """
-        if user_id not in self.sessions:
-            logger.warning(f"User {user_id} not found in sessions.")
-            return False
-
-        session = self.sessions[user_id]
-        original_count = len(session.appointments)
-        session.appointments = [
-            appointment for appointment in session.appointments
-            if not (
-                appointment["service"] == service and
-                appointment["date"] == date and
-                appointment["time"] == time
-            )
-        ]
-
-        if len(session.appointments) < original_count:
-            self.save_sessions()
-            logger.info(f"Deleted appointment for user {user_id}: {service} on {date} at {time}.")
-            return True
-        else:
-            logger.warning(f"No matching appointment found for user {user_id}: {service} on {date} at {time}.")
-            return False
-
-
-    @classmethod
-    def from_dict(cls, data: dict) -> 'UserSession':
-        session = cls(data["user_id"], data["language"])
-        session.selected_service = data["selected_service"]
-        session.selected_date = datetime.fromisoformat(data["selected_date"]) if data["selected_date"] else None
-        
-        # Use str_to_time to parse the 'HH:MM:SS' string back into a time object
-        session.selected_time = cls.str_to_time(data["selected_time"])
-        session.last_interaction = datetime.fromisoformat(data["last_interaction"])
-        session.appointments = data["appointments"]
-        return session
-
-    @staticmethod
-    def time_to_str(t: Optional[time]) -> Optional[str]:
-        """Convert a time object to a 'HH:MM:SS' string."""
-        return t.strftime("%H:%M:%S") if t else None
-
-    @staticmethod
-    def str_to_time(s: Optional[str]) -> Optional[time]:
-        """Convert a 'HH:MM:SS' string to a time object."""
-        return datetime.strptime(s, "%H:%M:%S").time() if s else None
-
-class SessionManager:
-    def __init__(self, file_path: str = "user_sessions.json"):
-        self.file_path = file_path
-        self.sessions: Dict[int, UserSession] = {}
-        self.load_sessions()
-
-    def get_session(self, user_id: int) -> UserSession:
-        if user_id not in self.sessions:
-            self.sessions[user_id] = UserSession(user_id)
-        return self.sessions[user_id]
-
-    def save_sessions(self):
-        try:
-            with open(self.file_path, 'w') as f:
-                json.dump({
-                    str(user_id): session.to_dict()
-                    for user_id, session in self.sessions.items()
-                }, f, indent=4)  # Pretty-print for easier debugging
-            logger.info(f"User sessions saved to {self.file_path}.")
-        except Exception as e:
-            logger.error(f"Failed to save user sessions: {e}")
-
+# Reply-keyboard buttons; their labels in every language dispatch to a menu action
+MENU_KEYS = ("book_service", "services", "prices", "help", "check_appointments", "cancel_appointment")
 
-    # def save_sessions(self):
-    #     with open(self.file_path, 'w') as f:
-    #         json.dump({
-    #             str(user_id): session.to_dict()
-    #             for user_id, session in self.sessions.items()
-    #         }, f)
-
-    def load_sessions(self):
-        try:
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-                self.sessions = {
-                    int(user_id): UserSession.from_dict(session_data)
-                    for user_id, session_data in data.items()
-                }
-        except FileNotFoundError:
-            self.sessions = {}
+HELP_TEXT = (
+    "Here is how you can use this bot:\n"
+    "- Book a service: Choose 'Book Service'\n"
+    "- View available services: Choose 'Services'\n"
+    "- View prices: Choose 'Prices'\n"
+    "- Need help: Choose 'Help'\n\n"
+    "You can also ask me any questions related to beauty services."
+)
 
 class Translations:
     def __init__(self):
@@ -192,7 +84,8 @@ class Translations:
                 "no_appointments_to_cancel": "You have no appointments to cancel.",
                 "select_appointment_to_cancel": "Please select the appointment you want to cancel:",
                 "appointment_cancelled": "Your appointment for {} on {} at {} has been cancelled.",
-                "cancellation_confirmed": "✅ Appointment cancelled."
+                "cancellation_confirmed": "✅ Appointment cancelled.",
+                "slot_unavailable": "Sorry, this time has just been booked. Please choose another one:"
             },
             "ru": {
                 "welcome": "👋 Привет {}! Я Анна, ваш персональный консультант по красоте.",
@@ -214,7 +107,8 @@ class Translations:
                 "no_appointments_to_cancel": "У вас нет записей для отмены.",
                 "select_appointment_to_cancel": "Пожалуйста, выберите запись для отмены:",
                 "appointment_cancelled": "Ваша запись на {} {} в {} была отменена.",
-                "cancellation_confirmed": "✅ Запись отменена."
+                "cancellation_confirmed": "✅ Запись отменена.",
+                "slot_unavailable": "К сожалению, это время уже заняли. Пожалуйста, выберите другое:"
             }
         }
 
@@ -222,6 +116,16 @@ class Translations:
         translation = self.translations.get(lang, self.translations["en"]).get(key, "")
         return translation.format(*args) if args else translation
 
+    def reverse_index(self, keys) -> Dict[str, str]:
+        """{label: key} for the given keys, over every language."""
+        index = {}
+        for lang, strings in self.translations.items():
+            for key in keys:
+                label = strings.get(key)
+                if label and index.setdefault(label, key) != key:
+                    raise ValueError(f"Label {label!r} ({lang}) is used for both {index[label]} and {key}")
+        return index
+
 class AnnaTelegramBot:
     def __init__(self):
         self.beauty_bot = BeautyServiceBot(api_key=os.getenv("GEMINI_API_KEY"))
@@ -233,24 +137,91 @@ class AnnaTelegramBot:
             "09:00", "10:00", "11:00", "12:00", "13:00", 
             "14:00", "15:00", "16:00", "17:00", "18:00"
         ]
+        if WORKER_COUNT > 1:
+            # Other workers book too: slot counts live in the shared store
+            self.availability = SharedSlotAvailability(self.session_manager.store, self.time_slots)
+        else:
+            self.availability = SlotAvailability(self.time_slots)
+        self.availability.rebuild(
+            self.session_manager.iter_appointments(), since=datetime.now().date()
+        )
+        # Pending reminders are derived from the stored appointments, so they survive restarts
+        self.reminders = ReminderScheduler()
+        self.reminders.rehydrate(self.session_manager.iter_booked())
+        self.outbound = OutboundQueue()
+        self.keyboards = KeyboardCache(self.beauty_bot.catalog, self.availability)
+
+        # Menu label (any language) -> handler, so a button press is one dict lookup
+        actions = {
+            "book_service": self.handle_booking_service,
+            "services": self.show_services,
+            "prices": self.show_prices,
+            "help": self.show_help,
+            "check_appointments": self.check_appointments,
+            "cancel_appointment": self.cancel_appointment,
+        }
+        self.menu_actions = {
+            label: actions[key] for label, key in self.translations.reverse_index(MENU_KEYS).items()
+        }
+        self._metrics_runner = None
+        self._register_metrics()
+
+    def _register_metrics(self):
+        """Gauges and counters read from the components only when /metrics is scraped."""
+        caches = {
+            "response": self.beauty_bot.response_cache,
+            "semantic": self.beauty_bot.semantic_cache,
+            "keyboards": self.keyboards,
+            "sessions": self.session_manager,
+        }
+        REGISTRY.collected(
+            "anna_cache_hits_total", "Cache lookups that were answered from the cache.", "counter",
+            lambda: {(name,): cache.hits for name, cache in caches.items()}, ("cache",)
+        )
+        REGISTRY.collected(
+            "anna_cache_misses_total", "Cache lookups that were not.", "counter",
+            lambda: {(name,): cache.misses for name, cache in caches.items()}, ("cache",)
+        )
+        REGISTRY.collected(
+            "anna_session_flushes_total", "Write-behind session flushes.", "counter",
+            lambda: self.session_manager.flush_stats["flushes"]
+        )
+        REGISTRY.collected(
+            "anna_sessions", "User sessions held in memory.", "gauge",
+            lambda: len(self.session_manager.sessions)
+        )
+        REGISTRY.collected(
+            "anna_session_evictions_total", "Idle sessions dropped from memory, to be reloaded on use.",
+            "counter", lambda: self.session_manager.evictions
+        )
+        REGISTRY.collected(
+            "anna_reminders_pending", "Appointment reminders waiting to be sent.", "gauge",
+            lambda: len(self.reminders)
+        )
+        REGISTRY.collected(
+            "anna_outbound_queue_depth", "Messages waiting in the outbound queue.", "gauge",
+            lambda: {
+                ("interactive",): self.outbound.depth[INTERACTIVE], ("bulk",): self.outbound.depth[BULK]
+            },
+            ("priority",)
+        )
+        REGISTRY.collected(
+            "anna_outbound_messages_total", "Outbound messages by how they ended.", "counter",
+            lambda: {
+                ("sent",): self.outbound.sent, ("retried",): self.outbound.retries,
+                ("failed",): self.outbound.failed
+            },
+            ("result",)
+        )
 
     def create_date_keyboard(self) -> InlineKeyboardMarkup:
-        """Create keyboard with available dates (next 7 days)."""
-        keyboard = []
-        today = datetime.now()
-        
-        for i in range(7):
-            date = today + timedelta(days=i)
-            date_str = date.strftime("%Y-%m-%d")
-            display_str = date.strftime("%A, %b %d")
-            keyboard.append([InlineKeyboardButton(display_str, callback_data=f"date_{date_str}")])
-            
-        return InlineKeyboardMarkup(keyboard)
+        """Keyboard with the next 7 days."""
+        return self.keyboards.dates()
 
     async def start_booking_flow(self, update: Update, context: ContextTypes.DEFAULT_TYPE, service: str):
         """Start the booking flow for a specific service."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
 
         # Set the selected service
         session.selected_service = service
@@ -262,71 +233,58 @@ class AnnaTelegramBot:
         )
 
 
+    @timed("handle_message")
     async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         text = update.message.text
         
-        # Compare the user's input with translated menu options.
-        # If the user chooses "Book Service" (translated according to language), move to booking service.
-        if text == self.translations.get("book_service", session.language):
-            # Proceed to service booking flow
-            await self.handle_booking_service(update, context)
-            return BOOKING_SERVICE
-        
-        elif text == self.translations.get("services", session.language):
-            # Show a list of services or provide more info
-            services_list = self.beauty_bot.list_services()
-            services_text = "\n".join([f"- {s.title()}" for s in services_list])
-            await update.message.reply_text(services_text)
-            return CHOOSING
-        
-        elif text == self.translations.get("prices", session.language):
-            # Show price list for services
-            prices_text = []
-            for s in self.beauty_bot.list_services():
-                info = self.beauty_bot.get_service_info(s)
-                prices_text.append(f"{s.title()}: {info['price_from']}")
-            await update.message.reply_text("\n".join(prices_text))
-            return CHOOSING
-        
-        elif text == self.translations.get("help", session.language):
-            # Show help or instructions
-            help_text = (
-                "Here is how you can use this bot:\n"
-                "- Book a service: Choose 'Book Service'\n"
-                "- View available services: Choose 'Services'\n"
-                "- View prices: Choose 'Prices'\n"
-                "- Need help: Choose 'Help'\n\n"
-                "You can also ask me any questions related to beauty services."
-            )
-            await update.message.reply_text(help_text)
-            return CHOOSING
+        action = self.menu_actions.get(text)
+        if action is not None:
+            return await action(update, context)
+
+        # Not a menu button: let the LLM answer. Waiting for it takes no update
+        # slot, so other users' menus and bookings are not queued behind LLM calls
+        if LLM_STREAMING:
+            reply = StreamingReply(update.message)
+            async with update_slot_released():
+                response = await self.beauty_bot.aprocess_message(
+                    text, language=session.language, user_id=user.id, on_chunk=reply.update
+                )
+                # May wait out the edit interval, which needs no slot either
+                await reply.finish(response["text"])
+        else:
+            async with update_slot_released():
+                response = await self.beauty_bot.aprocess_message(
+                    text, language=session.language, user_id=user.id
+                )
+            await update.message.reply_text(response["text"])
 
-        elif text == self.translations.get("check_appointments", session.language):
-            await self.check_appointments(update, context)
-            return CHOOSING
+        # Handle booking action
+        if response.get("action") and response["action"]["type"] == "book":
+            session.selected_service = response["action"]["service"]
+            await self.start_booking_flow(update, context, session.selected_service)
+            return BOOKING_DATE
+        return CHOOSING
 
-        elif text == self.translations.get("cancel_appointment", session.language):
-            await self.cancel_appointment(update, context)
-            return CHOOSING
+    async def show_services(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        session = await self.session_manager.aget_session(update.effective_user.id)
+        await update.message.reply_text(self.beauty_bot.catalog.services_text(session.language))
+        return CHOOSING
 
-        else:
-            # If it's not one of the menu commands, let's try the LLM for a helpful response.
-            response = self.beauty_bot.process_message(text, language=session.language)
-            await update.message.reply_text(response["text"])
+    async def show_prices(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        session = await self.session_manager.aget_session(update.effective_user.id)
+        await update.message.reply_text(self.beauty_bot.catalog.prices_text(session.language))
+        return CHOOSING
 
-            # Handle booking action
-            if response.get("action") and response["action"]["type"] == "book":
-                session.selected_service = response["action"]["service"]
-                await self.start_booking_flow(update, context, session.selected_service)
-                return BOOKING_DATE
-            return CHOOSING
+    async def show_help(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+        await update.message.reply_text(HELP_TEXT)
+        return CHOOSING
 
     async def cancel_appointment(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle appointment cancellation."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
 
         if not session.appointments:
             await update.message.reply_text(
@@ -339,7 +297,7 @@ class AnnaTelegramBot:
         for i, appointment in enumerate(session.appointments):
             keyboard.append([
                 InlineKeyboardButton(
-                    f"{appointment['service']} on {appointment['date']} at {appointment['time']}",
+                    f"{appointment.service} on {appointment.date.isoformat()} at {appointment.time.strftime('%H:%M')}",
                     callback_data=f"cancel_{i}"
                 )
             ])
@@ -356,16 +314,17 @@ class AnnaTelegramBot:
     async def check_appointments(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle checking of appointments."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
 
-        if not session.appointments:
+        upcoming = session.upcoming()
+        if not upcoming:
             await update.message.reply_text(
                 self.translations.get("no_appointments", session.language)
             )
         else:
             appointments = "\n".join([
-                f"- {a['service']} on {a['date']} at {a['time']}"
-                for a in session.appointments
+                f"- {a.service} on {a.date.isoformat()} at {a.time.strftime('%H:%M')}"
+                for a in upcoming
             ])
             await update.message.reply_text(
                 self.translations.get("appointments_list", session.language, appointments)
@@ -373,36 +332,18 @@ class AnnaTelegramBot:
 
         return CHOOSING
 
-    def create_time_keyboard(self, date_str: str) -> InlineKeyboardMarkup:
-        """Create keyboard with available time slots."""
-        keyboard = []
-        selected_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-        
-        # If it's today, only show future time slots
-        if selected_date == datetime.now().date():
-            current_hour = datetime.now().hour
-            available_slots = [slot for slot in self.time_slots 
-                                if int(slot.split(":")[0]) > current_hour]
-        else:
-            available_slots = self.time_slots
-
-        # Create rows of 3 time slots each
-        row = []
-        for slot in available_slots:
-            row.append(InlineKeyboardButton(slot, callback_data=f"time_{slot}"))
-            if len(row) == 3:
-                keyboard.append(row)
-                row = []
-        
-        if row:  # Add any remaining slots
-            keyboard.append(row)
-            
-        return InlineKeyboardMarkup(keyboard)
+    async def create_time_keyboard(self, day) -> InlineKeyboardMarkup:
+        """Keyboard with the time slots of `day` that still have room."""
+        if self.availability.stale(day):
+            # Other workers' bookings; a changed count makes the cached keyboard miss
+            await self.availability.arefresh(day)
+        return self.keyboards.times(day)
 
+    @timed("start")
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Send welcome message and initialize user session."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         
         # Language selection keyboard
         keyboard = [
@@ -417,17 +358,18 @@ class AnnaTelegramBot:
         
         return SELECTING_LANGUAGE
 
+    @timed("set_language")
     async def set_language(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Set user's preferred language."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         
         if "English" in update.message.text:
             session.language = "en"
         else:
             session.language = "ru"
         
-        self.session_manager.save_sessions()
+        self.session_manager.save_session(session)
         
         # Create main menu keyboard
         keyboard = [
@@ -447,9 +389,10 @@ class AnnaTelegramBot:
         
         return CHOOSING
 
+    @timed("cancel")
     async def cancel(self, update:  Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         await update.message.reply_text("Conversation cancelled.")
         return ConversationHandler.END
 
@@ -457,10 +400,10 @@ class AnnaTelegramBot:
     async def suggest_time_slots(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Suggest time slots for the selected date."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
 
         # Create time slot buttons
-        reply_markup = self.create_time_keyboard(session.selected_date.strftime("%Y-%m-%d"))
+        reply_markup = await self.create_time_keyboard(session.selected_date)
 
         # Use callback_query if available, otherwise use message
         if update.callback_query:
@@ -475,18 +418,19 @@ class AnnaTelegramBot:
             )
 
 
+    async def show_slot_unavailable(self, query, session):
+        """Tell the user the chosen slot is taken and offer the remaining ones."""
+        await query.edit_message_text(
+            text=self.translations.get("slot_unavailable", session.language),
+            reply_markup=await self.create_time_keyboard(session.selected_date)
+        )
+
     async def handle_booking_service(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle service selection for booking."""
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         
-        keyboard = []
-        for service in self.beauty_bot.list_services():
-            info = self.beauty_bot.get_service_info(service)
-            display_text = f"{service.title()} ({info['price_from']})"
-            keyboard.append([InlineKeyboardButton(display_text, callback_data=f"service_{service}")])
-            
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = self.keyboards.services(session.language)
         await update.message.reply_text(
             self.translations.get("select_service", session.language),
             reply_markup=reply_markup
@@ -494,18 +438,22 @@ class AnnaTelegramBot:
         
         return BOOKING_SERVICE
 
+    @timed("handle_booking_callback")
     async def handle_booking_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         """Handle callback queries from inline keyboards during booking."""
         query = update.callback_query
         await query.answer()
         
         user = update.effective_user
-        session = self.session_manager.get_session(user.id)
+        session = await self.session_manager.aget_session(user.id)
         
         data = query.data
         
         if data.startswith("service_"):
-            session.selected_service = data.replace("service_", "")
+            # Buttons carry the service id; names are still accepted from older keyboards
+            value = data.replace("service_", "")
+            service = self.beauty_bot.catalog.get_by_id(value) or self.beauty_bot.catalog.get(value)
+            session.selected_service = service["name"] if service else value
             await query.edit_message_text(
                 text=self.translations.get("select_date", session.language),
                 reply_markup=self.create_date_keyboard()
@@ -534,6 +482,10 @@ class AnnaTelegramBot:
                     logger.info(f"Double booking prevented for user {session.user_id} on {session.selected_date} at {selected_time}.")
                     return BOOKING_TIME
 
+                if not self.availability.is_free(session.selected_date, selected_time):
+                    await self.show_slot_unavailable(query, session)
+                    return BOOKING_TIME
+
                 # Proceed to confirmation
                 confirmation_text = self.translations.get(
                     "booking_confirmation",
@@ -557,6 +509,11 @@ class AnnaTelegramBot:
             
         elif data.startswith("confirm_"):
             if data == "confirm_yes":
+                if not (session.selected_service and session.selected_date and session.selected_time):
+                    # A repeated tap on a confirmation that was already handled
+                    logger.info(f"Ignoring stale booking confirmation from user {session.user_id}.")
+                    return CHOOSING
+
                 if session.has_appointment(session.selected_date, session.selected_time):
                     await query.edit_message_text(
                         text=self.translations.get(
@@ -569,72 +526,34 @@ class AnnaTelegramBot:
                     logger.warning(f"Duplicate appointment detected during confirmation for user {session.user_id}.")
                     return BOOKING_TIME
 
+                # Claim the slot salon-wide; another client may have taken it meanwhile
+                if not await self.availability.atry_reserve(session.selected_date, session.selected_time):
+                    await self.show_slot_unavailable(query, session)
+                    logger.info(f"Slot {session.selected_date:%Y-%m-%d} {session.selected_time:%H:%M} is full, user {session.user_id} asked to pick again.")
+                    return BOOKING_TIME
+
                 # Save appointment
-                appointment = {
-                    "service": session.selected_service,
-                    "date": session.selected_date.isoformat(),
-                    # "time": session.selected_time.isoformat()
-                    "time": UserSession.time_to_str(session.selected_time)
-                }
-                session.appointments.append(appointment)
-                self.session_manager.save_sessions()
+                appointment = Appointment(
+                    session.selected_service,
+                    session.selected_date.date(),
+                    session.selected_time
+                )
+                session.add_appointment(appointment)
+                self.session_manager.save_session(session)
                 
                 # Schedule reminder
-                appointment_datetime = datetime.combine(session.selected_date, session.selected_time)
-                reminder_time = appointment_datetime - timedelta(days=1)
+                self.reminders.add(user.id, appointment)
                 
-                context.application.job_queue.run_once(
-                    self.send_reminder,
-                    reminder_time,
-                    data={
-                        "user_id": user.id,
-                        "service": session.selected_service,
-                        "time": session.selected_time.strftime("%H:%M")
-                    }
+                confirmed_text = self.translations.get(
+                    "booking_confirmed",
+                    session.language,
+                    session.selected_date.strftime("%Y-%m-%d"),
+                    session.selected_time.strftime("%H:%M")
                 )
-                
-                await query.edit_message_text(
-                    text=self.translations.get(
-                        "booking_confirmed",
-                        session.language,
-                        session.selected_date.strftime("%Y-%m-%d"),
-                        session.selected_time.strftime("%H:%M")
-                    )
+                await self.outbound.submit(
+                    query.message.chat_id,
+                    lambda: query.edit_message_text(text=confirmed_text)
                 )
-
-            elif data.startswith("cancel_"):
-                index = int(data.replace("cancel_", ""))
-                if 0 <= index < len(session.appointments):
-                    appointment = session.appointments[index]
-
-                    # Call the delete_appointment method
-                    success = self.session_manager.delete_appointment(
-                        user_id=session.user_id,
-                        service=appointment["service"],
-                        date=appointment["date"],
-                        time=appointment["time"]
-                    )
-
-                    if success:
-                        await query.edit_message_text(
-                            text=self.translations.get(
-                                "appointment_cancelled",
-                                session.language,
-                                appointment["service"],
-                                appointment["date"],
-                                appointment["time"]
-                            )
-                        )
-                    else:
-                        await query.edit_message_text(
-                            text="Failed to cancel the appointment. Please try again."
-                        )
-                else:
-                    await query.edit_message_text(
-                        text="Invalid appointment selected for cancellation."
-                    )
-
-                return CHOOSING
             
             else:
                 await query.edit_message_text("Booking cancelled. How else can I help you?")
@@ -646,25 +565,118 @@ class AnnaTelegramBot:
             
             return CHOOSING
 
+        elif data.startswith("cancel_"):
+            index = int(data.replace("cancel_", ""))
+            if 0 <= index < len(session.appointments):
+                booked = session.appointments[index]
+                appointment = booked.to_dict()
+
+                # Call the delete_appointment method
+                success = self.session_manager.delete_appointment(
+                    user_id=session.user_id,
+                    service=appointment["service"],
+                    date=appointment["date"],
+                    time=appointment["time"]
+                )
+
+                if success:
+                    await self.availability.arelease(booked.date, booked.time)
+                    self.reminders.cancel(session.user_id, booked)
+                    await query.edit_message_text(
+                        text=self.translations.get(
+                            "appointment_cancelled",
+                            session.language,
+                            appointment["service"],
+                            appointment["date"][:10],
+                            appointment["time"][:5]
+                        )
+                    )
+                else:
+                    await query.edit_message_text(
+                        text="Failed to cancel the appointment. Please try again."
+                    )
+            else:
+                await query.edit_message_text(
+                    text="Invalid appointment selected for cancellation."
+                )
+
+            return CHOOSING
+
     async def send_reminder(self, context: ContextTypes.DEFAULT_TYPE):
-        """Send appointment reminder."""
-        job = context.job
-        user_id = job.data["user_id"]
-        session = self.session_manager.get_session(user_id)
-        
+        """Queue every appointment reminder that is due, a batch at a time."""
+        while True:
+            due = self.reminders.pop_due(limit=REMINDER_BATCH_SIZE)
+            if not due:
+                return
+            # The outbound queue paces the sends; the tick does not wait for them
+            context.application.create_task(self._deliver_reminders(due))
+
+    async def _deliver_reminders(self, due):
+        delivered = await asyncio.gather(*(
+            self._deliver_reminder(user_id, appointment) for user_id, appointment in due
+        ))
+        # Failures go back to the scheduler and are picked up on the next tick
+        for (user_id, appointment), ok in zip(due, delivered):
+            if not ok:
+                self.reminders.add(user_id, appointment)
+
+    async def _deliver_reminder(self, user_id: int, appointment: Appointment) -> bool:
+        """Send one reminder. Returns False if it should be retried later."""
+        session = await self.session_manager.aget_session(user_id)
+        if not session.contains(appointment):
+            return True  # Cancelled since the reminder was scheduled
+
         reminder_text = self.translations.get(
             "reminder",
             session.language,
-            job.data["service"],
-            job.data["time"]
+            appointment.service,
+            appointment.time.strftime("%H:%M")
         )
-        
-        await context.bot.send_message(user_id, reminder_text)
+        try:
+            await self.outbound.send_message(user_id, reminder_text, priority=BULK)
+        except Forbidden:
+            # The user blocked the bot; retrying would never succeed
+            logger.info(f"Reminder for user {user_id} not delivered: bot was blocked.")
+        except Exception as e:
+            logger.warning(f"Reminder for user {user_id} failed, retrying next tick: {e}")
+            return False
 
-    def run(self):
-        """Run the bot."""
-        application = Application.builder().token(os.getenv("TELEGRAM_TOKEN")).build()
-        application.job_queue.start()
+        appointment.reminded = True
+        self.session_manager.save_session(session)
+        return True
+
+    async def post_init(self, application: Application):
+        self.session_manager.start()
+        self.outbound.start(application.bot)
+        # Load the LLM stack in the background; /start and the menus work without it
+        # (post_init runs before the application is started, so not application.create_task)
+        self._warm_up = asyncio.create_task(self.beauty_bot.awarm_up())
+        if METRICS_PORT:
+            self._metrics_runner = await serve_metrics(METRICS_LISTEN, METRICS_PORT)
+
+    async def post_shutdown(self, application: Application):
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+            self._metrics_runner = None
+        await self.outbound.stop()
+        await self.session_manager.stop()
+
+    def build_application(self, mode: str = BOT_MODE, bot: Optional[Bot] = None) -> Application:
+        """Create the Application with all handlers registered; `bot` replaces the token-built Bot."""
+        builder = Application.builder()
+        builder = builder.bot(bot) if bot is not None else builder.token(os.getenv("TELEGRAM_TOKEN"))
+        builder = (
+            builder
+            .post_init(self.post_init)
+            .post_shutdown(self.post_shutdown)
+            .concurrent_updates(PerUserUpdateProcessor())
+        )
+        if mode == "webhook":
+            # Bounded, so the webhook server can push back when the bot falls behind
+            builder = builder.update_queue(asyncio.Queue(maxsize=WEBHOOK_QUEUE_SIZE))
+        application = builder.build()
+        # Application.start() (polling and webhook alike) starts the job queue
+        application.job_queue.run_repeating(self.send_reminder, interval=REMINDER_TICK, first=1)
 
         # Add conversation handler with the new states
         conv_handler = ConversationHandler(
@@ -674,7 +686,8 @@ class AnnaTelegramBot:
                     MessageHandler(filters.TEXT & ~filters.COMMAND, self.set_language)
                 ],
                 CHOOSING: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message)
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.handle_message),
+                    CallbackQueryHandler(self.handle_booking_callback, pattern="^cancel_")
                 ],
                 BOOKING_DATE: [
                     CallbackQueryHandler(self.handle_booking_callback)
@@ -693,4 +706,17 @@ class AnnaTelegramBot:
         )
 
         application.add_handler(conv_handler)
-        application.run_polling()
+        return application
+
+    def run(self, mode: str = BOT_MODE, bot: Optional[Bot] = None):
+        """Run the bot, receiving updates by long polling or webhook; `bot` as in build_application."""
+        application = self.build_application(mode, bot)
+        if mode == "webhook":
+            # aiohttp is only needed in webhook mode
+            from core.webhook import serve_webhook
+
+            asyncio.run(serve_webhook(application, self.post_init, self.post_shutdown))
+        elif mode == "polling":
+            application.run_polling()
+        else:
+            raise ValueError(f"Unknown bot mode: {mode}")
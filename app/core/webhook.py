@@ -0,0 +1,145 @@
+import asyncio
+import hmac
+import logging
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from core.constants import (
+    WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_QUEUE_SIZE, WEBHOOK_SECRET, WEBHOOK_URL
+)
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    Receives Telegram updates over HTTP and feeds them to the Application.
+
+    Every POST must carry the secret token given to setWebhook. Updates go
+    into the application's update queue. When the backlog (queued updates
+    plus updates waiting in the update processor) reaches `max_backlog`
+    the server answers 503 and Telegram redelivers the update later, so a
+    slow bot pushes back instead of buffering without limit. GET /health
+    reports whether the bot is running and how full the queue is.
+    """
+
+    def __init__(self, application: Application, secret_token: str = WEBHOOK_SECRET,
+                 path: str = WEBHOOK_PATH, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 max_backlog: int = WEBHOOK_QUEUE_SIZE):
+        if not secret_token:
+            raise ValueError("WEBHOOK_SECRET must be set to run in webhook mode")
+        self.application = application
+        self.secret_token = secret_token
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.max_backlog = max_backlog
+        self.accepted = 0
+        self.rejected = 0
+        self._full = False
+        self._runner = None
+
+        self.app = web.Application()
+        self.app.router.add_post(path, self.handle_update)
+        self.app.router.add_get("/health", self.health)
+
+    def backlog(self) -> int:
+        """Updates received but not yet being handled."""
+        # With concurrent updates the queue is drained into tasks right away,
+        # so updates waiting in the processor count as well
+        waiting = getattr(self.application.update_processor, "waiting", 0)
+        return self.application.update_queue.qsize() + waiting
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning(f"Rejected webhook request from {request.remote}: bad secret token.")
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception:
+            return web.Response(status=400, text="Malformed update")
+
+        try:
+            if self.backlog() >= self.max_backlog:
+                raise asyncio.QueueFull
+            self.application.update_queue.put_nowait(update)
+        except asyncio.QueueFull:
+            # Telegram retries non-2xx responses, so the update is delayed, not lost
+            self.rejected += 1
+            if not self._full:
+                self._full = True
+                logger.warning("Update queue full, deferring updates until it drains.")
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        if self._full:
+            self._full = False
+            logger.info(f"Update queue draining again ({self.rejected} updates deferred so far).")
+        self.accepted += 1
+        return web.Response()
+
+    async def health(self, request: web.Request) -> web.Response:
+        running = self.application.running
+        return web.json_response({
+            "status": "ok" if running else "stopped",
+            "backlog": self.backlog(),
+            "backlog_max": self.max_backlog,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+        }, status=200 if running else 503)
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"Webhook server listening on {self.listen}:{self.port}{self.path}.")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def serve_webhook(application: Application, post_init=None, post_shutdown=None,
+                        url: str = WEBHOOK_URL, stop: Optional[asyncio.Event] = None):
+    """
+    Run the application behind WebhookServer until SIGINT/SIGTERM, or until
+    `stop` is set if one is given.
+
+    run_polling/run_webhook call the builder's post_init and post_shutdown
+    themselves; here they are passed in and called explicitly. When `url` is
+    empty the webhook is assumed to be registered elsewhere (e.g. by the
+    deployment, or not at all when testing offline, where the application is
+    built with a stub Bot; see scripts/webhook_offline.py).
+    """
+    server = WebhookServer(application)
+    if stop is None:
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+
+    async with application:
+        if post_init:
+            await post_init(application)
+        await application.start()
+        await server.start()
+        if url:
+            await application.bot.set_webhook(
+                url=url.rstrip("/") + server.path,
+                secret_token=server.secret_token,
+                allowed_updates=Update.ALL_TYPES
+            )
+        try:
+            await stop.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            if post_shutdown:
+                await post_shutdown(application)
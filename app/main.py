@@ -1,14 +1,20 @@
-
 from dotenv import load_dotenv
 from typing import Dict
 import asyncio
 
+from core.constants import BOT_MODE
 from core.telegram_bot import AnnaTelegramBot
 
 # Load environment variables
 load_dotenv()
 
 if __name__ == "__main__":
-    bot = AnnaTelegramBot()
-    
-    bot.run()
\ No newline at end of file
+    if BOT_MODE == "cluster":
+        # Coordinator only; it starts the bot workers as separate processes
+        from core.cluster import serve_cluster
+
+        asyncio.run(serve_cluster())
+    else:
+        bot = AnnaTelegramBot()
+        
+        bot.run()
@@ -0,0 +1,72 @@
+"""
+A promo spike against BeautyServiceBot.aprocess_message: many new users
+send one of a few first questions within a short spread, while every LLM
+call takes `latency_ms`. Counts the calls that reach the model with
+coalescing off and on, and with a batching window for distinct prompts.
+
+    python scripts/bench_coalescing.py [users] [latency_ms] [spread_ms]
+
+A fake chat model stands in for Gemini, so nothing leaves the machine.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.chatbot import BeautyServiceBot  # noqa: E402
+from fakes import FakeGemini  # noqa: E402
+
+PROMO = [
+    "What services do you have?",
+    "what services do you have",
+    "Hi! Is the promo still on?",
+    "hi! is the promo still on",
+    "How much is a manicure?",
+]
+
+
+async def spike(users: int, latency: float, spread: float, messages: List[str],
+                streaming: bool, **options):
+    bot = BeautyServiceBot("bench-key", max_concurrency=64, **options)
+    bot.llm = model = FakeGemini(latency=latency, services=bot.catalog.names())
+    rng = random.Random(0)
+
+    async def on_chunk(text: str):
+        pass
+
+    async def user(user_id: int):
+        await asyncio.sleep(rng.uniform(0, spread))
+        started = time.perf_counter()
+        response = await bot.aprocess_message(
+            messages[user_id % len(messages)], user_id=user_id, on_chunk=on_chunk if streaming else None
+        )
+        assert not response["text"].startswith("Error"), response["text"]
+        return time.perf_counter() - started
+
+    latencies = sorted(await asyncio.gather(*(user(i) for i in range(users))))
+    return model.calls, bot.coalescing_stats(), latencies[len(latencies) // 2]
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 1000) / 1000
+    spread = (float(sys.argv[3]) if len(sys.argv) > 3 else 500) / 1000
+
+    print(f"{users} new users within {spread * 1000:.0f} ms, LLM latency {latency * 1000:.0f} ms")
+    for title, messages, streaming, options in [
+        ("promo, coalescing off", PROMO, True, dict(coalesce=False)),
+        ("promo, coalescing on", PROMO, True, dict(coalesce=True)),
+        ("distinct, batch window 20 ms", [f"Question number {i}?" for i in range(users)], False,
+         dict(coalesce=True, batch_window=0.02, batch_max=32)),
+    ]:
+        calls, stats, p50 = await spike(users, latency, spread, messages, streaming, **options)
+        print(f"{title:<30} model calls {calls:>4}, saved {stats['saved']:>4}, "
+              f"batches {stats['batches']:>3} ({stats['batched']} prompts), reply p50 {p50 * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+Compare booking-intent detection: the per-service substring loop against
+the trie-shaped regex of ServiceMatcher, on long replies and large catalogs.
+
+    python scripts/bench_intent_matcher.py
+"""
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.catalog import DEFAULT_SERVICES, ServiceCatalog  # noqa: E402
+from core.matcher import ServiceMatcher  # noqa: E402
+
+FILLER = (
+    "Darling, your hands deserve the best care and I know exactly what will suit you. "
+    "We use only premium products and our masters are true artists. "
+)
+
+
+def make_catalog(size: int) -> ServiceCatalog:
+    services = []
+    for i in range(size):
+        base = DEFAULT_SERVICES[i % len(DEFAULT_SERVICES)]
+        # Unique names where none is a substring of another
+        suffix = f" (v{i}x)"
+        services.append({
+            "category": base["category"],
+            "name": base["name"] + suffix,
+            "name_ru": base["name_ru"] + suffix,
+            "price_from": base["price_from"],
+        })
+    return ServiceCatalog(services)
+
+
+def make_replies(rng: random.Random, catalog: ServiceCatalog, length: int, count: int = 10):
+    body = ""
+    while len(body) < length:
+        body += FILLER
+    # Each reply mentions one random service at the end, so the loop's early
+    # exit is averaged over the catalog
+    return [body + "I recommend " + rng.choice(catalog.services)["name"] + "." for _ in range(count)]
+
+
+def linear_detect(services, text):
+    for service in services:
+        if service["name"].lower() in text.lower():
+            return service["name"]
+    return None
+
+
+def per_call(func, replies, number):
+    return timeit.timeit(lambda: [func(r) for r in replies], number=number) / (number * len(replies))
+
+
+def main():
+    rng = random.Random(7)
+    print(f"{'services':>8} {'reply chars':>11} {'loop ms':>9} {'matcher ms':>10} {'build ms':>9}")
+    for size in (16, 160, 1600):
+        catalog = make_catalog(size)
+        build = timeit.timeit(lambda: ServiceMatcher.from_catalog(catalog), number=3) / 3
+        matcher = ServiceMatcher.from_catalog(catalog)
+        for length in (500, 5000):
+            replies = make_replies(rng, catalog, length)
+            for reply in replies:
+                assert matcher.first(reply).service == linear_detect(catalog.services, reply)
+            number = 2 if size >= 1600 else 20
+            loop = per_call(lambda r: linear_detect(catalog.services, r), replies, number)
+            matched = per_call(matcher.first, replies, number)
+            print(f"{size:>8} {len(replies[0]):>11} {loop * 1000:>9.3f} {matched * 1000:>10.3f} {build * 1000:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
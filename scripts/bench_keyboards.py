@@ -0,0 +1,86 @@
+"""
+Cost of producing the booking keyboards: rebuilt on every tap (as before)
+against KeyboardCache lookups, plus a check that cached keyboards change
+exactly when their inputs do.
+
+    python scripts/bench_keyboards.py
+"""
+import os
+import sys
+import timeit
+from datetime import date, datetime, time, timedelta
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.availability import SlotAvailability  # noqa: E402
+from core.catalog import DEFAULT_SERVICES, ServiceCatalog  # noqa: E402
+from core.keyboards import KeyboardCache  # noqa: E402
+
+SLOTS = ["09:00", "10:00", "11:00", "12:00", "13:00", "14:00", "15:00", "16:00", "17:00", "18:00"]
+
+
+def rebuild_services(catalog):
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{s['name'].title()} ({s['price_from']})", callback_data=f"service_{s['id']}")]
+        for s in catalog.services
+    ])
+
+
+def rebuild_dates():
+    today = datetime.now()
+    keyboard = []
+    for i in range(7):
+        day = today + timedelta(days=i)
+        keyboard.append([InlineKeyboardButton(day.strftime("%A, %b %d"), callback_data=f"date_{day.strftime('%Y-%m-%d')}")])
+    return InlineKeyboardMarkup(keyboard)
+
+
+def rebuild_times(availability, date_str):
+    selected = datetime.strptime(date_str, "%Y-%m-%d").date()
+    now = datetime.now()
+    after = time(now.hour, 59) if selected == now.date() else None
+    slots = availability.free_slots(selected, after=after)
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(s, callback_data=f"time_{s}") for s in slots[i:i + 3]]
+        for i in range(0, len(slots), 3)
+    ])
+
+
+def main():
+    catalog = ServiceCatalog(DEFAULT_SERVICES)
+    availability = SlotAvailability(SLOTS, capacity=1, overrides={})
+    cache = KeyboardCache(catalog, availability)
+    tomorrow = date.today() + timedelta(days=1)
+    tomorrow_str = f"{tomorrow:%Y-%m-%d}"
+
+    cases = [
+        ("services", lambda: rebuild_services(catalog), lambda: cache.services("en")),
+        ("dates", rebuild_dates, cache.dates),
+        ("times", lambda: rebuild_times(availability, tomorrow_str), lambda: cache.times(tomorrow)),
+    ]
+    for name, rebuild, cached in cases:
+        number = 2000
+        before = timeit.timeit(rebuild, number=number) / number * 1e6
+        after = timeit.timeit(cached, number=number) / number * 1e6
+        print(f"{name:<9} rebuild {before:8.1f} µs   cached {after:6.2f} µs   ({before / after:.0f}x)")
+
+    # Invalidation
+    times = cache.times(tomorrow)
+    assert cache.times(tomorrow) is times
+    availability.try_reserve(tomorrow, time(10))
+    assert cache.times(tomorrow) is not times, "booking must refresh that day's times"
+    other = cache.times(tomorrow + timedelta(days=1))
+    availability.try_reserve(tomorrow, time(11))
+    assert cache.times(tomorrow + timedelta(days=1)) is other, "another day's booking must not"
+    services = cache.services("en")
+    assert cache.services("ru") is not services
+    catalog.reload(DEFAULT_SERVICES[:-1])
+    assert cache.services("en") is not services, "catalog change must refresh services"
+    assert cache.dates(date.today() + timedelta(days=1)) is not cache.dates(), "dates roll over"
+    print(f"invalidation checks passed; {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+A loyal client's long conversation through BeautyServiceBot.aprocess_message
+with buffer memory and with summarizing memory: prompt tokens per turn, time
+per turn, and whether what the client said in the first turns is still in
+the prompt at the end.
+
+    python scripts/bench_memory.py [turns] [latency_ms]
+
+scripts/fakes.FakeGemini stands in for Gemini. Its "summaries" keep the
+lines that mention preferences, allergies or bookings, which is enough to
+see whether they survive.
+"""
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.chatbot import BeautyServiceBot  # noqa: E402
+from fakes import FakeGemini  # noqa: E402
+
+FACTS = ["Hi, I'm Maria and I'm allergic to latex.", "I always prefer a gel manicure, nothing too bright."]
+
+
+async def conversation(mode: str, turns: int, latency: float):
+    bot = BeautyServiceBot("bench-key", memory_mode=mode, coalesce=False)
+    bot.llm = model = FakeGemini(latency=latency, services=bot.catalog.names())
+    tokens, durations = [], []
+    for turn in range(turns):
+        message = FACTS[turn] if turn < len(FACTS) else (
+            f"Tell me more about option {turn}: what does it include and how long does it take?"
+        )
+        # Every turn should reach the model, not the answer caches
+        bot.response_cache.clear()
+        bot.semantic_cache.clear()
+        started = time.perf_counter()
+        response = await bot.aprocess_message(message, user_id=1)
+        durations.append(time.perf_counter() - started)
+        tokens.append(response["prompt_tokens"])
+        # A client types for a while, so background summaries have time to finish
+        await asyncio.sleep(latency)
+    if mode == "summary":
+        await bot.memory.drain()
+
+    inputs, _ = bot._build_inputs("next", 1)
+    context = inputs["system"][0].content + " ".join(m.content for m in inputs["chat_history"])
+    kept = [fact for fact in ("latex", "gel manicure") if fact in context]
+    return tokens, durations, kept, model, bot.memory.stats()
+
+
+async def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 200) / 1000
+    for mode in ("buffer", "summary"):
+        tokens, durations, kept, model, stats = await conversation(mode, turns, latency)
+        durations.sort()
+        print(f"{mode:<8} prompt tokens: first {tokens[0]}, max {max(tokens)}, last {tokens[-1]}; "
+              f"turn p50 {durations[len(durations) // 2] * 1000:.0f} ms, "
+              f"max {durations[-1] * 1000:.0f} ms; {model.calls} replies + {model.summaries} summaries; "
+              f"first-turn facts still in the prompt: {kept or 'none'}")
+        print(f"         memory: {stats}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,43 @@
+"""
+Per-message cost of deciding what a text message is: the former chain of
+`text == translations.get(...)` comparisons against one lookup in the
+reverse index of menu labels.
+
+    python scripts/bench_menu_dispatch.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.telegram_bot import MENU_KEYS, Translations  # noqa: E402
+
+MESSAGES = {
+    "first button": ("📅 Book Service", "en"),
+    "last button": ("❌ Отменить запись", "ru"),
+    "free text (LLM fallback)": ("Do you do gel manicure on Sundays?", "en"),
+}
+
+
+def chain(translations: Translations, text: str, lang: str):
+    # The comparisons handle_message used to make, in order
+    for key in MENU_KEYS:
+        if text == translations.get(key, lang):
+            return key
+    return None
+
+
+def main():
+    translations = Translations()
+    index = translations.reverse_index(MENU_KEYS)
+    number = 200_000
+    for name, (text, lang) in MESSAGES.items():
+        assert chain(translations, text, lang) == index.get(text)
+        before = timeit.timeit(lambda: chain(translations, text, lang), number=number) / number * 1e9
+        after = timeit.timeit(lambda: index.get(text), number=number) / number * 1e9
+        print(f"{name:<26} chain {before:7.0f} ns   index {after:5.0f} ns   ({before / after:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Startup cost of rebuilding the reminder heap from stored appointments, and
+the cost of draining due reminders in batches.
+
+    python scripts/bench_reminders.py [count]
+"""
+import os
+import sys
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as dtime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.reminders import ReminderScheduler  # noqa: E402
+from core.sessions import Appointment  # noqa: E402
+
+NOW = datetime(2024, 1, 1, 12)
+
+
+def booked(count: int):
+    start = date(2024, 1, 2)
+    return [
+        (i, Appointment("Manicure", start + timedelta(days=i % 90), dtime(9 + i % 10)))
+        for i in range(count)
+    ]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    pairs = booked(count)
+
+    scheduler = ReminderScheduler()
+    started = time.perf_counter()
+    scheduler.rehydrate(pairs, now=NOW)
+    elapsed = time.perf_counter() - started
+    print(f"rehydrate {count} reminders: {elapsed * 1000:.1f} ms")
+
+    started = time.perf_counter()
+    drained = 0
+    later = NOW + timedelta(days=30)
+    while True:
+        batch = scheduler.pop_due(now=later, limit=25)
+        if not batch:
+            break
+        drained += len(batch)
+    elapsed = time.perf_counter() - started
+    print(f"pop_due {drained} reminders due within 30 days, batches of 25: {elapsed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
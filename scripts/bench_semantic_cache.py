@@ -0,0 +1,160 @@
+"""
+Benchmark the semantic cache on labelled salon questions.
+
+Every (intent, service, time) case is answered once in its first wording;
+then every other wording of every case is looked up. A hit is correct when
+it returns the answer of the same case. Cases differ by as little as "with"
+or "without" a membership card, or 14:00 or 15:00, so near misses count as
+false positives. Each case's wordings are also looked up with that case
+left out of the cache ("held out"), where any hit is a false positive.
+Reports precision and recall per threshold, with the signature guard the
+bot uses and without it (cosine alone), and lookup latency once the cache
+also holds `--entries` unrelated questions.
+
+    python scripts/bench_semantic_cache.py --entries 20000
+"""
+import argparse
+import functools
+import itertools
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.catalog import DEFAULT_SERVICES, ServiceCatalog  # noqa: E402
+from core.constants import SEMANTIC_CACHE_THRESHOLD  # noqa: E402
+from core.matcher import ServiceMatcher  # noqa: E402
+from core.semantic_cache import SemanticCache, question_signature  # noqa: E402
+
+# intent -> wordings; {s} is the service and {t} the time
+WORDINGS = {
+    "en": {
+        "price": [
+            "how much is {s}", "{s} price?", "what does {s} cost", "how much does {s} cost?",
+            "price of {s}", "what's the price for {s}",
+        ],
+        "duration": [
+            "how long does {s} take", "{s}, how long?", "how much time does {s} take",
+            "how long is {s}",
+        ],
+        "book": [
+            "can i book {s} tomorrow at {t}", "book {s} tomorrow at {t}", "i'd like {s} tomorrow at {t}",
+            "is tomorrow {t} free for {s}?",
+        ],
+    },
+    "ru": {
+        "price": ["сколько стоит {s}", "{s} цена?", "какая цена на {s}", "{s} сколько стоит?"],
+        "book": [
+            "можно записаться на {s} завтра в {t}", "запишите на {s} завтра в {t}",
+            "хочу {s} завтра в {t}",
+        ],
+    },
+}
+SERVICES = {
+    "en": [
+        "a manicure", "men's manicure", "gel polish removal with membership card",
+        "gel polish removal without membership card", "design 300", "design 500", "artistic painting",
+    ],
+    "ru": ["маникюр", "мужской маникюр", "снятие гель-лака с клубной картой",
+           "снятие гель-лака без клубной карты", "дизайн 300", "дизайн 500"],
+}
+TIMES = ["14:00", "15:00"]
+
+
+def cases():
+    """(case id, language, wordings) for every intent, service and time."""
+    for language, intents in WORDINGS.items():
+        for intent, templates in intents.items():
+            times = TIMES if "{t}" in templates[0] else [None]
+            for service, at in itertools.product(SERVICES[language], times):
+                case = (language, intent, service, at)
+                yield case, language, [template.format(s=service, t=at) for template in templates]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+def fill(threshold: float, signature, labelled, filler: int = 0, held_out=None) -> SemanticCache:
+    cache = SemanticCache(threshold=threshold, max_size=max(filler, 1000), signature=signature)
+    for i in range(filler):
+        language = "en" if i % 2 else "ru"
+        # No digits, so these share the signature of most real questions
+        word = "".join(chr(ord("a") + int(digit)) for digit in str(i))
+        cache.set(f"unrelated question {word} about nothing in particular", language,
+                  {"text": "filler", "case": None})
+    for case, language, wordings in labelled:
+        if case != held_out:
+            cache.set(wordings[0], language, {"text": wordings[0], "case": case})
+    return cache
+
+
+def evaluate(threshold: float, signature, filler: int = 0):
+    labelled = list(cases())
+    cache = fill(threshold, signature, labelled, filler)
+    queries = correct = wrong = 0
+    false_positives = []
+    latencies = []
+    for case, language, wordings in labelled:
+        for question in wordings[1:]:
+            queries += 1
+            started = time.perf_counter()
+            answer = cache.get(question, language)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if answer is None:
+                continue
+            if answer["case"] == case:
+                correct += 1
+            else:
+                wrong += 1
+                false_positives.append((question, answer["text"]))
+    if not filler:
+        for case, language, wordings in labelled:
+            held_out = fill(threshold, signature, labelled, held_out=case)
+            for question in wordings:
+                answer = held_out.get(question, language)
+                if answer is not None:
+                    wrong += 1
+                    false_positives.append((question, answer["text"]))
+    hits = correct + wrong
+    return {
+        "queries": queries,
+        "precision": correct / hits if hits else 1.0,
+        "recall": correct / queries,
+        "false_positives": false_positives,
+        "p50": percentile(latencies, 50),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=20000, help="unrelated questions for the latency run")
+    parser.add_argument("--thresholds", default="0.4,0.5,0.6,0.7,0.8,0.9")
+    args = parser.parse_args()
+
+    matcher = ServiceMatcher.from_catalog(ServiceCatalog(DEFAULT_SERVICES))
+    guards = {
+        "signature": functools.partial(question_signature, matcher=matcher),
+        "cosine only": lambda text: None,
+    }
+    print(f"{sum(len(w) - 1 for _, _, w in cases())} paraphrase lookups and "
+          f"{sum(len(w) for _, _, w in cases())} held-out lookups over {sum(1 for _ in cases())} cases")
+    for name, signature in guards.items():
+        for threshold in (float(t) for t in args.thresholds.split(",")):
+            result = evaluate(threshold, signature)
+            print(f"{name:<12} threshold {threshold:.2f}: precision {result['precision']:6.1%}, "
+                  f"recall {result['recall']:6.1%}, {len(result['false_positives'])} false positives")
+            for question, answered in result["false_positives"][:2]:
+                print(f"{'':<14}{question!r} got the answer to {answered!r}")
+
+    result = evaluate(SEMANTIC_CACHE_THRESHOLD, guards["signature"], filler=args.entries)
+    print(f"with {args.entries} more entries, threshold {SEMANTIC_CACHE_THRESHOLD}: "
+          f"precision {result['precision']:.1%}, recall {result['recall']:.1%}, "
+          f"lookup p50/p99 {result['p50']:.3f} / {result['p99']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
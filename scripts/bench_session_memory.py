@@ -0,0 +1,122 @@
+"""
+Startup time and resident memory of SessionManager over a SQLite store with
+many registered users: loading every session at startup, against the
+bounded working set (sessions with upcoming appointments at startup, the
+rest loaded on use, written back and dropped once idle). Then traffic, mostly from a small
+active group and the rest from anyone, sampling RSS as idle sessions are
+evicted.
+
+    python scripts/bench_session_memory.py [users] [touches] [idle_ttl_s]
+
+Each mode runs in its own process so their memory does not mix. The
+database is built in a temporary directory and removed afterwards.
+"""
+import asyncio
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.session_store import SqliteSessionStore  # noqa: E402
+from core.sessions import SessionManager  # noqa: E402
+
+# One client in this many has an appointment ahead
+BOOKED_EVERY = 200
+# Most messages come from the few clients who are talking to the bot right now
+ACTIVE_SHARE = 0.002
+ACTIVE_TRAFFIC = 0.9
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+class EagerStore(SqliteSessionStore):
+    """Loads every session at startup, as SessionManager did before the working set."""
+
+    def load_booked(self, since):
+        return self.load_all()
+
+
+def rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE / 2 ** 20
+
+
+def populate(path: str, users: int):
+    SqliteSessionStore(f"sqlite:///{path}")  # Creates the schema
+    seen = (datetime.now() - timedelta(days=30)).isoformat()
+    past = (datetime.now() - timedelta(days=20)).replace(hour=0, minute=0, second=0, microsecond=0)
+    ahead = past + timedelta(days=30)
+    conn = sqlite3.connect(path)
+    with conn:
+        conn.executemany(
+            "INSERT INTO sessions VALUES (?, 'en', NULL, NULL, NULL, ?)",
+            ((user_id, seen) for user_id in range(users))
+        )
+        conn.executemany(
+            "INSERT INTO appointments (user_id, service, date, time, reminded) VALUES (?, ?, ?, ?, 0)",
+            ((user_id, "Manicure", (ahead if user_id % BOOKED_EVERY == 0 else past).isoformat(),
+              f"{9 + user_id % 8:02d}:00:00") for user_id in range(users))
+        )
+    conn.close()
+
+
+async def run(mode: str, path: str, users: int, touches: int, idle_ttl: float):
+    before = rss_mb()
+    store = (EagerStore if mode == "eager" else SqliteSessionStore)(f"sqlite:///{path}")
+    started = time.perf_counter()
+    manager = SessionManager(store=store, write_behind=False, idle_ttl=idle_ttl if mode == "lazy" else 0)
+    startup = time.perf_counter() - started
+    loaded = len(manager.sessions)
+    after_startup = rss_mb()
+
+    rng = random.Random(0)
+    active = max(1, int(users * ACTIVE_SHARE))
+    samples = []
+    started = last_evict = time.perf_counter()
+    for i in range(touches):
+        user_id = rng.randrange(active) if rng.random() < ACTIVE_TRAFFIC else rng.randrange(users)
+        session = manager.get_session(user_id)
+        if i % 20 == 0:
+            session.selected_service = "Pedicure"
+            manager.save_session(session)
+        now = time.perf_counter()
+        if now - last_evict >= idle_ttl / 4:
+            await manager.evict_idle()
+            last_evict = now
+            samples.append(rss_mb())
+    traffic = time.perf_counter() - started
+    stats = manager.stats()
+    print(f"{mode:<5} startup {startup:6.2f} s, {loaded:>8} sessions loaded, "
+          f"RSS {before:6.0f} -> {after_startup:6.0f} MB; "
+          f"{touches} touches in {traffic:.1f} s, RSS during traffic "
+          f"{min(samples or [0]):.0f}-{max(samples or [0]):.0f} MB, end {rss_mb():.0f} MB")
+    print(f"      {stats}")
+
+
+def main():
+    if sys.argv[1:2] == ["--run"]:
+        mode, path, users, touches, idle_ttl = sys.argv[2:7]
+        asyncio.run(run(mode, path, int(users), int(touches), float(idle_ttl)))
+        return
+
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    touches = sys.argv[2] if len(sys.argv) > 2 else "100000"
+    idle_ttl = sys.argv[3] if len(sys.argv) > 3 else "5"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.db")
+        started = time.perf_counter()
+        populate(path, users)
+        print(f"{users} registered users, 1 in {BOOKED_EVERY} with an appointment ahead "
+              f"(database built in {time.perf_counter() - started:.1f} s); idle TTL {idle_ttl} s")
+        for mode in ("eager", "lazy"):
+            subprocess.run([sys.executable, __file__, "--run", mode, path, str(users), touches, idle_ttl],
+                           check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Memory per session and conflict-check latency of UserSession, compared with
+the previous representation (appointments as dicts of strings, re-parsed on
+every has_appointment call).
+
+    python scripts/bench_sessions.py
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.sessions import UserSession  # noqa: E402
+
+START = datetime(2024, 1, 1, 9)
+
+
+def session_data(user_id: int, appointments: int) -> dict:
+    return {
+        "user_id": user_id,
+        "language": "en",
+        "selected_service": None,
+        "selected_date": None,
+        "selected_time": None,
+        "last_interaction": START.isoformat(),
+        "appointments": [
+            {
+                "service": "Manicure (with membership card)",
+                "date": (START + timedelta(days=i // 8)).replace(hour=0).isoformat(),
+                "time": f"{9 + i % 8:02d}:00:00",
+            }
+            for i in range(appointments)
+        ],
+    }
+
+
+class LegacySession:
+    """The previous UserSession: a plain object holding the raw dicts."""
+
+    def __init__(self, data: dict):
+        self.user_id = data["user_id"]
+        self.language = data["language"]
+        self.selected_service = data["selected_service"]
+        self.selected_date = None
+        self.selected_time = None
+        self.last_interaction = datetime.fromisoformat(data["last_interaction"])
+        self.appointments = data["appointments"]
+
+    def has_appointment(self, date, time) -> bool:
+        for appointment in self.appointments:
+            appointment_date = datetime.fromisoformat(appointment["date"]).date()
+            appointment_time = datetime.strptime(appointment["time"], "%H:%M:%S").time()
+            if appointment_date == date and appointment_time == time:
+                return True
+        return False
+
+
+def bytes_per_session(factory, count: int, appointments: int) -> float:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    # Loaded data is built inside the measurement and then dropped, so only
+    # what the sessions keep alive is counted
+    sessions = [factory(session_data(i, appointments)) for i in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert sessions
+    return (after - before) / count
+
+
+def main():
+    print(f"{'appointments':>12} {'legacy B/session':>16} {'slots B/session':>15}")
+    for appointments in (0, 10, 100):
+        legacy = bytes_per_session(LegacySession, 2000, appointments)
+        compact = bytes_per_session(UserSession.from_dict, 2000, appointments)
+        print(f"{appointments:>12} {legacy:>16.0f} {compact:>15.0f}")
+
+    print()
+    print(f"{'appointments':>12} {'legacy us/check':>15} {'bisect us/check':>15}")
+    for appointments in (10, 100, 1000, 10000):
+        data = session_data(1, appointments)
+        legacy = LegacySession(data)
+        compact = UserSession.from_dict(data)
+        # Worst case for the scan: a slot that is free
+        probe = ((START + timedelta(days=appointments)).date(), START.time())
+        assert legacy.has_appointment(*probe) == compact.has_appointment(*probe)
+        number = max(1, 20000 // appointments)
+        legacy_us = timeit.timeit(lambda: legacy.has_appointment(*probe), number=number) / number * 1e6
+        compact_us = timeit.timeit(lambda: compact.has_appointment(*probe), number=20000) / 20000 * 1e6
+        print(f"{appointments:>12} {legacy_us:>15.1f} {compact_us:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
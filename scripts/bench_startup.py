@@ -0,0 +1,74 @@
+"""
+Cold-start cost of the bot process: import time per module (from
+`python -X importtime`), time until AnnaTelegramBot can answer /start and
+the menus, and how long the background LLM warm-up takes after that.
+
+    python scripts/bench_startup.py [top]
+
+Every measurement runs in a fresh interpreter, so nothing is cached in
+sys.modules between them.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+
+APP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app")
+
+READY = """
+import time
+started = time.perf_counter()
+from core.telegram_bot import AnnaTelegramBot
+bot = AnnaTelegramBot()
+ready = time.perf_counter() - started
+import sys
+loaded = any(m.startswith("langchain") for m in sys.modules)
+started = time.perf_counter()
+bot.beauty_bot.warm_up()
+print(ready, time.perf_counter() - started, loaded)
+"""
+
+
+def run(code: str, *flags: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, GEMINI_API_KEY=os.getenv("GEMINI_API_KEY", "bench-key"), PYTHONPATH=APP)
+    # A scratch directory, so no real session file is read
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=tempfile.mkdtemp(), env=env,
+        capture_output=True, text=True, check=True
+    )
+
+
+def import_times(module: str):
+    """(cumulative µs, self µs, depth, name) for every module imported by `import module`."""
+    rows = []
+    for line in run(f"import {module}", "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((int(cumulative), int(own), depth, name.strip()))
+    return rows
+
+
+def main():
+    top = int(sys.argv[1]) if len(sys.argv) > 1 else 15
+
+    rows = import_times("core.telegram_bot")
+    total = max(cumulative for cumulative, _, _, _ in rows)
+    print(f"import core.telegram_bot: {total / 1000:.0f} ms, {len(rows)} modules")
+    print(f"{'cumulative':>12} {'self':>9}  module")
+    for cumulative, own, depth, name in sorted(rows, reverse=True)[:top]:
+        print(f"{cumulative / 1000:10.1f}ms {own / 1000:7.1f}ms  {'  ' * depth}{name}")
+
+    ready, warm, loaded = run(READY).stdout.split()
+    print(f"\nready for /start and menus: {float(ready) * 1000:.0f} ms "
+          f"(langchain imported: {loaded})")
+    print(f"LLM warm-up, in the background after that: {float(warm) * 1000:.0f} ms")
+
+    llm = import_times("langchain_google_genai")
+    print(f"for reference, import langchain_google_genai alone: "
+          f"{max(c for c, _, _, _ in llm) / 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Stand-in for Telegram's side of a webhook: POSTs synthetic updates to a
+locally running bot (BOT_MODE=webhook) and reports how they were answered.
+
+    python scripts/fake_telegram.py [--url http://127.0.0.1:8080/telegram]
+                                    [--updates 200] [--users 20] [--concurrency 20]
+
+The secret token is read from WEBHOOK_SECRET unless --secret is given.
+Like Telegram, updates answered with an error are posted again after a
+pause, so updates deferred by backpressure are delivered eventually.
+Replies the bot tries to send still go to the real Bot API, so without a
+valid TELEGRAM_TOKEN they fail in the bot's log; receiving, verification and
+backpressure are exercised either way. scripts/webhook_offline.py runs the
+bot in-process with a stub Bot API instead.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.constants import WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET  # noqa: E402
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+TEXTS = ["/start", "English", "What services do you have?", "💰 Prices", "I'd like a manicure"]
+
+
+def message_update(update_id: int, user_id: int, text: str) -> dict:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith("/"):
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+    return {"update_id": update_id, "message": message}
+
+
+async def post(session: aiohttp.ClientSession, url: str, secret: str, update: dict):
+    started = time.perf_counter()
+    async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as response:
+        await response.read()
+        return response.status, time.perf_counter() - started
+
+
+async def deliver(session: aiohttp.ClientSession, url: str, secret: str, update: dict,
+                  attempts: int = 30):
+    """Post until accepted; returns (final status, retries, seconds until accepted)."""
+    started = time.perf_counter()
+    for retry in range(attempts):
+        status, _ = await post(session, url, secret, update)
+        if status < 500:
+            break
+        await asyncio.sleep(0.2)
+    return status, retry, time.perf_counter() - started
+
+
+async def drive(url: str, secret: str, updates: int, users: int, concurrency: int) -> dict:
+    """Post `updates` synthetic updates from `users` users; returns what report() prints."""
+    ids = itertools.count(1)
+    batch = [
+        message_update(next(ids), 100000 + i % users, TEXTS[(i // users) % len(TEXTS)])
+        for i in range(updates)
+    ]
+    limit = asyncio.Semaphore(concurrency)
+
+    async with aiohttp.ClientSession() as session:
+        async def send(update):
+            async with limit:
+                return await deliver(session, url, secret, update)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(send(u) for u in batch))
+        elapsed = time.perf_counter() - started
+
+        # A wrong secret must be refused
+        bad_status, _ = await post(session, url, secret + "x", batch[0])
+        health_url = url.rsplit("/", 1)[0] + "/health"
+        async with session.get(health_url) as response:
+            health = await response.json()
+    return {"updates": updates, "results": results, "elapsed": elapsed,
+            "bad_status": bad_status, "health": health}
+
+
+def report(run: dict):
+    results, elapsed, updates = run["results"], run["elapsed"], run["updates"]
+    statuses = Counter(status for status, _, _ in results)
+    retries = sum(retry for _, retry, _ in results)
+    latencies = sorted(latency for _, _, latency in results)
+    print(f"{updates} updates in {elapsed:.2f}s ({updates / elapsed:.0f}/s)")
+    print(f"final responses: {dict(statuses)}, {retries} retries after 503 (backpressure)")
+    print(f"time to acceptance p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms")
+    print(f"wrong secret answered {run['bad_status']}")
+    print(f"health: {run['health']}")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default=f"http://127.0.0.1:{WEBHOOK_PORT}{WEBHOOK_PATH}")
+    parser.add_argument("--secret", default=WEBHOOK_SECRET)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    report(await drive(args.url, args.secret, args.updates, args.users, args.concurrency))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
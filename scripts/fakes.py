@@ -0,0 +1,106 @@
+"""
+Offline stand-ins for the outside world, shared by the scripts: a Bot that
+answers the Bot API locally and a chat model that answers for Gemini.
+Scripts put app/ on sys.path before importing this module.
+"""
+import asyncio
+import itertools
+import time
+import zlib
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from telegram.ext import ExtBot
+
+from core.prompt import SUMMARY_INSTRUCTIONS
+
+# How the memory's summary requests start
+_SUMMARY_REQUEST = SUMMARY_INSTRUCTIONS.split("\n", 1)[0]
+
+
+class FakeGemini(BaseChatModel):
+    """
+    Replies chosen by a hash of the question, after `latency` seconds; half of
+    them name a service. Summaries of a conversation keep the lines that
+    mention one of the `remembered` words.
+    """
+
+    latency: float = 0.8
+    chunks: int = 4
+    services: List[str] = []
+    remembered: List[str] = ["allergic", "prefer", "booked"]
+    calls: int = 0
+    summaries: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        if str(messages[0].content).startswith(_SUMMARY_REQUEST):
+            self.summaries += 1
+            notes = [line.split(": ", 1)[1] for line in str(messages[-1].content).splitlines()
+                     if any(word in line for word in self.remembered)]
+            return " ".join(dict.fromkeys(notes))
+        self.calls += 1
+        digest = zlib.crc32(str(messages[-1].content).encode())
+        if digest % 2:
+            return f"I'd suggest our {self.services[digest % len(self.services)]}, clients love it!"
+        return "We are open every day from 9 to 19. Anything else I can help you with?"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        words = self._reply(messages).split(" ")
+        step = -(-len(words) // self.chunks)
+        for i in range(0, len(words), step):
+            await asyncio.sleep(self.latency / self.chunks)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=" ".join(words[i:i + step]) + " "))
+
+
+class RecordingBot(ExtBot):
+    """Answers Bot API calls locally after `latency` seconds and keeps each chat's latest message."""
+
+    def __init__(self, latency: float):
+        super().__init__("123456:LOADTEST")
+        with self._unfrozen():
+            self.latency = latency
+            self.calls = Counter()
+            self.last: Dict[int, dict] = {}
+            self._message_ids = itertools.count(1)
+
+    def _message(self, chat_id: int, text: str, markup: Any, message_id: Optional[int] = None) -> dict:
+        message = {
+            "message_id": message_id or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+        markup = markup.to_dict() if hasattr(markup, "to_dict") else markup
+        # Only inline keyboards belong to a message; reply keyboards stay with the client
+        if markup and "inline_keyboard" in markup:
+            message["reply_markup"] = markup
+        self.last[chat_id] = message
+        return message
+
+    async def _do_post(self, endpoint: str, data: dict, **kwargs):
+        self.calls[endpoint] += 1
+        if endpoint == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Anna", "username": "anna_load_test_bot"}
+        await asyncio.sleep(self.latency)
+        if endpoint == "sendMessage":
+            return self._message(int(data["chat_id"]), data["text"], data.get("reply_markup"))
+        if endpoint == "editMessageText":
+            return self._message(int(data["chat_id"]), data["text"], data.get("reply_markup"),
+                                 message_id=int(data["message_id"]))
+        return True
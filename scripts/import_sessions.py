@@ -0,0 +1,25 @@
+"""
+One-shot import of user_sessions.json into the SQLite session store.
+
+    python scripts/import_sessions.py [user_sessions.json] [sqlite:///user_sessions.db]
+
+Then run the bot with SESSION_BACKEND=sqlite.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.constants import SESSION_DB_URL, SESSION_FILE  # noqa: E402
+from core.session_store import SqliteSessionStore  # noqa: E402
+
+
+def main():
+    json_path = sys.argv[1] if len(sys.argv) > 1 else SESSION_FILE
+    db_url = sys.argv[2] if len(sys.argv) > 2 else SESSION_DB_URL
+    count = SqliteSessionStore(db_url).import_json(json_path)
+    print(f"Imported {count} sessions from {json_path} into {db_url}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Offline load test: thousands of simulated users drive AnnaTelegramBot's real
+handlers through the Application, its ConversationHandler and
+PerUserUpdateProcessor. A recording Bot answers the Bot API, and a
+deterministic fake chat model with configurable latency stands in for Gemini,
+so nothing leaves the machine.
+
+    python scripts/load_test.py [--users 2000] [--turns 8] [--llm-latency 800]
+                                [--api-latency 30] [--backend json|sqlite]
+
+Every user sends /start, picks a language and then acts like a client: asks
+the bot something, opens the menus, or books through the inline keyboards it
+was last shown. A user's updates are sent one after another, as from a phone;
+different users run concurrently. Reported are throughput, p50/p95/p99
+latency per handler and per update (including the wait for a processing
+slot), the cost of persisting sessions, and what reached the Bot API and LLM.
+Sessions are written to a scratch directory.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Optional
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--users", type=int, default=2000)
+parser.add_argument("--turns", type=int, default=8, help="actions per user after choosing a language")
+parser.add_argument("--llm-latency", type=float, default=800, help="ms per fake LLM reply")
+parser.add_argument("--api-latency", type=float, default=30, help="ms per Bot API call")
+parser.add_argument("--think", type=float, default=0, help="ms a user waits between actions")
+parser.add_argument("--fresh", type=float, default=0.3,
+                    help="share of questions made unique, so the answer caches cannot serve them")
+parser.add_argument("--backend", choices=("json", "sqlite"), default="sqlite")
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--metrics", action="store_true", help="also print what /metrics would serve")
+args = parser.parse_args()
+
+# The store is configured from the environment when core is imported
+scratch = tempfile.mkdtemp()
+os.environ.update(
+    SESSION_BACKEND=args.backend,
+    SESSION_FILE=os.path.join(scratch, "user_sessions.json"),
+    SESSION_DB_URL=f"sqlite:///{scratch}/user_sessions.db",
+    METRICS_PORT="0",
+)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import logging  # noqa: E402
+
+from telegram import Update  # noqa: E402
+
+from core.metrics import REGISTRY  # noqa: E402
+from core.telegram_bot import AnnaTelegramBot, Translations  # noqa: E402
+from fakes import FakeGemini, RecordingBot  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+HANDLERS = ("start", "set_language", "handle_message", "handle_booking_callback", "cancel")
+QUESTIONS = [
+    "What services do you have?",
+    "How much is a haircut?",
+    "Do you work on Sundays?",
+    "Can you recommend something for dry skin?",
+    "Is the manicure long-lasting?",
+    "What should I do before a facial?",
+]
+MENU = ["book_service", "services", "prices", "check_appointments", "help", "cancel_appointment"]
+MENU_WEIGHTS = [30, 10, 10, 10, 5, 5]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+
+    def timed(self, name: str, func):
+        async def wrapper(*a, **kw):
+            started = time.perf_counter()
+            try:
+                return await func(*a, **kw)
+            finally:
+                self.latencies[name].append(time.perf_counter() - started)
+        return wrapper
+
+    def timed_sync(self, name: str, func):
+        def wrapper(*a, **kw):
+            started = time.perf_counter()
+            try:
+                return func(*a, **kw)
+            finally:
+                self.latencies[name].append(time.perf_counter() - started)
+        return wrapper
+
+    def report(self, title: str, names):
+        print(f"\n{title:<28} {'calls':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for name in names:
+            values = self.latencies.get(name)
+            if values:
+                print(f"{name:<28} {len(values):>7} "
+                      + " ".join(f"{percentile(values, p) * 1000:7.1f}ms" for p in (50, 95, 99))
+                      + f" {max(values) * 1000:7.1f}ms")
+
+
+class SimulatedUser:
+    def __init__(self, user_id: int, harness: "Harness"):
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+        self.harness = harness
+        self.rng = random.Random(args.seed * 1_000_003 + user_id)
+        self.language = self.rng.choice(("en", "ru"))
+        self.tapped: Optional[dict] = None
+
+    async def send_text(self, text: str, kind: str):
+        update = {"message": {
+            "message_id": next(self.harness.ids),
+            "date": int(time.time()),
+            "chat": {"id": self.user["id"], "type": "private", "first_name": self.user["first_name"]},
+            "from": self.user,
+            "text": text,
+        }}
+        if text.startswith("/"):
+            update["message"]["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        await self.harness.deliver(update, kind)
+
+    async def tap(self, message: dict, data: str):
+        self.tapped = message
+        await self.harness.deliver({"callback_query": {
+            "id": str(next(self.harness.ids)),
+            "from": self.user,
+            "chat_instance": str(self.user["id"]),
+            "message": message,
+            "data": data,
+        }}, "callback " + data.split("_")[0])
+
+    async def begin(self):
+        await self.send_text("/start", "command /start")
+        await self.send_text("🇺🇸 English" if self.language == "en" else "🇷🇺 Русский", "language")
+
+    async def act(self):
+        last = self.harness.bot.last.get(self.user["id"])
+        if last is self.tapped:
+            # The bot did not answer the last tap; stop pressing that keyboard
+            last = None
+        rows = (last or {}).get("reply_markup", {}).get("inline_keyboard")
+        if rows is not None:
+            buttons = [button["callback_data"] for row in rows for button in row]
+            if not buttons:
+                # Every slot of the day is taken: leave the flow and start over
+                await self.send_text("/cancel", "command /cancel")
+                await self.begin()
+            elif "confirm_yes" in buttons:
+                await self.tap(last, "confirm_yes" if self.rng.random() < 0.85 else "confirm_no")
+            else:
+                await self.tap(last, self.rng.choice(buttons))
+            return
+        self.tapped = None
+        if self.rng.random() < 0.35:
+            question = self.rng.choice(QUESTIONS)
+            if self.rng.random() < args.fresh:
+                question += f" I'm asking for visit number {self.rng.randrange(1000)}."
+            await self.send_text(question, "question")
+        else:
+            key = self.rng.choices(MENU, MENU_WEIGHTS)[0]
+            await self.send_text(self.harness.translations.get(key, self.language), "menu " + key)
+
+    async def run(self):
+        await self.begin()
+        for _ in range(args.turns):
+            if args.think:
+                await asyncio.sleep(args.think / 1000)
+            await self.act()
+
+
+class Harness:
+    def __init__(self):
+        self.recorder = Recorder()
+        self.ids = itertools.count(1)
+        self.bot = RecordingBot(args.api_latency / 1000)
+        self.translations = Translations()
+        self.anna = AnnaTelegramBot()
+        self.llm = FakeGemini(latency=args.llm_latency / 1000, services=self.anna.beauty_bot.catalog.names())
+        self.anna.beauty_bot.llm = self.llm
+        for name in HANDLERS:
+            setattr(self.anna, name, self.recorder.timed(name, getattr(self.anna, name)))
+        manager = self.anna.session_manager
+        manager.save_session = self.recorder.timed_sync("save_session (on the loop)", manager.save_session)
+        for name in ("save", "save_all"):
+            setattr(manager.store, name, self.recorder.timed_sync(f"store.{name}", getattr(manager.store, name)))
+        self.application = self.anna.build_application(mode="polling", bot=self.bot)
+        self.errors = 0
+
+    async def deliver(self, data: dict, kind: str):
+        """Process one update the way the Application's update fetcher does, and time it."""
+        data["update_id"] = next(self.ids)
+        update = Update.de_json(data, self.bot)
+        started = time.perf_counter()
+        try:
+            await self.application.update_processor.process_update(
+                update, self.application.process_update(update)
+            )
+        except Exception:
+            self.errors += 1
+        self.recorder.latencies["update: " + kind].append(time.perf_counter() - started)
+
+    async def run(self, users: int) -> float:
+        await self.application.initialize()
+        await self.anna.post_init(self.application)
+        started = time.perf_counter()
+        await asyncio.gather(*(SimulatedUser(100000 + i, self).run() for i in range(users)))
+        elapsed = time.perf_counter() - started
+        await self.anna.post_shutdown(self.application)
+        await self.application.shutdown()
+        return elapsed
+
+
+async def main():
+    harness = Harness()
+    elapsed = await harness.run(args.users)
+    recorder = harness.recorder
+    updates = sum(len(v) for k, v in recorder.latencies.items() if k.startswith("update: "))
+
+    print(f"{args.users} users, {updates} updates in {elapsed:.2f}s ({updates / elapsed:.0f} updates/s), "
+          f"{harness.errors} failed; LLM latency {args.llm_latency:.0f} ms, Bot API {args.api_latency:.0f} ms")
+    recorder.report("handler", HANDLERS)
+    recorder.report("update, end to end", sorted(k for k in recorder.latencies if k.startswith("update: ")))
+    recorder.report("session persistence",
+                    ["save_session (on the loop)", "store.save", "store.save_all"])
+
+    manager = harness.anna.session_manager
+    booked = sum(1 for _ in manager.iter_booked())
+    print(f"\nflush stats: {manager.flush_stats}, {len(manager.sessions)} sessions, {booked} appointments")
+    print(f"Bot API calls: {dict(harness.bot.calls.most_common())}")
+    print(f"LLM calls: {harness.llm.calls} "
+          f"(the rest of the questions were answered from the caches)")
+    print(f"outbound queue: {harness.anna.outbound.stats()}")
+    print(f"keyboard cache: {harness.anna.keyboards.stats()}")
+    if args.metrics:
+        print("\n" + REGISTRY.render(), end="")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,140 @@
+"""
+Drive the booking callbacks of many users concurrently through
+PerUserUpdateProcessor and check that nothing was double-booked or mixed
+up between sessions, then compare throughput with one update at a time.
+
+    python scripts/stress_booking.py [users] [latency_ms]
+
+Each user taps service -> date -> time -> confirm, with a duplicate
+confirm and a late time change interleaved, and everyone competes for the
+same few slots. Telegram calls are replaced by sleeps of `latency_ms`.
+"""
+import asyncio
+import os
+import random
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from core.availability import SlotAvailability  # noqa: E402
+from core.catalog import DEFAULT_SERVICES, ServiceCatalog  # noqa: E402
+from core.concurrency import PerUserUpdateProcessor  # noqa: E402
+from core.keyboards import KeyboardCache  # noqa: E402
+from core.outbound import OutboundQueue  # noqa: E402
+from core.reminders import ReminderScheduler  # noqa: E402
+from core.sessions import SessionManager  # noqa: E402
+from core.telegram_bot import AnnaTelegramBot, Translations  # noqa: E402
+
+SLOTS = ["09:00", "10:00", "11:00", "12:00", "13:00"]
+
+
+class NullStore:
+    incremental = True
+
+    def load_all(self):
+        return {}
+
+    def load_booked(self, since):
+        return {}
+
+    def load(self, user_id):
+        return None
+
+    def save(self, data):
+        pass
+
+    def save_all(self, sessions):
+        pass
+
+
+class FakeQuery:
+    def __init__(self, user_id: int, data: str, latency: float):
+        self.data = data
+        self.latency = latency
+        self.message = SimpleNamespace(chat_id=user_id, reply_text=self._call)
+
+    async def _call(self, *args, **kwargs):
+        await asyncio.sleep(self.latency)
+
+    answer = _call
+    edit_message_text = _call
+
+
+def make_bot(latency: float) -> AnnaTelegramBot:
+    # Everything handle_booking_callback needs, without Telegram or the LLM
+    bot = AnnaTelegramBot.__new__(AnnaTelegramBot)
+    bot.beauty_bot = SimpleNamespace(catalog=ServiceCatalog(DEFAULT_SERVICES))
+    bot.session_manager = SessionManager(store=NullStore(), write_behind=False)
+    bot.translations = Translations()
+    bot.time_slots = SLOTS
+    bot.availability = SlotAvailability(SLOTS, capacity=1, overrides={})
+    bot.reminders = ReminderScheduler()
+    bot.outbound = OutboundQueue(global_rate=1e6, chat_rate=1e6, chat_burst=100)
+    bot.keyboards = KeyboardCache(bot.beauty_bot.catalog, bot.availability)
+    return bot
+
+
+def script(user_id: int, day: str, rng: random.Random):
+    first, second = rng.sample(SLOTS, 2)
+    service = rng.choice(DEFAULT_SERVICES)["id"]
+    taps = [f"service_{service}", f"date_{day}", f"time_{first}", "confirm_yes", "confirm_yes"]
+    # Half of the users change their mind and book a second slot
+    if rng.random() < 0.5:
+        taps += [f"service_{service}", f"date_{day}", f"time_{second}", "confirm_yes"]
+    return taps
+
+
+async def run(users: int, latency: float, ceiling: int):
+    bot = make_bot(latency)
+    bot.outbound.start(SimpleNamespace())
+    processor = PerUserUpdateProcessor(ceiling)
+    day = (datetime.now() + timedelta(days=1)).strftime("%Y-%m-%d")
+    rng = random.Random(0)
+
+    async def tap(user_id: int, data: str):
+        update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=user_id, first_name=f"User{user_id}"),
+            callback_query=FakeQuery(user_id, data, latency)
+        )
+        await processor.process_update(update, bot.handle_booking_callback(update, None))
+
+    # Every tap is its own task, as with concurrent_updates, in arrival order per user
+    scripts = {user_id: script(user_id, day, rng) for user_id in range(1, users + 1)}
+    tasks = []
+    started = time.perf_counter()
+    for step in range(max(len(s) for s in scripts.values())):
+        for user_id, taps in scripts.items():
+            if step < len(taps):
+                tasks.append(asyncio.create_task(tap(user_id, taps[step])))
+        await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    await bot.outbound.stop()
+
+    booked = Counter()
+    for user_id, appointment in bot.session_manager.iter_booked():
+        booked[appointment.time.strftime("%H:%M")] += 1
+        session = bot.session_manager.get_session(user_id)
+        assert session.user_id == user_id
+        assert len({a.key for a in session.appointments}) == len(session.appointments), "duplicate booking"
+    assert all(count <= 1 for count in booked.values()), f"slot double-booked: {booked}"
+    free = set(bot.availability.free_slots(datetime.strptime(day, "%Y-%m-%d")))
+    assert free == set(SLOTS) - set(booked), "availability out of sync with appointments"
+    return len(tasks), elapsed, sum(booked.values())
+
+
+async def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 20) / 1000
+    for ceiling in (1, 32):
+        updates, elapsed, booked = await run(users, latency, ceiling)
+        print(f"ceiling {ceiling:>2}: {updates} updates from {users} users in {elapsed:.2f}s "
+              f"({updates / elapsed:.0f}/s), {booked} slots booked, no conflicts")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
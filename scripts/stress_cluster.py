@@ -0,0 +1,125 @@
+"""
+Offline checks for cluster mode on one box:
+
+1. Several processes race to book the same slots through
+   SharedSlotAvailability on one SQLite file; no slot may end up over
+   capacity.
+2. The coordinator forwards synthetic updates to stub workers; every user
+   must always land on the same worker, and a missing worker must yield 503.
+
+    python scripts/stress_cluster.py [processes] [attempts]
+"""
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+from collections import defaultdict
+from datetime import date, timedelta
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.availability import SharedSlotAvailability  # noqa: E402
+from core.cluster import Coordinator, WorkerPool, shard_of  # noqa: E402
+from core.session_store import SqliteSessionStore  # noqa: E402
+from core.webhook import SECRET_HEADER  # noqa: E402
+from fake_telegram import message_update  # noqa: E402
+
+SLOTS = ["09:00", "10:00", "11:00", "12:00", "13:00"]
+CAPACITY = 2
+DAY = date.today() + timedelta(days=1)
+SECRET = "stress-secret"
+
+
+def book(url: str, attempts: int, seed: int, results):
+    availability = SharedSlotAvailability(SqliteSessionStore(url), SLOTS, capacity=CAPACITY, overrides={})
+    rng = random.Random(seed)
+    won = 0
+    for _ in range(attempts):
+        slot = availability.slot_times[rng.randrange(len(SLOTS))]
+        if availability.try_reserve(DAY, slot):
+            won += 1
+            # Sometimes cancel again, so places are freed and fought over once more
+            if rng.random() < 0.3:
+                availability.release(DAY, slot)
+                won -= 1
+    results.put(won)
+
+
+def check_slot_cas(processes: int, attempts: int):
+    url = f"sqlite:///{tempfile.mkdtemp()}/cluster.db"
+    SqliteSessionStore(url)
+    results = multiprocessing.Queue()
+    workers = [
+        multiprocessing.Process(target=book, args=(url, attempts, seed, results))
+        for seed in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    won = sum(results.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+
+    availability = SharedSlotAvailability(SqliteSessionStore(url), SLOTS, capacity=CAPACITY, overrides={})
+    booked = SqliteSessionStore(url).slot_bookings(availability._keys(DAY, availability.slot_times[0])[0])
+    assert all(count <= CAPACITY for count in booked.values()), f"slot over capacity: {booked}"
+    assert sum(booked.values()) == won, f"{won} reservations held but {sum(booked.values())} recorded"
+    print(f"slot CAS: {processes} processes x {attempts} attempts, {won} places held, "
+          f"per slot {dict(sorted(booked.items()))} (capacity {CAPACITY})")
+
+
+async def check_routing(workers: int, users: int, updates: int, base_port: int = 18181):
+    seen = defaultdict(set)
+    runners = []
+    # Stub workers for all but the last index, which stays down on purpose
+    for index in range(workers - 1):
+        async def receive(request, index=index):
+            data = await request.json()
+            seen[index].add(data["message"]["from"]["id"])
+            return web.Response()
+        app = web.Application()
+        app.router.add_post("/telegram", receive)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", base_port + index).start()
+        runners.append(runner)
+
+    coordinator = Coordinator(WorkerPool(workers, base_port), secret_token=SECRET,
+                              listen="127.0.0.1", port=base_port - 1)
+    await coordinator.start()
+    statuses = defaultdict(int)
+    async with aiohttp.ClientSession() as session:
+        for update_id in range(updates):
+            user_id = 1000 + update_id % users
+            async with session.post(
+                f"http://127.0.0.1:{base_port - 1}/telegram",
+                json=message_update(update_id, user_id, "hi"), headers={SECRET_HEADER: SECRET}
+            ) as response:
+                statuses[(shard_of(user_id, workers), response.status)] += 1
+    await coordinator.stop()
+    for runner in runners:
+        await runner.cleanup()
+
+    for index, user_ids in seen.items():
+        assert all(shard_of(u, workers) == index for u in user_ids), f"worker {index} got foreign users"
+    assert all(status == 503 for (index, status) in statuses if index == workers - 1)
+    assert all(status == 200 for (index, status) in statuses if index != workers - 1)
+    print(f"routing: {updates} updates from {users} users over {workers} workers, "
+          f"users per worker {[len(seen[i]) for i in range(workers)]}, "
+          f"down worker answered 503 for {sum(n for (i, s), n in statuses.items() if s == 503)} updates")
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    attempts = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    check_slot_cas(processes, attempts)
+    asyncio.run(check_routing(workers=4, users=40, updates=400))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Webhook mode end to end without a network: runs AnnaTelegramBot through
+serve_webhook in this process, with a recording Bot answering the Bot API
+(getMe included) and a fake chat model for Gemini, and posts
+fake_telegram's synthetic updates to it over local HTTP.
+
+    python scripts/webhook_offline.py [--updates 200] [--users 20] [--concurrency 20]
+                                      [--queue 1000] [--llm-latency 200] [--api-latency 30]
+
+Reports what fake_telegram reports, plus what reached the Bot API. Sessions
+are written to a scratch directory.
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--updates", type=int, default=200)
+parser.add_argument("--users", type=int, default=20)
+parser.add_argument("--concurrency", type=int, default=20)
+parser.add_argument("--queue", type=int, default=1000, help="WEBHOOK_QUEUE_SIZE; small values show backpressure")
+parser.add_argument("--llm-latency", type=float, default=200, help="ms per fake LLM reply")
+parser.add_argument("--api-latency", type=float, default=30, help="ms per Bot API call")
+args = parser.parse_args()
+
+with socket.socket() as probe:
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+
+# The webhook and the store are configured from the environment when core is imported
+scratch = tempfile.mkdtemp()
+os.environ.update(
+    WEBHOOK_LISTEN="127.0.0.1",
+    WEBHOOK_PORT=str(port),
+    WEBHOOK_SECRET="offline-secret",
+    WEBHOOK_URL="",
+    WEBHOOK_QUEUE_SIZE=str(args.queue),
+    SESSION_BACKEND="json",
+    SESSION_FILE=os.path.join(scratch, "user_sessions.json"),
+    METRICS_PORT="0",
+)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+import aiohttp  # noqa: E402
+
+from core.constants import WEBHOOK_PATH, WEBHOOK_SECRET  # noqa: E402
+from core.telegram_bot import AnnaTelegramBot  # noqa: E402
+from core.webhook import serve_webhook  # noqa: E402
+from fake_telegram import drive, report  # noqa: E402
+from fakes import FakeGemini, RecordingBot  # noqa: E402
+
+
+async def health(url: str, timeout: float = 30.0) -> dict:
+    """GET /health once the server answers it."""
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while True:
+            try:
+                async with session.get(url) as response:
+                    return await response.json()
+            except aiohttp.ClientConnectionError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def main():
+    anna = AnnaTelegramBot()
+    anna.beauty_bot.llm = FakeGemini(latency=args.llm_latency / 1000,
+                                     services=anna.beauty_bot.catalog.names())
+    bot = RecordingBot(args.api_latency / 1000)
+    application = anna.build_application(mode="webhook", bot=bot)
+
+    stop = asyncio.Event()
+    serving = asyncio.create_task(
+        serve_webhook(application, anna.post_init, anna.post_shutdown, url="", stop=stop)
+    )
+    base = f"http://127.0.0.1:{port}"
+    await health(base + "/health")
+    run = await drive(base + WEBHOOK_PATH, WEBHOOK_SECRET, args.updates, args.users, args.concurrency)
+    # Accepted is not handled yet: wait until no update is queued or running and the replies are out
+    while (application.update_queue.qsize() or len(application.update_processor.locks)
+           or anna.outbound.stats()["depth"]):
+        await asyncio.sleep(0.1)
+    stop.set()
+    await serving
+
+    report(run)
+    print(f"Bot API calls: {dict(bot.calls.most_common())}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())